@@ -0,0 +1,73 @@
+"""
+Round trip latency of the Client over DEALER/ROUTER to one server, published as a ServiceAddress
+and reached from each locality: from its own ZMQ context, where addressing picks inproc, from
+another context, which looks like another process on the same host and gets ipc, and as a remote
+peer, which gets tcp. The server runs on a thread of the benchmark process in all three cases,
+so that only the transport chosen by addressing differs.
+"""
+import socket
+import threading
+import time
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.transport.zmq import addressing
+from free_range.transport.zmq.addressing import ServiceAddress
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+CALLS = 10000
+MESSAGE = {'name': 'John Doe', 'id': 1234, 'email': 'jdoe@example.com'}
+
+
+def time_calls(context, address):
+    """
+    :return: the time per call, in microseconds
+    """
+    client = Client(DealerTransport(context, {'echo': address}))
+    try:
+        client.request('echo', MESSAGE)  # wait for the connection
+        started = time.perf_counter()
+        for _ in range(CALLS):
+            client.request('echo', MESSAGE)
+        return (time.perf_counter() - started) / CALLS * 1e6
+    finally:
+        client.close()
+
+
+def main():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    context = zmq.Context()
+    other_context = zmq.Context()
+    address = ServiceAddress.local(context, 'addressing-bench', port)
+    remote = ServiceAddress(address.name, address.host, port)  # no host or process identity
+    server = RouterServer(context, address, lambda message: message)
+    stopped = threading.Event()
+
+    def serve():
+        while not stopped.is_set():
+            server.process(10)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        print(f'Round trip cost per call by locality, {CALLS} sequential calls')
+        for name, client_context, client_address in (
+                ('same process', context, address),
+                ('same host', other_context, address),
+                ('remote', other_context, remote)):
+            transport = addressing.candidate_endpoints(client_address, client_context)[0]
+            micros = time_calls(client_context, client_address)
+            print(f'    {name:<14} {transport.split(":")[0]:<8} {micros:10.2f} us')
+    finally:
+        stopped.set()
+        thread.join()
+        server.close()
+        other_context.term()
+        context.term()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Cost of fanning out small requests to one service: one message per request against batches
+sent with Client.request_batch_async(), with a trivial echo server in a separate process.
+"""
+import multiprocessing
+import time
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+ENDPOINT = 'ipc:///tmp/free-range-bench-batch'
+FAN_OUT = 200
+ROUNDS = 100
+
+
+def echo(message):
+    return message
+
+
+def serve(stopped):
+    context = zmq.Context()
+    server = RouterServer(context, ENDPOINT, echo)
+    while not stopped.is_set():
+        server.process(10)
+    server.close()
+    context.term()
+
+
+def fan_out_micros(client, send):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for request_id in send():
+            client.wait_for_response(request_id)
+    return (time.perf_counter() - started) / ROUNDS * 1e6
+
+
+def main():
+    stopped = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(stopped,))
+    process.start()
+    context = zmq.Context()
+    client = Client(DealerTransport(context, {'echo': ENDPOINT}))
+    try:
+        client.request('echo', 0)  # wait for the connection before timing
+        messages = list(range(FAN_OUT))
+        single = fan_out_micros(client, lambda: [client.request_async('echo', message)
+                                                 for message in messages])
+        batched = fan_out_micros(client, lambda: client.request_batch_async('echo', messages))
+    finally:
+        client.close()
+        stopped.set()
+        process.join()
+        context.term()
+    print(f'Fan-out of {FAN_OUT} small requests over ipc, per fan-out')
+    print(f'    one message per request  {single:10.1f} us')
+    print(f'    one batch                {batched:10.1f} us  ({single / batched:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
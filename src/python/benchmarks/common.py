@@ -0,0 +1,42 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import timeit
+import tracemalloc
+
+
+def time_per_call(func, number=100000, repeat=5):
+    """
+    :param func: a no-argument callable to time
+    :param number: the number of calls per measurement
+    :param repeat: the number of measurements. The best one is reported.
+    :return: the best observed time per call, in nanoseconds
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def bytes_per_object(factory, count=100000):
+    """
+    :param factory: a no-argument callable producing one object
+    :param count: the number of objects to keep alive while measuring
+    :return: the traced heap growth per retained object, in bytes
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        retained = [factory() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    # the list itself holds one pointer per object
+    return (after - before) / len(retained) - 8
+
+
+def report(title, rows):
+    """
+    Prints a simple aligned table of (name, value, unit) rows.
+    """
+    print(title)
+    width = max(len(name) for name, _, _ in rows)
+    for name, value, unit in rows:
+        print(f'    {name:<{width}}  {value:10.1f} {unit}')
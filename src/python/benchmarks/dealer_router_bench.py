@@ -0,0 +1,121 @@
+"""
+Compares request/response throughput of lockstep REQ/REP against the pipelined DEALER/ROUTER
+transport, over one connection, with a trivial echo server in a separate process.
+Pipelined runs keep up to WINDOW requests in flight: beyond the socket high-water mark ZMQ
+would start dropping replies.
+"""
+import multiprocessing
+import pickle
+import time
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+REQUESTS = 20000
+WINDOW = 500
+
+
+def echo(message):
+    return message
+
+
+def serve_rep(endpoint, stopped):
+    context = zmq.Context()
+    replier = context.socket(zmq.REP)
+    replier.bind(endpoint)
+    while not stopped.is_set():
+        if replier.poll(10):
+            replier.send(replier.recv())
+    replier.close(linger=0)
+    context.term()
+
+
+def serve_router(endpoint, stopped):
+    context = zmq.Context()
+    server = RouterServer(context, endpoint, echo)
+    while not stopped.is_set():
+        server.process(10)
+    server.close()
+    context.term()
+
+
+def with_server(serve, endpoint, run):
+    stopped = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(endpoint, stopped))
+    process.start()
+    context = zmq.Context()
+    try:
+        return run(context)
+    finally:
+        stopped.set()
+        process.join()
+        context.term()
+
+
+def req_rep_throughput(context, endpoint):
+    requester = context.socket(zmq.REQ)
+    requester.connect(endpoint)
+    requester.send(b'x')  # wait for the connection before timing
+    requester.recv()
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        requester.send(b'x')
+        requester.recv()
+    elapsed = time.perf_counter() - started
+    requester.close(linger=0)
+    return REQUESTS / elapsed
+
+
+def raw_dealer_throughput(context, endpoint):
+    dealer = context.socket(zmq.DEALER)
+    dealer.connect(endpoint)
+    request = [b'\0' * 8, pickle.dumps(b'x')]
+    dealer.send_multipart(request)  # wait for the connection before timing
+    dealer.recv_multipart()
+    started = time.perf_counter()
+    sent = received = 0
+    while received < REQUESTS:
+        while sent < REQUESTS and sent - received < WINDOW:
+            dealer.send_multipart(request)
+            sent += 1
+        dealer.recv_multipart()
+        received += 1
+    elapsed = time.perf_counter() - started
+    dealer.close(linger=0)
+    return REQUESTS / elapsed
+
+
+def dealer_router_throughput(context, endpoint):
+    client = Client(DealerTransport(context, {'echo': endpoint}))
+    client.request('echo', b'x')  # wait for the connection before timing
+    started = time.perf_counter()
+    sent = 0
+    while sent < REQUESTS or client.pending_count:
+        while sent < REQUESTS and client.pending_count < WINDOW:
+            client.request_async('echo', b'x')
+            sent += 1
+        client.poll_responses(10)
+    elapsed = time.perf_counter() - started
+    client.close()
+    return REQUESTS / elapsed
+
+
+def main():
+    print(f'Throughput over one connection, {REQUESTS} requests, window of {WINDOW}')
+    for name, endpoint in (('ipc', 'ipc:///tmp/free-range-bench-dealer'),
+                           ('tcp', 'tcp://127.0.0.1:5581')):
+        rate = with_server(serve_rep, endpoint,
+                           lambda context: req_rep_throughput(context, endpoint))
+        print(f'    {name:<4} REQ/REP (raw sockets)   {rate:10.0f} req/s')
+        rate = with_server(serve_router, endpoint,
+                           lambda context: raw_dealer_throughput(context, endpoint))
+        print(f'    {name:<4} DEALER (raw socket)     {rate:10.0f} req/s')
+        rate = with_server(serve_router, endpoint,
+                           lambda context: dealer_router_throughput(context, endpoint))
+        print(f'    {name:<4} DEALER/ROUTER (Client)  {rate:10.0f} req/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Encode, decode and routing cost of the fixed-layout binary envelope against a protobuf message
+with the same fields. The protobuf message type is built at runtime from a descriptor, so no
+generated code is needed. Routing on protobuf means parsing the whole message to read to_id.
+"""
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+from benchmarks.common import report, time_per_call
+from free_range.core.common.types import ResponseState
+from free_range.core.messages.envelope import Envelope, MessageMode, peek_header
+
+_UINT32 = descriptor_pb2.FieldDescriptorProto.TYPE_UINT32
+_UINT64 = descriptor_pb2.FieldDescriptorProto.TYPE_UINT64
+_BYTES = descriptor_pb2.FieldDescriptorProto.TYPE_BYTES
+_FIELDS = (('version', _UINT32), ('mode', _UINT32), ('state', _UINT32), ('type_id', _UINT32),
+           ('to_id', _UINT32), ('from_id', _UINT32), ('request_id', _UINT64), ('meta', _BYTES),
+           ('pass_through', _BYTES), ('control_headers', _BYTES), ('tracing', _BYTES))
+
+
+def protobuf_envelope_class():
+    file_proto = descriptor_pb2.FileDescriptorProto(name='bench_envelope.proto',
+                                                    package='bench', syntax='proto3')
+    message_proto = file_proto.message_type.add(name='Envelope')
+    for number, (name, field_type) in enumerate(_FIELDS, 1):
+        message_proto.field.add(name=name, number=number, type=field_type,
+                                label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName('bench.Envelope')
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)  # protobuf before 4.21
+
+
+def main():
+    fields = dict(mode=MessageMode.REPLY, to_id=7, from_id=70000, request_id=123456, type_id=12,
+                  state=ResponseState.OK, meta=b'content-type=person', tracing=b'\x01' * 16)
+    envelope = Envelope(**fields)
+    encoded = envelope.encode()
+    ProtobufEnvelope = protobuf_envelope_class()
+    proto = ProtobufEnvelope(version=1, **{name: int(value) if isinstance(value, int) else value
+                                           for name, value in fields.items()})
+    proto_encoded = proto.SerializeToString()
+
+    def proto_route():
+        parsed = ProtobufEnvelope()
+        parsed.ParseFromString(proto_encoded)
+        return parsed.to_id
+
+    report('Envelope cost per call', [
+        ('binary encode', time_per_call(envelope.encode), 'ns'),
+        ('protobuf encode', time_per_call(proto.SerializeToString), 'ns'),
+        ('binary decode', time_per_call(lambda: Envelope.decode(encoded)), 'ns'),
+        ('protobuf decode', time_per_call(lambda: ProtobufEnvelope.FromString(proto_encoded)),
+         'ns'),
+        ('binary route (peek_header)', time_per_call(lambda: peek_header(encoded)[5]), 'ns'),
+        ('protobuf route (full parse)', time_per_call(proto_route), 'ns'),
+    ])
+    report('Encoded size', [('binary', len(encoded), 'B'), ('protobuf', len(proto_encoded), 'B')])
+
+
+if __name__ == '__main__':
+    main()
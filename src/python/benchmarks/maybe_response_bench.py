@@ -0,0 +1,48 @@
+"""
+Measures the memory footprint and the construction and checking cost of MaybeResponse objects.
+The error-path rows compare checking a failed interaction via the raising response property
+against branching on try_response().
+"""
+from free_range.core.common.exceptions import FreeRangeError
+from free_range.core.common.types import (
+    IncompleteResponse, NormalResponse, RemoteErrorResponse, ResponseState,
+)
+from benchmarks.common import bytes_per_object, report, time_per_call
+
+
+def check_by_raising(maybe):
+    try:
+        return maybe.response
+    except FreeRangeError:
+        return None
+
+
+def check_by_state(maybe):
+    state, value = maybe.try_response()
+    return value if state is ResponseState.OK else None
+
+
+def main():
+    report('Memory per retained object', [
+        ('NormalResponse', bytes_per_object(lambda: NormalResponse('r', 10, 12, 1)), 'bytes'),
+        ('RemoteErrorResponse',
+         bytes_per_object(lambda: RemoteErrorResponse('e', 1, 10, 12)), 'bytes'),
+        ('IncompleteResponse', bytes_per_object(lambda: IncompleteResponse(1, 10)), 'bytes'),
+    ])
+    report('Time per operation', [
+        ('construct NormalResponse', time_per_call(lambda: NormalResponse('r', 10, 12, 1)), 'ns'),
+        ('construct + is_valid()',
+         time_per_call(lambda: NormalResponse('r', 10, 12, 1).is_valid()), 'ns'),
+        ('construct + response (ok)',
+         time_per_call(lambda: check_by_raising(NormalResponse('r', 10, 12, 1))), 'ns'),
+        ('construct + response (error)',
+         time_per_call(lambda: check_by_raising(RemoteErrorResponse('e', 1, 10, 12))), 'ns'),
+        ('construct + try_response() (ok)',
+         time_per_call(lambda: check_by_state(NormalResponse('r', 10, 12, 1))), 'ns'),
+        ('construct + try_response() (error)',
+         time_per_call(lambda: check_by_state(RemoteErrorResponse('e', 1, 10, 12))), 'ns'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
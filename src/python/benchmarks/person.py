@@ -0,0 +1,56 @@
+"""
+The tutorial.Person message of scratchpad/protobuf/addressbook.proto, for codec benchmarks.
+The message class is built from a descriptor at import time, since the generated module in the
+scratchpad predates the protobuf versions in use.
+"""
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+_FIELD = descriptor_pb2.FieldDescriptorProto
+
+
+def _build_person_class():
+    file_proto = descriptor_pb2.FileDescriptorProto(name='benchmarks/addressbook.proto',
+                                                    package='tutorial', syntax='proto3')
+    person = file_proto.message_type.add(name='Person')
+    person.field.add(name='name', number=1, type=_FIELD.TYPE_STRING, label=_FIELD.LABEL_OPTIONAL)
+    person.field.add(name='id', number=2, type=_FIELD.TYPE_INT32, label=_FIELD.LABEL_OPTIONAL)
+    person.field.add(name='email', number=3, type=_FIELD.TYPE_STRING,
+                     label=_FIELD.LABEL_OPTIONAL)
+    person.field.add(name='phones', number=4, type=_FIELD.TYPE_MESSAGE,
+                     label=_FIELD.LABEL_REPEATED, type_name='.tutorial.Person.PhoneNumber')
+    phone_type = person.enum_type.add(name='PhoneType')
+    for number, name in enumerate(('MOBILE', 'HOME', 'WORK')):
+        phone_type.value.add(name=name, number=number)
+    phone_number = person.nested_type.add(name='PhoneNumber')
+    phone_number.field.add(name='number', number=1, type=_FIELD.TYPE_STRING,
+                           label=_FIELD.LABEL_OPTIONAL)
+    phone_number.field.add(name='type', number=2, type=_FIELD.TYPE_ENUM,
+                           label=_FIELD.LABEL_OPTIONAL, type_name='.tutorial.Person.PhoneType')
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName('tutorial.Person')
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)  # protobuf before 4.21
+
+
+Person = _build_person_class()
+
+
+def person():
+    """
+    :return: a Person with every field set and two phone numbers
+    """
+    message = Person(name='Joe Protobuf', id=1234, email='joe.protobuf@example.com')
+    message.phones.add(number='123-456-7890', type=0)
+    message.phones.add(number='098-765-4321', type=2)
+    return message
+
+
+def person_dict():
+    """
+    :return: the same person as a dict, for the codecs of plain Python objects
+    """
+    return {'name': 'Joe Protobuf', 'id': 1234, 'email': 'joe.protobuf@example.com',
+            'phones': [{'number': '123-456-7890', 'type': 0},
+                       {'number': '098-765-4321', 'type': 2}]}
@@ -0,0 +1,398 @@
+"""
+The benchmark suite: a fixed set of hot path measurements, written as JSON and optionally
+compared against a baseline from an earlier run, so that regressions show up before a release.
+
+    PYTHONPATH=distributable python -m benchmarks.suite --output results.json
+    PYTHONPATH=distributable python -m benchmarks.suite --baseline results.json
+
+Every result is a time, so lower is better. A result slower than its baseline by more than the
+threshold of its area is reported as a regression, and makes the run exit with status 1. Every
+case reports the best of several repeats, which filters out most of the noise of a busy machine.
+A shared machine also changes speed from one run to the next, so every case is preceded by a
+short pure Python calibration loop, and a result only regresses if it is slower both in
+absolute terms and relative to its calibration.
+A regressed case is run again, up to --confirm times, and keeps its best result, so that only
+regressions that reproduce fail the run.
+Round trips over sockets depend on thread scheduling and stay much noisier than in-process
+cases: their area has a looser threshold, and is advisory, reported without failing the run.
+--threshold sets one threshold for all areas, and --strict makes every area fail the run.
+Baselines are only comparable on the same machine.
+Areas can be selected with --area: responses, codecs, transports and control_loop.
+"""
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.core.common.types import NormalResponse, RemoteErrorResponse
+from free_range.core.control_loop import ControlLoop
+from free_range.core.messages.codecs import CodecRegistry, JsonCodec, PickleCodec
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+from benchmarks.common import time_per_call
+from benchmarks.person import Person, person, person_dict
+
+DEFAULT_THRESHOLD = 0.1
+AREA_THRESHOLDS = {'codecs': 0.25, 'control_loop': 0.25, 'transports': 0.5}
+ADVISORY_AREAS = {'transports'}
+DEFAULT_CONFIRM = 3
+SOCKET_REPEATS = 3
+ENDPOINTS = {'inproc': 'inproc://free-range-suite',
+             'ipc': 'ipc:///tmp/free-range-suite',
+             'tcp': 'tcp://127.0.0.1:5591'}
+
+_cases = []
+
+
+def case(area, name, unit):
+    """
+    Registers a benchmark function, which takes the scale factor of the run and returns a time.
+    """
+    def register(func):
+        _cases.append((area, name, unit, func))
+        return func
+    return register
+
+
+# MaybeResponse construction and validation
+
+@case('responses', 'NormalResponse construct', 'ns')
+def normal_response(scale):
+    return time_per_call(lambda: NormalResponse('r', 10, 12, 1), number=int(100000 * scale))
+
+
+@case('responses', 'NormalResponse construct + try_response', 'ns')
+def normal_try_response(scale):
+    return time_per_call(lambda: NormalResponse('r', 10, 12, 1).try_response(),
+                         number=int(100000 * scale))
+
+
+@case('responses', 'RemoteErrorResponse construct + try_response', 'ns')
+def remote_error_try_response(scale):
+    return time_per_call(lambda: RemoteErrorResponse('e', 1, 10, 12).try_response(),
+                         number=int(100000 * scale))
+
+
+# codecs on a Person message
+
+def _codecs():
+    registry = CodecRegistry()
+    registry.register_protobuf(1, Person)
+    return (('protobuf', registry.codec(1), person()),
+            ('json', JsonCodec(), person_dict()),
+            ('pickle', PickleCodec(), person_dict()))
+
+
+def _codec_case(name, index, decode):
+    def measure(scale):
+        _, codec, message = _codecs()[index]
+        if decode:
+            encoded = codec.encode(message)
+            return time_per_call(lambda: codec.decode(encoded), number=int(50000 * scale))
+        return time_per_call(lambda: codec.encode(message), number=int(50000 * scale))
+    case('codecs', f'{name} {"decode" if decode else "encode"} Person', 'ns')(measure)
+
+
+for _index, (_name, _, _) in enumerate(_codecs()):
+    _codec_case(_name, _index, False)
+    _codec_case(_name, _index, True)
+
+
+# round trips over ZMQ sockets
+
+def _echo_thread(socket, stopped):
+    """
+    Echoes every message received on a socket until stopped.
+    """
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    while not stopped.is_set():
+        if poller.poll(10):
+            socket.send_multipart(socket.recv_multipart(copy=False), copy=False)
+
+
+def _socket_pair(transport, client_type, server_type):
+    """
+    :return: a (client socket, stop function) tuple, with an echo server thread on the other end
+    """
+    context = zmq.Context()
+    server = context.socket(server_type)
+    server.bind(ENDPOINTS[transport])
+    client = context.socket(client_type)
+    client.connect(ENDPOINTS[transport])
+    stopped = threading.Event()
+    thread = threading.Thread(target=_echo_thread, args=(server, stopped))
+    thread.start()
+
+    def stop():
+        stopped.set()
+        thread.join()
+        client.close(linger=0)
+        server.close(linger=0)
+        context.term()
+    return client, stop
+
+
+def _round_trips(socket, count, window):
+    """
+    :return: the time per message, in microseconds, of count round trips with up to window
+        messages in flight
+    """
+    payload = b'x' * 64
+    socket.send(payload)
+    socket.recv()  # wait for the connection
+    started = time.perf_counter()
+    sent = received = 0
+    while received < count:
+        while sent < count and sent - received < window:
+            socket.send(payload)
+            sent += 1
+        socket.recv()
+        received += 1
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def _raw_case(transport, pattern, client_type, server_type, window):
+    def measure(scale):
+        socket, stop = _socket_pair(transport, client_type, server_type)
+        try:
+            return min(_round_trips(socket, int(5000 * scale), window)
+                       for _ in range(SOCKET_REPEATS))
+        finally:
+            stop()
+    kind = 'latency' if window == 1 else 'throughput'
+    case('transports', f'{pattern} {transport} {kind}', 'us/msg')(measure)
+
+
+def _dealer_case(transport, window):
+    def measure(scale):
+        context = zmq.Context()
+        server = RouterServer(context, ENDPOINTS[transport], lambda message: message)
+        stopped = threading.Event()
+        thread = threading.Thread(target=lambda: [server.process(10)
+                                                  for _ in iter(stopped.is_set, True)])
+        thread.start()
+        client = Client(DealerTransport(context, {'echo': ENDPOINTS[transport]}))
+        try:
+            client.request('echo', 0)  # wait for the connection
+            count = int(5000 * scale)
+            best = None
+            for _ in range(SOCKET_REPEATS):
+                started = time.perf_counter()
+                for first in range(0, count, window):
+                    request_ids = [client.request_async('echo', i)
+                                   for i in range(first, min(count, first + window))]
+                    for request_id in request_ids:
+                        client.wait_for_response(request_id)
+                elapsed = (time.perf_counter() - started) / count * 1e6
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+        finally:
+            stopped.set()
+            thread.join()
+            client.close()
+            server.close()
+            context.term()
+    kind = 'latency' if window == 1 else 'throughput'
+    case('transports', f'Client DEALER {transport} {kind}', 'us/msg')(measure)
+
+
+for _transport in ENDPOINTS:
+    _raw_case(_transport, 'PAIR', zmq.PAIR, zmq.PAIR, 1)
+    _raw_case(_transport, 'PAIR', zmq.PAIR, zmq.PAIR, 100)
+    _raw_case(_transport, 'REQ/REP', zmq.REQ, zmq.REP, 1)
+    _dealer_case(_transport, 1)
+    _dealer_case(_transport, 100)
+
+
+# control loop
+
+@case('control_loop', 'dispatch per message', 'us')
+def control_loop_dispatch(scale):
+    context = zmq.Context()
+    # every message is queued before the loop runs, so no high-water mark may block the sender
+    receiver = context.socket(zmq.PAIR)
+    receiver.setsockopt(zmq.RCVHWM, 0)
+    receiver.bind('inproc://free-range-suite-loop')
+    sender = context.socket(zmq.PAIR)
+    sender.setsockopt(zmq.SNDHWM, 0)
+    sender.connect('inproc://free-range-suite-loop')
+    loop = ControlLoop()
+    loop.register(receiver, lambda socket: socket.recv())
+    count = int(20000 * scale)
+    try:
+        for _ in range(count):
+            sender.send(b'x')
+        started = time.perf_counter()
+        handled = 0
+        while handled < count:
+            handled += loop.run_once(0)
+        return (time.perf_counter() - started) / count * 1e6
+    finally:
+        sender.close()
+        receiver.close()
+        context.term()
+
+
+@case('control_loop', 'timer scheduling and run', 'us')
+def control_loop_timers(scale):
+    loop = ControlLoop()
+    count = int(20000 * scale)
+    started = time.perf_counter()
+    for _ in range(count):
+        loop.call_later(0, int)
+    while loop.pending_timers:
+        loop.run_once(0)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def _calibration():
+    """
+    :return: the time per call of a fixed pure Python function, in nanoseconds, as a measure of
+        the current speed of the machine
+    """
+    def work():
+        total = 0
+        for i in range(100):
+            total += i * i
+        return total
+    return time_per_call(work, number=5000, repeat=5)
+
+
+def run(areas=None, scale=1.0, log=None, names=None):
+    """
+    :param areas: the areas to run, None for all
+    :param scale: a factor on the number of iterations of every case
+    :param log: a text stream to report progress to
+    :param names: the names of the results to run, None for all
+    :return: the results document
+    """
+    results = {}
+    for area, name, unit, func in _cases:
+        if areas and area not in areas:
+            continue
+        if names is not None and f'{area}/{name}' not in names:
+            continue
+        calibration = _calibration()
+        value = func(scale)
+        results[f'{area}/{name}'] = {'value': value, 'unit': unit, 'calibration': calibration}
+        if log is not None:
+            print(f'    {area + "/" + name:<56} {value:10.2f} {unit}', file=log)
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'zmq': zmq.zmq_version(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'results': results}
+
+
+def threshold_of(name, threshold=None):
+    """
+    :param name: a result name, prefixed with its area
+    :param threshold: a threshold overriding the ones of the areas, or None
+    :return: the relative slowdown from which the result is a regression
+    """
+    if threshold is not None:
+        return threshold
+    return AREA_THRESHOLDS.get(name.split('/', 1)[0], DEFAULT_THRESHOLD)
+
+
+def _calibrated(result):
+    return result['value'] / result['calibration'] if result.get('calibration') else result['value']
+
+
+def confirm(results, baseline, threshold=None, scale=1.0, times=DEFAULT_CONFIRM, log=None,
+            skip_areas=()):
+    """
+    Runs the regressed cases again, and keeps the better results, until no case regresses.
+    :param results: a results document, updated in place
+    :param baseline: an earlier results document
+    :param threshold: the threshold of every area, or None for the thresholds of the areas
+    :param scale: the scale of the run
+    :param times: the maximum number of runs of a regressed case
+    :param log: a text stream to report progress to
+    :param skip_areas: the areas whose regressions are not confirmed
+    """
+    for _ in range(times):
+        regressed = {name for name, *_, regressed in compare(results, baseline, threshold)
+                     if regressed and name.split('/', 1)[0] not in skip_areas}
+        if not regressed:
+            return
+        if log is not None:
+            print(f'Confirming {len(regressed)} regressions', file=log)
+        for name, result in run(scale=scale, log=log, names=regressed)['results'].items():
+            if _calibrated(result) < _calibrated(results['results'][name]):
+                results['results'][name] = result
+
+
+def compare(results, baseline, threshold=None):
+    """
+    :param results: a results document
+    :param baseline: an earlier results document
+    :param threshold: the relative slowdown from which a result is a regression, or None for
+        the threshold of its area
+    :return: a list of (name, baseline value, value, ratio, regressed) tuples, for the results
+        present in both documents. When both results have a calibration, the ratio is the lower
+        of the raw ratio and the ratio corrected by the calibrations.
+    """
+    comparison = []
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or before['unit'] != result['unit'] or not before['value']:
+            continue
+        ratio = result['value'] / before['value']
+        if result.get('calibration') and before.get('calibration'):
+            # a calibration is noisy too: a regression must show with and without it
+            ratio = min(ratio, ratio * before['calibration'] / result['calibration'])
+        comparison.append((name, before['value'], result['value'], ratio,
+                           ratio > 1 + threshold_of(name, threshold)))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--area', action='append', help='only run this area, repeatable')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='a factor on the number of iterations, e.g. 0.1 for a quick run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--confirm', type=int, default=DEFAULT_CONFIRM,
+                        help='the number of runs again of a regressed case, to confirm it')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail the run on regressions in advisory areas too')
+    parser.add_argument('--threshold', type=float,
+                        help='the relative slowdown reported as a regression in every area, '
+                             'instead of the thresholds of the areas')
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    results = run(args.area, args.scale, sys.stdout)
+    if baseline is not None:
+        confirm(results, baseline, args.threshold, args.scale, args.confirm, sys.stdout,
+                () if args.strict else ADVISORY_AREAS)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if baseline is None:
+        return 0
+    comparison = compare(results, baseline, args.threshold)
+    print(f'Against {args.baseline}')
+    failed = False
+    for name, before, after, ratio, regressed in comparison:
+        advisory = not args.strict and name.split('/', 1)[0] in ADVISORY_AREAS
+        failed = failed or (regressed and not advisory)
+        flag = ('  REGRESSION (advisory)' if advisory else '  REGRESSION') if regressed else ''
+        print(f'    {name:<56} {before:10.2f} -> {after:10.2f} ({ratio - 1:+.1%}, '
+              f'limit +{threshold_of(name, args.threshold):.0%}){flag}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
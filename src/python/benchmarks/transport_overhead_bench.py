@@ -0,0 +1,78 @@
+"""
+Per-call cost of a request/response round trip through the Client, over the in-process shim and
+over the DEALER/ROUTER transport on the inproc, ipc and tcp ZMQ transports, against a plain
+function call. Calls are made one at a time, so these are latencies, not throughputs.
+The ZMQ echo servers run on a thread of the benchmark process, which is the only way to use
+inproc, so that the transports differ only by the wire.
+"""
+import threading
+import time
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.transport.local.shim import LocalNetwork
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+CALLS = 10000
+MESSAGE = {'name': 'John Doe', 'id': 1234, 'email': 'jdoe@example.com'}
+
+
+def echo(message):
+    return message
+
+
+def time_calls(call):
+    call()  # warm up, and wait for the connection if there is one
+    started = time.perf_counter()
+    for _ in range(CALLS):
+        call()
+    return (time.perf_counter() - started) / CALLS * 1e6
+
+
+def function_call():
+    return time_calls(lambda: echo(MESSAGE))
+
+
+def local_call():
+    network = LocalNetwork()
+    network.register('echo', echo)
+    client = Client(network.transport())
+    return time_calls(lambda: client.request('echo', MESSAGE))
+
+
+def zmq_call(endpoint):
+    context = zmq.Context()
+    server = RouterServer(context, endpoint, echo)
+    stopped = threading.Event()
+
+    def serve():
+        while not stopped.is_set():
+            server.process(10)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    client = Client(DealerTransport(context, {'echo': endpoint}))
+    try:
+        return time_calls(lambda: client.request('echo', MESSAGE))
+    finally:
+        stopped.set()
+        thread.join()
+        client.close()
+        server.close()
+        context.term()
+
+
+def main():
+    rows = [('function call', function_call()),
+            ('Client + local shim', local_call()),
+            ('Client + DEALER inproc', zmq_call('inproc://free-range-bench-overhead')),
+            ('Client + DEALER ipc', zmq_call('ipc:///tmp/free-range-bench-overhead')),
+            ('Client + DEALER tcp', zmq_call('tcp://127.0.0.1:5582'))]
+    print(f'Round trip cost per call, {CALLS} sequential calls')
+    for name, micros in rows:
+        print(f'    {name:<24} {micros:10.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+An asyncio facade over the client library.
+"""
+import asyncio
+
+import zmq
+import zmq.asyncio
+
+from free_range.core.common.types import ResponseState
+
+
+class AsyncClient:
+    """
+    Exposes a Client to asyncio code. request() is a coroutine resolving to the usual
+    MaybeResponse types.
+    A single pump task per client drives Client.poll_responses() while requests are outstanding.
+    Between polls it awaits the transport sockets through one zmq.asyncio.Poller, bounded by the
+    next timeout deadline, so no thread ever blocks and there is no per-call polling loop.
+    Transports without sockets are polled every idle_poll_millis instead.
+    If polling fails, the exception is set on every outstanding future and their requests are
+    cancelled: the failure reaches the awaiting tasks instead of leaving them hanging.
+    """
+
+    def __init__(self, client, idle_poll_millis=1):
+        """
+        :param client: the Client to drive
+        :param idle_poll_millis: the polling interval for transports that expose no sockets
+        """
+        self._client = client
+        self._idle_poll_millis = idle_poll_millis
+        self._futures = {}
+        self._pump = None
+        self._poller = None
+        if client.transport.sockets:
+            self._poller = zmq.asyncio.Poller()
+            for socket in client.transport.sockets:
+                self._poller.register(socket, zmq.POLLIN)
+
+    @property
+    def client(self):
+        return self._client
+
+    async def request(self, destination, message, timeout=None):
+        """
+        Sends a request and waits for its response.
+        If the awaiting task is cancelled (for instance by asyncio.wait_for()), the request is
+        cancelled as well and completes with a TimeoutResponse.
+        :param destination: the name of the destination component
+        :param message: the request message
+        :param timeout: a TimeoutSpecification. Defaults to the client default timeout.
+        :return: the completed MaybeResponse
+        """
+        return await self.response_of(self._client.request_async(destination, message, timeout))
+
+    async def request_many(self, destination, messages, timeout=None):
+        """
+        Sends several requests and waits for all their responses. A failed or timed out request
+        does not affect the others.
+        :return: a list of MaybeResponse, in the order of the messages
+        """
+        request_ids = [self._client.request_async(destination, message, timeout)
+                       for message in messages]
+        return await self.gather(request_ids)
+
+    async def request_batch(self, destination, messages, timeout=None):
+        """
+        Sends several requests to the same destination in one transfer (see
+        Client.request_batch_async()) and waits for all their responses. A failed or timed out
+        request does not affect the others.
+        :return: a list of MaybeResponse, in the order of the messages
+        """
+        return await self.gather(self._client.request_batch_async(destination, messages, timeout))
+
+    async def gather(self, request_ids):
+        """
+        :param request_ids: request IDs returned by Client.request_async()
+        :return: a list of the completed MaybeResponse, in the order of the request IDs
+        """
+        return await asyncio.gather(*(self.response_of(request_id)
+                                      for request_id in request_ids))
+
+    def response_of(self, request_id):
+        """
+        :param request_id: a request ID returned by Client.request_async()
+        :return: an asyncio Future resolving to the completed MaybeResponse. Cancelling the future
+            cancels the request.
+        """
+        future = self._futures.get(request_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            response = self._client.check_response(request_id, poll=False)
+            if response.state is not ResponseState.INCOMPLETE:
+                future.set_result(response)  # completed right away, e.g. from a cache
+                return future
+            future.add_done_callback(lambda f: f.cancelled() and self.cancel(request_id))
+            self._futures[request_id] = future
+            self._ensure_pump()
+        return future
+
+    def cancel(self, request_id):
+        """
+        Cancels a request: it completes right away with a TimeoutResponse.
+        :param request_id: a request ID returned by Client.request_async()
+        :return: the TimeoutResponse, or None if the request was already completed
+        """
+        response = self._client.cancel(request_id)
+        future = self._futures.pop(request_id, None)
+        if response is not None:
+            self._client.check_response(request_id, poll=False)
+            if future is not None and not future.done():
+                future.set_result(response)
+        return response
+
+    def _ensure_pump(self):
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.get_running_loop().create_task(self._pump_responses())
+
+    async def _pump_responses(self):
+        try:
+            await self._pump_until_idle()
+        except Exception as ex:
+            self._fail_outstanding(ex)
+
+    async def _pump_until_idle(self):
+        client = self._client
+        futures = self._futures
+        while futures:
+            for request_id in client.poll_responses():
+                future = futures.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(client.check_response(request_id, poll=False))
+            if not futures:
+                break
+            timeout = client.millis_to_next_deadline()
+            if self._poller is not None:
+                await self._poller.poll(timeout)
+            else:
+                await asyncio.sleep(min(timeout, self._idle_poll_millis) / 1000.0)
+
+    def _fail_outstanding(self, exception):
+        futures, self._futures = self._futures, {}
+        for request_id, future in futures.items():
+            if not future.done():
+                future.set_exception(exception)
+            if self._client.cancel(request_id) is not None:
+                self._client.check_response(request_id, poll=False)
@@ -0,0 +1,202 @@
+"""
+A client-side cache of the responses to idempotent requests.
+Pure lookups are often sent many times a second with the same arguments. Their responses can be
+served from memory for a short while, and identical lookups sent while one is in flight can share
+its remote call instead of each making their own.
+"""
+import sys
+from collections import OrderedDict
+
+from free_range.core.messages.codecs import LazyMessage
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def response_size(response):
+    """
+    The default estimate of the memory held by a cached response: the received bytes of a
+    LazyMessage, the length of a bytes-like object, the shallow size of anything else.
+    """
+    if isinstance(response, LazyMessage):
+        return len(response.encoded)
+    if isinstance(response, (bytes, bytearray)):
+        return len(response)
+    if isinstance(response, memoryview):
+        return response.nbytes
+    return sys.getsizeof(response)
+
+
+class _Flight:
+    """
+    A remote call in flight for a cache key, and the requests waiting on it.
+    """
+    __slots__ = ('key', 'ttl_millis', 'followers')
+
+    def __init__(self, key, ttl_millis):
+        self.key = key
+        self.ttl_millis = ttl_millis
+        self.followers = []
+
+
+class ResponseCache:
+    """
+    Caches the responses of requests whose message type is marked idempotent, for use by a
+    Client. A request is identified by its destination, its message type ID and the canonical
+    serialization of its message (see CodecRegistry.canonical_dumps()).
+    Only normal responses are cached, each for the time to live of its request message type.
+    The cache is bounded by the estimated size of the cached responses: the least recently used
+    responses are evicted first, and a response larger than the whole cache is not cached.
+    While a request is in flight, identical requests do not make a remote call of their own but
+    follow it (single flight), and complete when it does.
+    Expired responses are only dropped when looked up or evicted.
+    """
+
+    def __init__(self, registry, max_bytes=DEFAULT_MAX_BYTES, size_of=response_size):
+        """
+        :param registry: the CodecRegistry that the request messages are serialized with
+        :param max_bytes: the maximum total size of the cached responses
+        :param size_of: a function estimating the size of a response, in bytes
+        """
+        self._registry = registry
+        self._max_bytes = max_bytes
+        self._size_of = size_of
+        self._ttls = {}  # type ID -> time to live in milliseconds
+        self._entries = OrderedDict()  # key -> (response, expiry, size), least recently used first
+        self._bytes = 0
+        self._flights_by_key = {}  # key -> request ID of the remote call in flight
+        self._flights = {}  # request ID -> _Flight
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """
+        :return: the estimated total size of the cached responses
+        """
+        return self._bytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def coalesced(self):
+        """
+        :return: the number of requests that followed an identical request in flight
+        """
+        return self._coalesced
+
+    @property
+    def evictions(self):
+        """
+        :return: the number of responses evicted to make room for others
+        """
+        return self._evictions
+
+    def mark_idempotent(self, type_id, ttl_millis):
+        """
+        Makes the responses to requests of a message type cacheable.
+        :param type_id: the message type ID, as registered in the CodecRegistry
+        :param ttl_millis: how long a response stays cached, in milliseconds
+        """
+        self._ttls[type_id] = ttl_millis
+
+    def key_of(self, destination, message):
+        """
+        :param destination: the destination of a request
+        :param message: the request message
+        :return: the cache key of the request, or None if its message type is not idempotent
+        """
+        type_id = self._registry.type_id_of(message)
+        if type_id not in self._ttls:
+            return None
+        return destination, type_id, bytes(self._registry.canonical_dumps(message))
+
+    def get(self, key, now):
+        """
+        :param key: a key returned by key_of()
+        :param now: the current timestamp
+        :return: the cached response, or None if there is none or it expired
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._remove(key)
+        self._misses += 1
+        return None
+
+    def follow(self, key, request_id):
+        """
+        Makes a request follow the identical request in flight, if there is one.
+        :param key: the cache key of the request
+        :param request_id: the request ID of the request
+        :return: True if the request follows a request in flight, and must not be sent
+        """
+        leader = self._flights_by_key.get(key)
+        if leader is None:
+            return False
+        self._flights[leader].followers.append(request_id)
+        self._coalesced += 1
+        return True
+
+    def lead(self, key, request_id):
+        """
+        Records that a request was sent for a key, so that identical requests follow it.
+        :param key: the cache key of the request
+        :param request_id: the request ID of the request sent
+        """
+        self._flights_by_key[key] = request_id
+        self._flights[request_id] = _Flight(key, self._ttls[key[1]])
+
+    def land(self, request_id, response, now, units):
+        """
+        Ends the flight of a request, caching its response if it is a normal response.
+        :param request_id: the request ID of a request that completed
+        :param response: the response object of a normal response, or None if the request failed
+        :param now: the current timestamp
+        :param units: the TimeUnit of the timestamps
+        :return: the list of the request IDs that followed the request, or None if the request
+            was not in flight for a key
+        """
+        flight = self._flights.pop(request_id, None)
+        if flight is None:
+            return None
+        del self._flights_by_key[flight.key]
+        if response is not None:
+            self._put(flight.key, response, now + units.from_millis(flight.ttl_millis))
+        return flight.followers
+
+    def clear(self):
+        """
+        Drops every cached response. Requests in flight are not affected.
+        """
+        self._entries.clear()
+        self._bytes = 0
+
+    def _put(self, key, response, expiry):
+        size = self._size_of(response) + len(key[2])
+        if key in self._entries:
+            self._remove(key)
+        if size > self._max_bytes:
+            return
+        entries = self._entries
+        while self._bytes + size > self._max_bytes:
+            self._bytes -= entries.popitem(last=False)[1][2]
+            self._evictions += 1
+        entries[key] = (response, expiry, size)
+        self._bytes += size
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
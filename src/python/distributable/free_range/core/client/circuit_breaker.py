@@ -0,0 +1,263 @@
+"""
+Circuit breakers: a Client stops sending requests to a destination that keeps failing.
+Without a breaker, every request to a dead destination waits out its full timeout, and a client
+retrying in a loop keeps the destination down as it comes back. A breaker per destination tracks
+the outcomes of its recent requests, and opens when their error rate or their timeout rate
+crosses a threshold. While a breaker is open, requests to its destination complete at once with a
+CircuitOpenResponse. After open_millis, the breaker turns half-open and lets a few probe requests
+through: if they all succeed the breaker closes, and if one fails it opens again. Probes still
+without an outcome after another open_millis are given up on, and new probes are let through.
+Remote errors and framework errors count as errors, timeouts (and cancellations) as timeouts, and
+rejected requests, which were never sent, do not count. The outcome of a request sent before the
+latest state change is ignored, so that the replies of requests from before an opening neither
+close nor reopen the breaker.
+"""
+from collections import deque
+from enum import IntEnum
+
+from free_range.core.common.types import ResponseState
+
+DEFAULT_WINDOW = 100
+DEFAULT_MIN_REQUESTS = 20
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_TIMEOUT_RATE = 0.5
+DEFAULT_OPEN_MILLIS = 5000
+DEFAULT_PROBES = 1
+
+_SUCCESS = 0
+_ERROR = 1
+_TIMEOUT = 2
+_OUTCOMES = {
+    ResponseState.OK: _SUCCESS,
+    ResponseState.REMOTE_ERROR: _ERROR,
+    ResponseState.FRAMEWORK_ERROR: _ERROR,
+    ResponseState.TIMEOUT: _TIMEOUT,
+}
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    The breaker of one destination. The recent outcomes are a sliding window of the last window
+    requests, with running counts, so recording an outcome costs the same whatever the window.
+    """
+    __slots__ = ('_window', '_min_requests', '_error_rate', '_timeout_rate', '_open_time',
+                 '_probes', '_outcomes', '_errors', '_timeouts', '_state', '_changed',
+                 '_probes_sent', '_probes_succeeded', '_opened')
+
+    def __init__(self, window=DEFAULT_WINDOW, min_requests=DEFAULT_MIN_REQUESTS,
+                 error_rate=DEFAULT_ERROR_RATE, timeout_rate=DEFAULT_TIMEOUT_RATE,
+                 open_time=DEFAULT_OPEN_MILLIS, probes=DEFAULT_PROBES):
+        """
+        :param window: the number of recent outcomes the rates are computed over
+        :param min_requests: the number of outcomes in the window needed before the breaker opens
+        :param error_rate: the error rate from which the breaker opens, in the range (0, 1]
+        :param timeout_rate: the timeout rate from which the breaker opens, in the range (0, 1]
+        :param open_time: the time the breaker stays open before probing, in the units of the
+            timestamps it is given
+        :param probes: the number of probe requests let through while half-open, all of which
+            must succeed for the breaker to close
+        """
+        self._window = window
+        self._min_requests = max(1, min(min_requests, window))
+        self._error_rate = error_rate
+        self._timeout_rate = timeout_rate
+        self._open_time = open_time
+        self._probes = probes
+        self._outcomes = deque()
+        self._errors = 0
+        self._timeouts = 0
+        self._state = CircuitState.CLOSED
+        self._changed = None
+        self._probes_sent = 0
+        self._probes_succeeded = 0
+        self._opened = 0
+
+    @property
+    def state(self):
+        """
+        :return: the CircuitState as of the latest allow() or record() call
+        """
+        return self._state
+
+    @property
+    def opened(self):
+        """
+        :return: the number of times the breaker opened
+        """
+        return self._opened
+
+    @property
+    def error_rate(self):
+        """
+        :return: the error rate over the window, or 0.0 if the window is empty
+        """
+        return self._errors / len(self._outcomes) if self._outcomes else 0.0
+
+    @property
+    def timeout_rate(self):
+        """
+        :return: the timeout rate over the window, or 0.0 if the window is empty
+        """
+        return self._timeouts / len(self._outcomes) if self._outcomes else 0.0
+
+    def allow(self, now):
+        """
+        Decides whether a request may be sent. A request let through while half-open is a probe.
+        :param now: the current timestamp, which must be the start of the request
+        :return: True if the request may be sent, False if it must fail at once
+        """
+        state = self._state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.OPEN:
+            if now - self._changed < self._open_time:
+                return False
+            self._change(CircuitState.HALF_OPEN, now)
+        if self._probes_sent >= self._probes:
+            if now - self._changed < self._open_time:
+                return False
+            # the probes are stuck: start over, ignoring their outcomes from now on
+            self._change(CircuitState.HALF_OPEN, now)
+        self._probes_sent += 1
+        return True
+
+    def record(self, state, start, now):
+        """
+        Records the outcome of a request.
+        :param state: the ResponseState of the request. A state that is not an outcome, such as
+            REJECTED, records a request that was not sent after all.
+        :param start: the start timestamp of the request
+        :param now: the current timestamp
+        """
+        changed = self._changed
+        if changed is not None and start < changed:
+            return
+        breaker_state = self._state
+        outcome = _OUTCOMES.get(state)
+        if breaker_state is CircuitState.HALF_OPEN:
+            if outcome is None:
+                self._probes_sent -= 1  # the probe was not sent, another one can be
+            elif outcome != _SUCCESS:
+                self._open(now)
+            else:
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self._probes:
+                    self._change(CircuitState.CLOSED, now)
+            return
+        if outcome is None or breaker_state is CircuitState.OPEN:
+            return
+        outcomes = self._outcomes
+        outcomes.append(outcome)
+        if outcome == _ERROR:
+            self._errors += 1
+        elif outcome == _TIMEOUT:
+            self._timeouts += 1
+        if len(outcomes) > self._window:
+            evicted = outcomes.popleft()
+            if evicted == _ERROR:
+                self._errors -= 1
+            elif evicted == _TIMEOUT:
+                self._timeouts -= 1
+        count = len(outcomes)
+        if count >= self._min_requests and (self._errors >= self._error_rate * count
+                                            or self._timeouts >= self._timeout_rate * count):
+            self._open(now)
+
+    def _open(self, now):
+        self._opened += 1
+        self._change(CircuitState.OPEN, now)
+
+    def _change(self, state, now):
+        self._state = state
+        self._changed = now
+        self._probes_sent = 0
+        self._probes_succeeded = 0
+        self._outcomes.clear()
+        self._errors = 0
+        self._timeouts = 0
+
+
+class CircuitBreakers:
+    """
+    The circuit breakers of a Client, one per destination, created on first use with the same
+    settings.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, min_requests=DEFAULT_MIN_REQUESTS,
+                 error_rate=DEFAULT_ERROR_RATE, timeout_rate=DEFAULT_TIMEOUT_RATE,
+                 open_millis=DEFAULT_OPEN_MILLIS, probes=DEFAULT_PROBES):
+        """
+        :param window: the number of recent outcomes the rates are computed over
+        :param min_requests: the number of outcomes in the window needed before a breaker opens
+        :param error_rate: the error rate from which a breaker opens, in the range (0, 1]
+        :param timeout_rate: the timeout rate from which a breaker opens, in the range (0, 1]
+        :param open_millis: the time a breaker stays open before probing
+        :param probes: the number of probe requests let through while half-open
+        """
+        if not 0 < error_rate <= 1 or not 0 < timeout_rate <= 1:
+            raise ValueError(f'Invalid circuit breaker rates: error {error_rate}, '
+                             f'timeout {timeout_rate}')
+        if probes < 1:
+            raise ValueError(f'Invalid number of circuit breaker probes {probes}')
+        self._settings = (window, min_requests, error_rate, timeout_rate)
+        self._open_millis = open_millis
+        self._probes = probes
+        self._breakers = {}
+        self._rejected = 0
+
+    @property
+    def rejected(self):
+        """
+        :return: the number of requests failed at once by open breakers
+        """
+        return self._rejected
+
+    def breaker(self, destination):
+        """
+        :return: the CircuitBreaker of a destination, or None if no request was sent there yet
+        """
+        return self._breakers.get(destination)
+
+    def state(self, destination):
+        """
+        :return: the CircuitState of a destination
+        """
+        breaker = self._breakers.get(destination)
+        return CircuitState.CLOSED if breaker is None else breaker.state
+
+    def allow(self, destination, now, units):
+        """
+        Decides whether a request may be sent to a destination.
+        :param destination: the destination of the request
+        :param now: the start timestamp of the request
+        :param units: the TimeUnit of the timestamp
+        :return: True if the request may be sent, False if it must fail at once
+        """
+        breaker = self._breakers.get(destination)
+        if breaker is None:
+            breaker = self._breakers[destination] = CircuitBreaker(
+                *self._settings, open_time=units.from_millis(self._open_millis),
+                probes=self._probes)
+        if breaker.allow(now):
+            return True
+        self._rejected += 1
+        return False
+
+    def record(self, destination, state, start, now):
+        """
+        Records the outcome of a request.
+        :param destination: the destination of the request
+        :param state: the ResponseState of the request. A state that is not an outcome, such as
+            REJECTED, records a request that was not sent after all.
+        :param start: the start timestamp of the request
+        :param now: the current timestamp
+        """
+        breaker = self._breakers.get(destination)
+        if breaker is not None:
+            breaker.record(state, start, now)
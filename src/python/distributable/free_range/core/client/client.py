@@ -0,0 +1,557 @@
+"""
+The client library: the application facing side of request/response interactions.
+"""
+from itertools import count
+
+from free_range.core.client.pending import PendingRequestTable
+from free_range.core.client.throttle import Overflow
+from free_range.core.common.exceptions import (
+    CircuitOpen, FreeRangeError, MalformedMessage, RequestRejected,
+)
+from free_range.core.common.time import MonotonicTimeSource, TimeoutSpecification
+from free_range.core.common.timeouts import (
+    TimeoutManager, TimingWheel, millisecond_resolution,
+)
+from free_range.core.common.types import (
+    CircuitOpenResponse, FrameworkErrorResponse, NormalResponse, RejectedResponse,
+    RemoteErrorResponse, ResponseState,
+)
+from free_range.core.messages.codecs import LazyMessage
+
+DEFAULT_TIMEOUT_MILLIS = 30000
+
+
+class Client:
+    """
+    An asynchronous request/response client over a Transport.
+    Requests are identified by compact integer request IDs. Every request has a timeout, tracked
+    on a timing wheel. A single poll_responses() call drains all the replies that are ready and
+    expires all the timeouts that elapsed. Everything happens on the calling thread.
+    With a HedgingPolicy, requests pending for longer than usual are duplicated to another
+    destination. The duplicate, or hedge, has a request ID of its own, and its reply completes
+    the original request. Whichever reply comes second is discarded like a late reply.
+    With a ResponseCache, requests of idempotent message types are answered from the cache when
+    possible, and follow an identical request in flight otherwise. Responses served from the cache
+    complete within request_async(), and neither they nor the requests following another one are
+    journaled. A request following one that times out or is cancelled waits for its own timeout.
+    Batched requests bypass the cache.
+    With a LatencyRecorder, the response time of every normal response is recorded by
+    destination and request message type.
+    A request the transport refuses to take, because of back-pressure, completes within
+    request_async() with a RejectedResponse, and is journaled.
+    With a Throttle, requests beyond the rate limit of their flow are dropped, bounced with a
+    RejectedResponse or spooled, and spooled requests are sent by poll_responses() as the flow
+    gets tokens again. Requests held back by the throttle do not lead the cache and are not
+    hedged.
+    With CircuitBreakers, requests to a destination whose breaker is open complete within
+    request_async() with a CircuitOpenResponse, before reaching the throttle. Every other
+    completed interaction is recorded on the breaker of its destination.
+    """
+
+    def __init__(self, transport, time_source=None, default_timeout=None, journal=None,
+                 hedging=None, cache=None, latency=None, throttle=None, circuit_breakers=None):
+        """
+        :param transport: the Transport to send requests over
+        :param time_source: the time source for timestamps and timeouts. Defaults to a
+            MonotonicTimeSource.
+        :param default_timeout: the TimeoutSpecification of requests that do not specify one
+        :param journal: an optional InteractionJournal that every completed interaction is
+            recorded in. It must store timestamps of the type the time source produces.
+        :param hedging: an optional HedgingPolicy. Requests are not hedged by default.
+        :param cache: an optional ResponseCache. Responses are not cached by default.
+        :param latency: an optional LatencyRecorder, in the units of the time source. Without
+            a time source, the client uses a MonotonicTimeSource in the units of the recorder.
+        :param throttle: an optional Throttle. Requests are not throttled by default.
+        :param circuit_breakers: optional CircuitBreakers. Requests are always sent by default.
+        """
+        self._transport = transport
+        if time_source is None:
+            time_source = (MonotonicTimeSource(latency.units) if latency is not None
+                           else MonotonicTimeSource())
+        elif latency is not None and latency.units != time_source.units:
+            raise ValueError(f'The latency recorder is in {latency.units.value}, but the time '
+                             f'source in {time_source.units.value}')
+        if (journal is not None and journal.integer_timestamps
+                and isinstance(time_source.timestamp(), float)):
+            raise TypeError('The time source produces float timestamps, but the journal stores '
+                            'integers: create it with InteractionJournal.for_time_source()')
+        self._time_source = time_source
+        self._default_timeout = default_timeout or TimeoutSpecification(DEFAULT_TIMEOUT_MILLIS)
+        self._journal = journal
+        self._pending = PendingRequestTable()
+        self._timeouts = TimeoutManager(self._time_source)
+        self._request_ids = count(1)
+        # requests that timed out, or completed with a hedge in flight, stay here for another
+        # timeout period, so that the response time of a late reply can still be recorded:
+        # request ID -> journal record position
+        self._timed_out = {}
+        self._timed_out_expiry = TimingWheel(self._time_source.timestamp(),
+                                             millisecond_resolution(self._time_source))
+        self._late_reply_count = 0
+        self._hedging = hedging
+        self._hedge_due = TimingWheel(self._time_source.timestamp(),
+                                      millisecond_resolution(self._time_source))
+        self._hedge_messages = {}  # request ID -> message, until the hedge is due
+        self._hedge_of = {}  # hedge request ID -> request ID
+        self._hedge_by_request = {}  # request ID -> hedge request ID
+        self._cache = cache
+        self._latency = latency
+        self._throttle = throttle
+        self._breakers = circuit_breakers
+
+    @property
+    def time_source(self):
+        return self._time_source
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def pending_count(self):
+        """
+        :return: the number of requests still waiting for a response
+        """
+        return self._pending.incomplete_count
+
+    @property
+    def hedging(self):
+        return self._hedging
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def throttle(self):
+        return self._throttle
+
+    @property
+    def circuit_breakers(self):
+        return self._breakers
+
+    @property
+    def late_reply_count(self):
+        """
+        :return: the number of replies discarded because their request already completed
+        """
+        return self._late_reply_count
+
+    def request_async(self, destination, message, timeout=None):
+        """
+        Sends a request without waiting for the response.
+        :param destination: the name of the destination component
+        :param message: the request message
+        :param timeout: a TimeoutSpecification. Defaults to the client default timeout.
+        :return: the request ID, to be used with check_response()
+        """
+        request_id = next(self._request_ids)
+        start = self._time_source.timestamp()
+        key = None
+        if self._cache is not None:
+            key = self._cache.key_of(destination, message)
+            if key is not None and self._from_cache(request_id, destination, key, timeout, start):
+                return request_id
+        self._pending.add(request_id, destination, start,
+                          self._latency.type_of(message) if self._latency is not None else None)
+        self._timeouts.track(request_id, timeout or self._default_timeout, start)
+        if ((self._breakers is not None or self._throttle is not None)
+                and self._held_back(request_id, destination, message, start)):
+            return request_id
+        try:
+            self._transport.send_request(destination, request_id, message)
+        except RequestRejected as ex:
+            self._reject(request_id, ex, start)
+            return request_id
+        except Exception:
+            self._pending.remove(request_id)
+            self._timeouts.cancel(request_id)
+            if self._breakers is not None:
+                self._breakers.record(destination, ResponseState.REJECTED, start, start)
+            raise
+        if key is not None:
+            self._cache.lead(key, request_id)
+        if self._hedging is not None:
+            self._schedule_hedge(request_id, destination, message, start)
+        return request_id
+
+    def request(self, destination, message, timeout=None):
+        """
+        Sends a request and blocks until it completes or times out.
+        :param destination: the name of the destination component
+        :param message: the request message
+        :param timeout: a TimeoutSpecification. Defaults to the client default timeout.
+        :return: the completed MaybeResponse
+        """
+        return self.wait_for_response(self.request_async(destination, message, timeout))
+
+    def request_batch_async(self, destination, messages, timeout=None):
+        """
+        Sends several requests to the same destination in one transfer, without waiting for the
+        responses. Every request still has its own request ID, timeout and response.
+        The timing of the responses is batch-granular: all the requests share the start of the
+        batch, and a transport that replies to a batch in one transfer, such as the DEALER/ROUTER
+        transport, receives every response at once, when the last request has been handled.
+        The response times, as journaled and recorded by the latency recorder, are then the
+        round trip of the whole batch, not the time each request took.
+        :param destination: the name of the destination component
+        :param messages: the request messages
+        :param timeout: a TimeoutSpecification for each request. Defaults to the client default
+            timeout.
+        :return: the list of request IDs, in the order of the messages
+        """
+        timeout = timeout or self._default_timeout
+        start = self._time_source.timestamp()
+        requests = []
+        latency = self._latency
+        for message in messages:
+            request_id = next(self._request_ids)
+            self._pending.add(request_id, destination, start,
+                              latency.type_of(message) if latency is not None else None)
+            self._timeouts.track(request_id, timeout, start)
+            requests.append((request_id, message))
+        request_ids = [request_id for request_id, _ in requests]
+        if self._breakers is not None or self._throttle is not None:
+            requests = [(request_id, message) for request_id, message in requests
+                        if not self._held_back(request_id, destination, message, start)]
+            if not requests:
+                return request_ids
+        try:
+            self._transport.send_batch(destination, requests)
+        except RequestRejected as ex:
+            for request_id, _ in requests:
+                self._reject(request_id, ex, start)
+            return request_ids
+        except Exception:
+            breakers = self._breakers
+            for request_id, _ in requests:
+                self._pending.remove(request_id)
+                self._timeouts.cancel(request_id)
+                if breakers is not None:
+                    breakers.record(destination, ResponseState.REJECTED, start, start)
+            raise
+        if self._hedging is not None:
+            for request_id, message in requests:
+                self._schedule_hedge(request_id, destination, message, start)
+        return request_ids
+
+    def request_batch(self, destination, messages, timeout=None):
+        """
+        Sends several requests to the same destination in one transfer, and blocks until they all
+        completed or timed out. A failed or timed out request does not affect the others.
+        :param destination: the name of the destination component
+        :param messages: the request messages
+        :param timeout: a TimeoutSpecification for each request. Defaults to the client default
+            timeout.
+        :return: a list of the completed MaybeResponse, in the order of the messages
+        """
+        return [self.wait_for_response(request_id)
+                for request_id in self.request_batch_async(destination, messages, timeout)]
+
+    def poll_responses(self, timeout_millis=0):
+        """
+        Drains every reply that is ready, resolves the replies into MaybeResponse objects and
+        expires the requests that timed out.
+        :param timeout_millis: if positive, block up to this long for replies to arrive first
+        :return: a list of the request IDs that completed
+        """
+        if timeout_millis > 0:
+            self._transport.wait(timeout_millis)
+        now = self._time_source.timestamp()
+        completed = []
+        pending = self._pending
+        hedge_of = self._hedge_of
+        for request_id, state, payload in self._transport.drain_replies():
+            if hedge_of:
+                request_id = hedge_of.get(request_id, request_id)
+            entry = pending.get(request_id)
+            if entry is None or entry.done:
+                self._late_reply(request_id, state, now)
+                continue
+            self._timeouts.cancel(request_id)
+            response = _reply_response(state, payload, request_id, entry.start, now)
+            record = self._complete(entry, response)
+            if self._latency is not None and state == ResponseState.OK:
+                self._latency.record(entry.destination, entry.message_type, now - entry.start)
+            if self._hedging is not None:
+                self._hedged_request_done(entry, response, record, now)
+            completed.append(request_id)
+            if self._cache is not None:
+                completed.extend(self._land(request_id, response, now))
+        for response in self._timeouts.expire(now):
+            request_id = int(response.request_id)
+            entry = pending.get(request_id)
+            if entry is not None:
+                self._time_out(entry, response, now)
+                completed.append(request_id)
+        for request_id in self._timed_out_expiry.advance(now):
+            del self._timed_out[request_id]
+            if self._hedge_by_request:
+                self._forget_hedge(request_id)
+        if self._hedging is not None:
+            for request_id in self._hedge_due.advance(now):
+                self._hedge(request_id)
+        if self._throttle is not None:
+            for request_id, destination, message in self._throttle.release(
+                    now, self._time_source.units):
+                if not self._send_released(request_id, destination, message):
+                    completed.append(request_id)
+        return completed
+
+    def cancel(self, request_id):
+        """
+        Gives up on a request. The request completes right away with a TimeoutResponse, and a
+        reply arriving later is discarded like any late reply.
+        :param request_id: a request ID returned by request_async()
+        :return: the TimeoutResponse, or None if the request is unknown or already completed
+        """
+        entry = self._pending.get(request_id)
+        if entry is None or entry.done:
+            return None
+        now = self._time_source.timestamp()
+        response = self._timeouts.expire_request(request_id, now)
+        self._time_out(entry, response, now)
+        return response
+
+    def check_response(self, request_id, poll=True):
+        """
+        Looks up the response of a request. A completed response is handed out once, after which
+        the request is forgotten.
+        :param request_id: a request ID returned by request_async()
+        :param poll: poll for responses before the lookup
+        :return: the completed MaybeResponse, or an IncompleteResponse if not done yet
+        :raises: FreeRangeError if the request ID is unknown or its response was already collected
+        """
+        if poll:
+            self.poll_responses()
+        entry = self._pending.get(request_id)
+        if entry is None:
+            raise FreeRangeError(f'Unknown request ID {request_id}', request_id=request_id)
+        if entry.done:
+            self._pending.remove(request_id)
+        return entry.response
+
+    def wait_for_response(self, request_id):
+        """
+        Blocks until a request completes or times out.
+        :param request_id: a request ID returned by request_async()
+        :return: the completed MaybeResponse
+        """
+        entry = self._pending.get(request_id)
+        if entry is None:
+            raise FreeRangeError(f'Unknown request ID {request_id}', request_id=request_id)
+        while not entry.done:
+            self.poll_responses(self.millis_to_next_deadline())
+        return self.check_response(request_id, poll=False)
+
+    def millis_to_next_deadline(self):
+        """
+        :return: how long the caller may block waiting for replies before the next timeout is
+            due, in milliseconds
+        """
+        next_deadline = self._timeouts.next_deadline()
+        if self._hedge_messages:
+            next_hedge = self._hedge_due.next_deadline()
+            if next_deadline is None or next_hedge < next_deadline:
+                next_deadline = next_hedge
+        if self._throttle is not None:
+            next_release = self._throttle.next_release(self._time_source.timestamp(),
+                                                       self._time_source.units)
+            if next_release is not None and (next_deadline is None
+                                             or next_release < next_deadline):
+                next_deadline = next_release
+        if next_deadline is None:
+            return DEFAULT_TIMEOUT_MILLIS
+        remaining = next_deadline - self._time_source.timestamp()
+        return max(1, int(self._time_source.units.to_millis(remaining)))
+
+    def close(self):
+        self._transport.close()
+
+    def _complete(self, entry, response):
+        """
+        :return: the journal record position of the interaction, or None if not journaled
+        """
+        self._pending.complete(entry.request_id, response)
+        if self._breakers is not None and type(response) is not CircuitOpenResponse:
+            self._breakers.record(entry.destination, response.state, entry.start,
+                                  response.received_timestamp)
+        if self._journal is not None:
+            return self._journal.record(response, entry.destination)
+        return None
+
+    def _held_back(self, request_id, destination, message, start):
+        """
+        :return: True if the circuit breaker or the throttle held the request back, in which case
+            it is failed at once, bounced, dropped or spooled
+        """
+        if self._breakers is not None and not self._breakers.allow(destination, start,
+                                                                   self._time_source.units):
+            self._reject(request_id, CircuitOpen(f'Circuit to {destination} open',
+                                                 request_id=request_id), start,
+                         CircuitOpenResponse)
+            return True
+        throttle = self._throttle
+        if throttle is None:
+            return False
+        overflow = throttle.admit(throttle.flow_of(destination, message), request_id,
+                                  (request_id, destination, message), start,
+                                  self._time_source.units)
+        if overflow is None:
+            return False
+        if overflow is Overflow.BOUNCE:
+            self._reject(request_id, RequestRejected(f'Request to {destination} throttled',
+                                                     request_id=request_id), start)
+        return True
+
+    def _send_released(self, request_id, destination, message):
+        """
+        Sends a request released from a throttle spool.
+        :return: True if the request was sent, False if it completed with an error instead
+        """
+        try:
+            self._transport.send_request(destination, request_id, message)
+        except RequestRejected as ex:
+            self._reject(request_id, ex, self._pending.get(request_id).start)
+            return False
+        except Exception as ex:
+            entry = self._pending.get(request_id)
+            self._timeouts.cancel(request_id)
+            self._complete(entry, FrameworkErrorResponse(ex, request_id, entry.start,
+                                                         self._time_source.timestamp()))
+            return False
+        return True
+
+    def _reject(self, request_id, rejection, start, response_type=RejectedResponse):
+        self._timeouts.cancel(request_id)
+        now = self._time_source.timestamp()
+        self._complete(self._pending.get(request_id),
+                       response_type(rejection, request_id, start, now))
+
+    def _time_out(self, entry, response, now):
+        request_id = entry.request_id
+        self._transport.cancel_request(request_id)
+        if self._throttle is not None:
+            self._throttle.cancel(request_id)
+        if self._hedging is not None:
+            if self._hedge_messages.pop(request_id, None) is not None:
+                self._hedge_due.cancel(request_id)
+            hedge_id = self._hedge_by_request.get(request_id)
+            if hedge_id is not None:
+                self._transport.cancel_request(hedge_id)
+        self._timed_out[request_id] = self._complete(entry, response)
+        self._timed_out_expiry.schedule(request_id, now + (now - entry.start))
+        if self._cache is not None:
+            self._cache.land(request_id, None, now, self._time_source.units)
+
+    def _late_reply(self, request_id, state, now):
+        """
+        A reply for a request that already completed: the reply is discarded, but its arrival is
+        still recorded on the journal record of the request, if the request is known.
+        """
+        self._late_reply_count += 1
+        record = self._timed_out.get(request_id)
+        if record is not None:
+            self._journal.record_late_reply(record, now)
+
+    def _from_cache(self, request_id, destination, key, timeout, start):
+        """
+        Answers a request from the cache, or makes it follow an identical request in flight.
+        :return: True if the request needs no remote call of its own
+        """
+        cache = self._cache
+        cached = cache.get(key, start)
+        if cached is not None:
+            self._pending.add(request_id, destination, start)
+            self._pending.complete(request_id,
+                                   NormalResponse(cached, start, start, request_id, cached=True))
+            return True
+        if cache.follow(key, request_id):
+            self._pending.add(request_id, destination, start)
+            self._timeouts.track(request_id, timeout or self._default_timeout, start)
+            return True
+        return False
+
+    def _land(self, request_id, response, now):
+        """
+        Ends the flight of a request that got a reply: caches a normal response and completes the
+        requests that followed it with the same outcome.
+        :return: the request IDs of the followers completed
+        """
+        state, value = response.try_response()
+        followers = self._cache.land(request_id, value if state == ResponseState.OK else None,
+                                     now, self._time_source.units)
+        completed = []
+        for follower_id in followers or ():
+            entry = self._pending.get(follower_id)
+            if entry is None or entry.done:
+                continue  # timed out or cancelled on its own
+            self._timeouts.cancel(follower_id)
+            self._pending.complete(follower_id,
+                                   _reply_response(state, value, follower_id, entry.start, now))
+            completed.append(follower_id)
+        return completed
+
+    def _schedule_hedge(self, request_id, destination, message, start):
+        delay = self._hedging.delay(destination)
+        if delay is not None:
+            self._hedge_messages[request_id] = message
+            self._hedge_due.schedule(request_id, start + delay)
+
+    def _hedge(self, request_id):
+        """
+        Sends the hedge of a request that is still pending when its hedge is due, unless the
+        hedge rate cap is reached. A hedge is best effort: failing to send it leaves the request
+        as it was.
+        """
+        message = self._hedge_messages.pop(request_id)
+        destination = self._pending.get(request_id).destination
+        if not self._hedging.admit():
+            return
+        hedge_id = next(self._request_ids)
+        try:
+            self._transport.send_request(self._hedging.alternate(destination), hedge_id, message)
+        except Exception:
+            self._hedging.hedge_failed()
+            return
+        self._hedge_of[hedge_id] = request_id
+        self._hedge_by_request[request_id] = hedge_id
+
+    def _hedged_request_done(self, entry, response, record, now):
+        request_id = entry.request_id
+        if response.state == ResponseState.OK:
+            self._hedging.record(entry.destination, now - entry.start)
+        if self._hedge_messages.pop(request_id, None) is not None:
+            self._hedge_due.cancel(request_id)
+        elif request_id in self._hedge_by_request:
+            # the other copy is still in flight: its reply will be late
+            self._timed_out[request_id] = record
+            self._timed_out_expiry.schedule(request_id, now + (now - entry.start))
+
+    def _forget_hedge(self, request_id):
+        hedge_id = self._hedge_by_request.pop(request_id, None)
+        if hedge_id is not None:
+            del self._hedge_of[hedge_id]
+            # whichever copy lost may still hold transport resources
+            self._transport.cancel_request(request_id)
+            self._transport.cancel_request(hedge_id)
+
+
+def _reply_response(state, payload, request_id, start, received):
+    """
+    :return: the MaybeResponse for a reply reported by a transport
+    """
+    if state == ResponseState.OK:
+        return NormalResponse(payload, start, received, request_id)
+    if isinstance(payload, LazyMessage):
+        try:
+            payload = payload.message  # an error object is raised, it must be parsed
+        except MalformedMessage as ex:
+            return FrameworkErrorResponse(ex, request_id, start, received)
+    if state == ResponseState.REMOTE_ERROR:
+        return RemoteErrorResponse(payload, request_id, start, received)
+    return FrameworkErrorResponse(payload, request_id, start, received)
@@ -0,0 +1,151 @@
+"""
+Hedged requests: when a request is slower than most recent requests to the same destination, a
+duplicate is sent to another instance and the first reply wins.
+Tail latency mostly comes from one slow instance at a time, while the same request to another
+instance completes quickly. Waiting for a high percentile of the recent response times before
+hedging keeps the extra load to a small share of the requests.
+"""
+from collections import deque
+from math import ceil
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_MAX_RATIO = 0.05
+
+
+class _ResponseTimes:
+    """
+    The recent response times of a destination, and the hedge delay computed from them.
+    """
+    __slots__ = ('samples', 'since_refresh', 'delay')
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.since_refresh = 0
+        self.delay = None
+
+
+class HedgingPolicy:
+    """
+    Decides which requests of a Client are hedged, when, and where to.
+    A request is hedged once it has been pending for longer than a percentile of the recent
+    response times of its destination. The percentile is recomputed every refresh_interval
+    samples, not on every request. Destinations with fewer than min_samples recent response times
+    are not hedged.
+    Hedges are rate capped so that they cannot amplify an overload: every request earns max_ratio
+    of a hedge credit, up to burst credits, and every hedge spends a whole credit. When the
+    destination is slow across the board, hedges run out of credits instead of doubling the load.
+    """
+
+    def __init__(self, alternates, percentile=DEFAULT_PERCENTILE, max_ratio=DEFAULT_MAX_RATIO,
+                 burst=10, window=1000, min_samples=100, refresh_interval=None, min_delay=1):
+        """
+        :param alternates: a dict mapping destination names to the name of the destination their
+            hedges are sent to. Requests to other destinations are never hedged.
+        :param percentile: the percentile of the recent response times after which a request is
+            hedged, in the range [0, 100]
+        :param max_ratio: the maximum long-run ratio of hedges to requests
+        :param burst: the maximum number of hedge credits saved up
+        :param window: the number of recent response times kept per destination
+        :param min_samples: the number of response times needed before a destination is hedged
+        :param refresh_interval: the number of samples between recomputations of the hedge
+            delay. Defaults to a tenth of the window.
+        :param min_delay: the shortest hedge delay, in time source units. Defaults to one unit,
+            the tick of an integer clock: with a millisecond clock, the recent response times of
+            a fast destination are all 0, and requests would otherwise be hedged right away.
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError(f'Invalid hedging percentile {percentile}')
+        self._alternates = dict(alternates)
+        self._percentile = percentile
+        self._max_ratio = max_ratio
+        self._burst = burst
+        self._window = window
+        self._min_samples = max(1, min(min_samples, window))
+        self._refresh_interval = refresh_interval or max(1, window // 10)
+        self._min_delay = min_delay
+        self._times = {}
+        self._credit = 0.0
+        self._hedges = 0
+        self._suppressed = 0
+        self._failed = 0
+
+    @property
+    def hedges(self):
+        """
+        :return: the number of hedges sent
+        """
+        return self._hedges
+
+    @property
+    def suppressed(self):
+        """
+        :return: the number of hedges not sent because the rate cap was reached
+        """
+        return self._suppressed
+
+    @property
+    def failed(self):
+        """
+        :return: the number of hedges whose sending failed
+        """
+        return self._failed
+
+    def alternate(self, destination):
+        """
+        :return: the destination that hedges of requests to a destination are sent to, or None
+            if the destination is not hedged
+        """
+        return self._alternates.get(destination)
+
+    def record(self, destination, response_time):
+        """
+        Adds a response time of a successful request to the recent response times.
+        :param destination: the destination of the request
+        :param response_time: the response time, in time source units
+        """
+        times = self._times.get(destination)
+        if times is None:
+            if destination not in self._alternates:
+                return
+            times = self._times[destination] = _ResponseTimes(self._window)
+        times.samples.append(response_time)
+        times.since_refresh += 1
+        if times.since_refresh >= self._refresh_interval or times.delay is None:
+            self._refresh(times)
+
+    def delay(self, destination):
+        """
+        Counts a request towards the hedge credits, and tells when to hedge it.
+        :param destination: the destination of the request
+        :return: how long to wait for a reply before hedging the request, in time source units,
+            or None if the request is not to be hedged
+        """
+        times = self._times.get(destination)
+        if times is None:
+            return None
+        self._credit = min(self._burst, self._credit + self._max_ratio)
+        return times.delay
+
+    def admit(self):
+        """
+        Spends a hedge credit, if there is one.
+        :return: True if a hedge may be sent
+        """
+        if self._credit < 1:
+            self._suppressed += 1
+            return False
+        self._credit -= 1
+        self._hedges += 1
+        return True
+
+    def hedge_failed(self):
+        self._failed += 1
+
+    def _refresh(self, times):
+        times.since_refresh = 0
+        samples = times.samples
+        if len(samples) < self._min_samples:
+            return
+        ordered = sorted(samples)
+        rank = ceil(self._percentile / 100.0 * len(ordered)) - 1
+        times.delay = max(self._min_delay, ordered[min(len(ordered) - 1, max(0, rank))])
@@ -0,0 +1,88 @@
+"""
+Bookkeeping of the requests a client has in flight.
+"""
+from free_range.core.common.types import IncompleteResponse
+
+
+class PendingRequest:
+    """
+    A request in flight, or completed but not yet collected by the application.
+    The IncompleteResponse is created once, when the request is sent, so that checking on a
+    request that is not done does not allocate.
+    """
+    __slots__ = ('request_id', 'destination', 'start', 'response', 'done', 'message_type')
+
+    def __init__(self, request_id, destination, start, message_type=None):
+        self.request_id = request_id
+        self.destination = destination
+        self.start = start
+        self.message_type = message_type
+        self.response = IncompleteResponse(request_id, start)
+        self.done = False
+
+
+class PendingRequestTable:
+    """
+    Maps request IDs to PendingRequest entries. All operations are O(1).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._incomplete_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, request_id):
+        return request_id in self._entries
+
+    @property
+    def incomplete_count(self):
+        """
+        :return: the number of requests still waiting for a response
+        """
+        return self._incomplete_count
+
+    def add(self, request_id, destination, start, message_type=None):
+        """
+        :param request_id: the request ID
+        :param destination: the destination the request was sent to
+        :param start: the interaction start timestamp
+        :param message_type: the message type key of the request, if tracked
+        :return: the new PendingRequest
+        """
+        entry = self._entries[request_id] = PendingRequest(request_id, destination, start,
+                                                           message_type)
+        self._incomplete_count += 1
+        return entry
+
+    def get(self, request_id):
+        """
+        :return: the PendingRequest for the request ID, or None if unknown
+        """
+        return self._entries.get(request_id)
+
+    def complete(self, request_id, response):
+        """
+        Records the response of a request.
+        :param request_id: the request ID
+        :param response: the completed MaybeResponse
+        :return: the PendingRequest, or None if the request is unknown or already completed
+        """
+        entry = self._entries.get(request_id)
+        if entry is None or entry.done:
+            return None
+        entry.response = response
+        entry.done = True
+        self._incomplete_count -= 1
+        return entry
+
+    def remove(self, request_id):
+        """
+        Forgets a request.
+        :return: the removed PendingRequest, or None if unknown
+        """
+        entry = self._entries.pop(request_id, None)
+        if entry is not None and not entry.done:
+            self._incomplete_count -= 1
+        return entry
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+from free_range.core.client.async_client import AsyncClient
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import FakeTransport
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.types import ResponseState
+
+
+class AsyncClientMixIn(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.client = AsyncClient(Client(self.transport))
+
+    def reply_later(self, request_id, state=ResponseState.OK, payload='reply', delay=0.005):
+        asyncio.get_running_loop().call_later(delay, self.transport.reply, request_id, state,
+                                              payload)
+
+
+class TestRequest(AsyncClientMixIn):
+    async def test_request_resolves_to_response(self):
+        self.reply_later(1)
+        response = await self.client.request('svc', 'msg')
+        self.assertEqual(response.response, 'reply')
+
+    async def test_request_times_out(self):
+        response = await self.client.request('svc', 'msg', TimeoutSpecification(10))
+        self.assertIs(response.state, ResponseState.TIMEOUT)
+
+
+class TestBatches(AsyncClientMixIn):
+    async def test_request_many(self):
+        self.reply_later(1, payload='one')
+        self.reply_later(2, ResponseState.REMOTE_ERROR, 'error')
+        self.reply_later(3, payload='three')
+        responses = await self.client.request_many('svc', ['a', 'b', 'c'])
+        self.assertEqual([r.state for r in responses],
+                         [ResponseState.OK, ResponseState.REMOTE_ERROR, ResponseState.OK])
+        self.assertEqual(responses[2].response, 'three')
+
+    async def test_request_batch(self):
+        self.reply_later(1, payload='one')
+        self.reply_later(2, ResponseState.REMOTE_ERROR, 'error')
+        responses = await self.client.request_batch('svc', ['a', 'b'])
+        self.assertEqual(len(self.transport.batches), 1)
+        self.assertEqual([r.state for r in responses],
+                         [ResponseState.OK, ResponseState.REMOTE_ERROR])
+
+    async def test_gather(self):
+        request_ids = [self.client.client.request_async('svc', i) for i in range(3)]
+        for request_id in request_ids:
+            self.reply_later(request_id, payload=request_id)
+        responses = await self.client.gather(request_ids)
+        self.assertEqual([r.response for r in responses], request_ids)
+
+
+class TestCancellation(AsyncClientMixIn):
+    async def test_wait_for_cancels_request_into_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.client.request('svc', 'msg'), 0.01)
+        self.assertEqual(self.client.client.pending_count, 0)
+        self.transport.reply(1, ResponseState.OK, 'late')
+        self.client.client.poll_responses()
+        self.assertEqual(self.client.client.late_reply_count, 1)
+
+    async def test_cancel_resolves_with_timeout_response(self):
+        request_id = self.client.client.request_async('svc', 'msg')
+        future = self.client.response_of(request_id)
+        self.client.cancel(request_id)
+        response = await future
+        self.assertIs(response.state, ResponseState.TIMEOUT)
+
+    async def test_cancel_completed_request(self):
+        self.reply_later(1, delay=0)
+        await self.client.request('svc', 'msg')
+        self.assertIsNone(self.client.cancel(1))
+
+
+class TestPumpFailure(AsyncClientMixIn):
+    async def test_poll_failure_reaches_every_outstanding_request(self):
+        def fail():
+            raise OSError('transport failed')
+        self.transport.drain_replies = fail
+        results = await asyncio.gather(self.client.request('svc', 'one'),
+                                       self.client.request('svc', 'two'),
+                                       return_exceptions=True)
+        self.assertEqual([type(result) for result in results], [OSError, OSError])
+        self.assertEqual(self.client.client.pending_count, 0)
+
+    async def test_pump_restarts_after_a_failure(self):
+        drain_replies = self.transport.drain_replies
+        def fail():
+            self.transport.drain_replies = drain_replies
+            raise OSError('transport failed')
+        self.transport.drain_replies = fail
+        with self.assertRaises(OSError):
+            await self.client.request('svc', 'msg')
+        self.reply_later(2)
+        self.assertEqual((await self.client.request('svc', 'msg')).response, 'reply')
@@ -0,0 +1,131 @@
+import unittest
+
+from free_range.core.client.async_client import AsyncClient
+from free_range.core.client.cache import ResponseCache
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import FakeTransport, ManualTimeSource
+from free_range.core.common.journal import InteractionJournal
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.types import ResponseState
+from free_range.core.messages.codecs import CodecRegistry, JsonCodec
+
+LOOKUP_TYPE_ID = 1
+
+
+class Lookup(dict):
+    pass
+
+
+class ResponseCacheMixIn(unittest.TestCase):
+    def setUp(self):
+        self.registry = CodecRegistry()
+        self.registry.register(LOOKUP_TYPE_ID, JsonCodec(), Lookup)
+        self.cache = ResponseCache(self.registry, max_bytes=1000)
+        self.cache.mark_idempotent(LOOKUP_TYPE_ID, ttl_millis=100)
+        self.transport = FakeTransport()
+        self.time_source = ManualTimeSource(0)
+        self.journal = InteractionJournal()
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(50),
+                             self.journal, cache=self.cache)
+
+    def lookup(self, payload=b'reply', **kwargs):
+        request_id = self.client.request_async('svc', Lookup(kwargs or {'key': 1}))
+        response = self.client.check_response(request_id, poll=False)
+        if response.state is ResponseState.INCOMPLETE:
+            self.time_source.now += 5
+            self.transport.reply(request_id, ResponseState.OK, payload)
+            self.client.poll_responses()
+            response = self.client.check_response(request_id, poll=False)
+        return response
+
+
+class TestResponseCache(ResponseCacheMixIn):
+    def test_keys_are_canonical(self):
+        self.assertEqual(self.cache.key_of('svc', Lookup(a=1, b=2)),
+                         self.cache.key_of('svc', Lookup(b=2, a=1)))
+        self.assertNotEqual(self.cache.key_of('svc', Lookup(a=1)),
+                            self.cache.key_of('other', Lookup(a=1)))
+
+    def test_only_idempotent_types_are_cached(self):
+        self.assertIsNone(self.cache.key_of('svc', {'key': 1}))
+
+    def test_lru_eviction_by_size(self):
+        for i in range(3):
+            self.lookup(b'x' * 300, key=i)
+        self.lookup(key=0)  # the least recently used is now key 1
+        self.lookup(b'x' * 300, key=3)
+        self.assertEqual((len(self.cache), self.cache.evictions), (3, 1))
+        self.assertLessEqual(self.cache.size_bytes, 1000)
+        self.assertIsNone(self.cache.get(self.cache.key_of('svc', Lookup(key=1)), 0))
+
+    def test_response_larger_than_the_cache_is_not_cached(self):
+        self.lookup(b'x' * 2000)
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestCachedRequests(ResponseCacheMixIn):
+    def test_hit_is_served_without_a_remote_call(self):
+        self.lookup()
+        self.time_source.now = 50
+        response = self.lookup()
+        self.assertEqual(response.response, b'reply')
+        self.assertTrue(response.cached)
+        self.assertEqual(response.interaction_start_timestamp, 50)
+        self.assertEqual(response.response_time_millis, 0)
+        self.assertEqual(len(self.transport.sent), 1)
+        self.assertEqual(len(self.journal), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_remote_response_is_not_flagged_cached(self):
+        self.assertFalse(self.lookup().cached)
+
+    def test_expired_response_is_fetched_again(self):
+        self.lookup()
+        self.time_source.now = 105
+        self.assertFalse(self.lookup(b'fresh').cached)
+        self.assertEqual(len(self.transport.sent), 2)
+
+    def test_errors_are_not_cached(self):
+        request_id = self.client.request_async('svc', Lookup(key=1))
+        self.transport.reply(request_id, ResponseState.REMOTE_ERROR, 'error')
+        self.client.poll_responses()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_identical_requests_in_flight_share_one_remote_call(self):
+        first = self.client.request_async('svc', Lookup(key=1))
+        self.time_source.now = 3
+        second = self.client.request_async('svc', Lookup(key=1))
+        self.assertEqual(len(self.transport.sent), 1)
+        self.time_source.now = 10
+        self.transport.reply(first, ResponseState.OK, b'reply')
+        self.assertEqual(self.client.poll_responses(), [first, second])
+        response = self.client.check_response(second, poll=False)
+        self.assertEqual(response.response, b'reply')
+        self.assertEqual(response.response_time_millis, 7)
+        self.assertEqual(self.cache.coalesced, 1)
+
+    def test_followers_share_the_error(self):
+        first = self.client.request_async('svc', Lookup(key=1))
+        second = self.client.request_async('svc', Lookup(key=1))
+        self.transport.reply(first, ResponseState.REMOTE_ERROR, 'error')
+        self.client.poll_responses()
+        self.assertEqual(self.client.check_response(second, poll=False).error, 'error')
+
+    def test_follower_of_a_timed_out_request_waits_for_its_own_timeout(self):
+        first = self.client.request_async('svc', Lookup(key=1))
+        self.time_source.now = 20
+        second = self.client.request_async('svc', Lookup(key=1))
+        self.time_source.now = 50
+        self.assertEqual(self.client.poll_responses(), [first])
+        third = self.client.request_async('svc', Lookup(key=1))
+        self.assertEqual(self.transport.sent[-1][1], third)
+        self.time_source.now = 70
+        self.assertEqual(self.client.poll_responses(), [second])
+
+
+class TestAsyncCachedRequests(unittest.IsolatedAsyncioTestCase, ResponseCacheMixIn):
+    async def test_hit_resolves_without_polling(self):
+        self.lookup()
+        client = AsyncClient(self.client)
+        response = await client.request('svc', Lookup(key=1))
+        self.assertTrue(response.cached)
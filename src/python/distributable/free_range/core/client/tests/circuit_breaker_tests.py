@@ -0,0 +1,211 @@
+import unittest
+
+from free_range.core.client.circuit_breaker import (
+    CircuitBreaker, CircuitBreakers, CircuitState,
+)
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import FakeTransport, ManualTimeSource
+from free_range.core.client.throttle import Overflow, Throttle
+from free_range.core.common.exceptions import CircuitOpen
+from free_range.core.common.time import TimeoutSpecification, TimeUnit
+from free_range.core.common.types import CircuitOpenResponse, ResponseState
+
+OK = ResponseState.OK
+ERROR = ResponseState.REMOTE_ERROR
+TIMEOUT = ResponseState.TIMEOUT
+
+
+class CircuitBreakerMixIn(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(window=10, min_requests=4, error_rate=0.5,
+                                      timeout_rate=0.5, open_time=100, probes=2)
+
+    def record(self, *states, now=0):
+        for state in states:
+            self.breaker.record(state, now, now)
+
+    def trip(self):
+        self.record(ERROR, ERROR, OK, ERROR)
+        self.assertIs(self.breaker.state, CircuitState.OPEN)
+
+
+class TestOpening(CircuitBreakerMixIn):
+    def test_opens_on_error_rate(self):
+        self.record(ERROR, OK, ERROR)
+        self.assertIs(self.breaker.state, CircuitState.CLOSED)
+        self.record(ERROR)
+        self.assertIs(self.breaker.state, CircuitState.OPEN)
+        self.assertFalse(self.breaker.allow(99))
+        self.assertEqual(self.breaker.opened, 1)
+
+    def test_opens_on_timeout_rate(self):
+        self.record(TIMEOUT, OK, TIMEOUT, OK)
+        self.assertIs(self.breaker.state, CircuitState.OPEN)
+
+    def test_needs_min_requests(self):
+        self.record(ERROR, ERROR, ERROR)
+        self.assertIs(self.breaker.state, CircuitState.CLOSED)
+        self.assertTrue(self.breaker.allow(0))
+
+    def test_old_outcomes_leave_the_window(self):
+        self.record(ERROR, OK, OK, OK, ERROR, OK, OK, OK, TIMEOUT, OK)
+        self.assertEqual((self.breaker.error_rate, self.breaker.timeout_rate), (0.2, 0.1))
+        self.record(OK)
+        self.assertEqual(self.breaker.error_rate, 0.1)
+        self.record(ResponseState.FRAMEWORK_ERROR, ResponseState.REJECTED)
+        self.assertEqual(self.breaker.error_rate, 0.2)
+        self.assertIs(self.breaker.state, CircuitState.CLOSED)
+
+
+class TestRecovery(CircuitBreakerMixIn):
+    def test_probes_close_the_breaker(self):
+        self.trip()
+        self.assertTrue(self.breaker.allow(100))
+        self.assertIs(self.breaker.state, CircuitState.HALF_OPEN)
+        self.assertTrue(self.breaker.allow(100))
+        self.assertFalse(self.breaker.allow(100))
+        self.record(OK, OK, now=100)
+        self.assertIs(self.breaker.state, CircuitState.CLOSED)
+        self.assertEqual((self.breaker.error_rate, self.breaker.timeout_rate), (0.0, 0.0))
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.breaker.allow(100)
+        self.record(TIMEOUT, now=100)
+        self.assertIs(self.breaker.state, CircuitState.OPEN)
+        self.assertFalse(self.breaker.allow(199))
+        self.assertTrue(self.breaker.allow(200))
+        self.assertEqual(self.breaker.opened, 2)
+
+    def test_unsent_probe_can_be_replaced(self):
+        self.trip()
+        self.breaker.allow(100)
+        self.breaker.allow(100)
+        self.record(ResponseState.REJECTED, now=100)
+        self.assertTrue(self.breaker.allow(100))
+
+    def test_stuck_probes_are_given_up_on(self):
+        self.trip()
+        self.breaker.allow(100)
+        self.breaker.allow(100)
+        self.assertFalse(self.breaker.allow(199))
+        self.assertTrue(self.breaker.allow(200))
+        self.record(OK, now=150)  # a stuck probe replying late does not count
+        self.record(OK, OK, now=200)
+        self.assertIs(self.breaker.state, CircuitState.CLOSED)
+
+    def test_outcomes_of_requests_sent_before_a_change_are_ignored(self):
+        self.trip()
+        self.breaker.allow(100)
+        self.breaker.record(OK, 0, 100)
+        self.breaker.record(ERROR, 50, 100)
+        self.assertIs(self.breaker.state, CircuitState.HALF_OPEN)
+
+
+class BrokenClientMixIn(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.time_source = ManualTimeSource(0)
+        self.breakers = CircuitBreakers(window=10, min_requests=2, open_millis=100)
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(50),
+                             circuit_breakers=self.breakers)
+
+    def fail(self, destination='svc'):
+        request_id = self.client.request_async(destination, 'msg')
+        self.transport.reply(request_id, ERROR, ValueError('down'))
+        self.client.poll_responses()
+        return self.client.check_response(request_id, poll=False)
+
+
+class TestClient(BrokenClientMixIn):
+    def test_open_breaker_fails_requests_at_once(self):
+        self.fail()
+        self.fail()
+        self.assertIs(self.breakers.state('svc'), CircuitState.OPEN)
+        sent = len(self.transport.sent)
+        request_id = self.client.request_async('svc', 'msg')
+        response = self.client.check_response(request_id, poll=False)
+        self.assertIsInstance(response, CircuitOpenResponse)
+        with self.assertRaises(CircuitOpen):
+            response.response
+        self.assertEqual(len(self.transport.sent), sent)
+        self.assertEqual(self.breakers.rejected, 1)
+
+    def test_breakers_are_per_destination(self):
+        self.fail()
+        self.fail()
+        request_id = self.client.request_async('other', 'msg')
+        self.assertEqual(self.transport.sent[-1], ('other', request_id, 'msg'))
+        self.assertIs(self.breakers.state('other'), CircuitState.CLOSED)
+
+    def test_timeouts_open_the_breaker(self):
+        self.client.request_async('svc', 'msg')
+        self.client.request_async('svc', 'msg')
+        self.time_source.now = 50
+        self.client.poll_responses()
+        self.assertIs(self.breakers.state('svc'), CircuitState.OPEN)
+
+    def test_probe_recovers(self):
+        self.fail()
+        self.fail()
+        self.time_source.now = 100
+        probe = self.client.request_async('svc', 'msg')
+        rejected = self.client.request_async('svc', 'msg')
+        self.assertIsInstance(self.client.check_response(rejected, poll=False),
+                              CircuitOpenResponse)
+        self.transport.reply(probe, OK, 'up')
+        self.client.poll_responses()
+        self.assertEqual(self.client.check_response(probe, poll=False).response, 'up')
+        self.assertIs(self.breakers.state('svc'), CircuitState.CLOSED)
+
+    def test_probe_failing_to_send_is_replaced(self):
+        self.fail()
+        self.fail()
+        self.time_source.now = 100
+        send_request = self.transport.send_request
+
+        def broken(*args):
+            raise OSError('boom')
+        self.transport.send_request = broken
+        with self.assertRaises(OSError):
+            self.client.request_async('svc', 'msg')
+        self.transport.send_request = send_request
+        probe = self.client.request_async('svc', 'msg')
+        self.assertEqual(self.transport.sent[-1], ('svc', probe, 'msg'))
+
+    def test_probe_batch_failing_to_send_is_replaced(self):
+        self.fail()
+        self.fail()
+        self.time_source.now = 100
+
+        def broken(*args):
+            raise OSError('boom')
+        self.transport.send_batch = broken
+        with self.assertRaises(OSError):
+            self.client.request_batch_async('svc', ['msg'])
+        probe = self.client.request_async('svc', 'msg')
+        self.assertEqual(self.transport.sent[-1], ('svc', probe, 'msg'))
+
+    def test_throttled_probe_is_replaced(self):
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(50),
+                             throttle=Throttle(rate=1, burst=1, overflow=Overflow.BOUNCE),
+                             circuit_breakers=self.breakers)
+        self.fail()
+        self.time_source.now = 2000
+        self.fail()
+        self.time_source.now = 2100
+        probe = self.client.request_async('svc', 'msg')
+        self.assertIs(self.client.check_response(probe, poll=False).state,
+                      ResponseState.REJECTED)
+        self.assertIs(self.breakers.state('svc'), CircuitState.HALF_OPEN)
+        self.time_source.now = 3100
+        self.client.request_async('svc', 'msg')
+        self.assertEqual(self.breakers.breaker('svc').state, CircuitState.HALF_OPEN)
+        self.assertEqual(self.transport.sent[-1][2], 'msg')
+        self.assertEqual(len(self.transport.sent), 3)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            CircuitBreakers(error_rate=0)
+        with self.assertRaises(ValueError):
+            CircuitBreakers(probes=0)
@@ -0,0 +1,236 @@
+import unittest
+
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import FakeTransport, ManualTimeSource
+from free_range.core.common.exceptions import FreeRangeError, MalformedMessage, RequestRejected
+from free_range.core.common.histogram import LatencyRecorder
+from free_range.core.common.journal import InteractionJournal
+from free_range.core.common.time import TimeoutSpecification, TimeUnit
+from free_range.core.common.types import ResponseState
+from free_range.core.messages.codecs import LazyMessage, PickleCodec
+from free_range.transport.base import Transport
+
+
+class ClientMixIn(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.time_source = ManualTimeSource(100)
+        self.journal = InteractionJournal()
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(50),
+                             self.journal)
+
+
+class TestRequestAsync(ClientMixIn):
+    def test_sends_with_compact_request_ids(self):
+        ids = [self.client.request_async('svc', f'msg-{i}') for i in range(3)]
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(self.transport.sent[1], ('svc', 2, 'msg-1'))
+        self.assertEqual(self.client.pending_count, 3)
+
+    def test_send_failure_forgets_the_request(self):
+        def fail(*args):
+            raise OSError('boom')
+        self.transport.send_request = fail
+        with self.assertRaises(OSError):
+            self.client.request_async('svc', 'msg')
+        self.assertEqual(self.client.pending_count, 0)
+
+    def test_rejected_request_completes_at_once(self):
+        def reject(destination, request_id, message):
+            raise RequestRejected('no credit', request_id=request_id)
+        self.transport.send_request = reject
+        request_id = self.client.request_async('svc', 'msg')
+        response = self.client.check_response(request_id, poll=False)
+        self.assertIs(response.state, ResponseState.REJECTED)
+        self.assertEqual(str(response.rejection), 'no credit')
+        self.assertEqual(self.client.millis_to_next_deadline(), 30000)
+        self.assertEqual(self.journal.entry(0).outcome, ResponseState.REJECTED)
+
+
+class TestRequestBatch(ClientMixIn):
+    def test_sends_one_batch_with_a_request_id_per_message(self):
+        ids = self.client.request_batch_async('svc', ['a', 'b', 'c'])
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(self.transport.batches, [('svc', [(1, 'a'), (2, 'b'), (3, 'c')])])
+        self.assertEqual(self.client.pending_count, 3)
+
+    def test_items_complete_independently(self):
+        first, second, third = self.client.request_batch_async('svc', ['a', 'b', 'c'])
+        self.transport.reply(first, ResponseState.OK, 'one')
+        self.transport.reply(second, ResponseState.REMOTE_ERROR, ValueError('bad item'))
+        self.time_source.now = 120
+        self.client.poll_responses()
+        self.assertEqual(self.client.check_response(first, poll=False).response, 'one')
+        self.assertIs(self.client.check_response(second, poll=False).state,
+                      ResponseState.REMOTE_ERROR)
+        self.assertIs(self.client.check_response(third, poll=False).state,
+                      ResponseState.INCOMPLETE)
+        self.time_source.now = 150
+        self.client.poll_responses()
+        self.assertIs(self.client.check_response(third, poll=False).state,
+                      ResponseState.TIMEOUT)
+
+    def test_send_failure_forgets_every_request(self):
+        def fail(*args):
+            raise OSError('boom')
+        self.transport.send_batch = fail
+        with self.assertRaises(OSError):
+            self.client.request_batch_async('svc', ['a', 'b'])
+        self.assertEqual(self.client.pending_count, 0)
+
+    def test_rejected_batch_completes_at_once(self):
+        def reject(*args):
+            raise RequestRejected('no credit')
+        self.transport.send_batch = reject
+        ids = self.client.request_batch_async('svc', ['a', 'b'])
+        self.assertEqual([self.client.check_response(i, poll=False).state for i in ids],
+                         [ResponseState.REJECTED] * 2)
+
+    def test_default_send_batch_sends_each_request(self):
+        self.transport.send_batch = lambda *args: Transport.send_batch(self.transport, *args)
+        self.client.request_batch_async('svc', ['a', 'b'])
+        self.assertEqual(self.transport.sent, [('svc', 1, 'a'), ('svc', 2, 'b')])
+
+
+class TestCheckResponse(ClientMixIn):
+    def test_incomplete_response_is_not_reallocated(self):
+        request_id = self.client.request_async('svc', 'msg')
+        first = self.client.check_response(request_id)
+        self.assertIs(first.state, ResponseState.INCOMPLETE)
+        self.assertIs(self.client.check_response(request_id), first)
+
+    def test_normal_response(self):
+        request_id = self.client.request_async('svc', 'msg')
+        self.time_source.now = 107
+        self.transport.reply(request_id, ResponseState.OK, 'reply')
+        response = self.client.check_response(request_id)
+        self.assertEqual(response.response, 'reply')
+        self.assertEqual(response.response_time_millis, 7)
+
+    def test_remote_error_response(self):
+        request_id = self.client.request_async('svc', 'msg')
+        self.transport.reply(request_id, ResponseState.REMOTE_ERROR, 'error')
+        self.assertEqual(self.client.check_response(request_id).error, 'error')
+
+    def test_framework_error_response(self):
+        request_id = self.client.request_async('svc', 'msg')
+        boom = Exception('boom')
+        self.transport.reply(request_id, ResponseState.FRAMEWORK_ERROR, boom)
+        self.assertIs(self.client.check_response(request_id).framework_error, boom)
+
+    def test_undecodable_error_fails_only_its_request(self):
+        first = self.client.request_async('svc', 'msg')
+        second = self.client.request_async('svc', 'msg')
+        garbage = LazyMessage(0, PickleCodec(), b'\x00\x00not a pickle')
+        self.transport.reply(first, ResponseState.REMOTE_ERROR, garbage)
+        self.transport.reply(second, ResponseState.OK, 'reply')
+        self.assertEqual(sorted(self.client.poll_responses()), [first, second])
+        response = self.client.check_response(first, poll=False)
+        self.assertIs(response.state, ResponseState.FRAMEWORK_ERROR)
+        self.assertIsInstance(response.framework_error, MalformedMessage)
+        self.assertEqual(self.client.check_response(second, poll=False).response, 'reply')
+
+    def test_completed_response_is_handed_out_once(self):
+        request_id = self.client.request_async('svc', 'msg')
+        self.transport.reply(request_id, ResponseState.OK, 'reply')
+        self.client.check_response(request_id)
+        with self.assertRaises(FreeRangeError):
+            self.client.check_response(request_id)
+
+    def test_unknown_request(self):
+        with self.assertRaises(FreeRangeError):
+            self.client.check_response(42)
+
+
+class TestPollResponses(ClientMixIn):
+    def test_drains_all_ready_replies_in_one_batch(self):
+        ids = [self.client.request_async('svc', 'msg') for _ in range(5)]
+        for request_id in reversed(ids):
+            self.transport.reply(request_id, ResponseState.OK, request_id)
+        self.assertEqual(sorted(self.client.poll_responses()), ids)
+        self.assertEqual(self.client.pending_count, 0)
+        self.assertEqual([self.client.check_response(i, poll=False).response for i in ids], ids)
+
+    def test_timeouts(self):
+        request_id = self.client.request_async('svc', 'msg', TimeoutSpecification(10))
+        self.client.request_async('svc', 'msg')
+        self.time_source.now = 110
+        self.assertEqual(self.client.poll_responses(), [request_id])
+        self.assertIs(self.client.check_response(request_id).state, ResponseState.TIMEOUT)
+        self.assertEqual(self.client.pending_count, 1)
+
+    def test_late_reply_is_discarded_but_timed(self):
+        request_id = self.client.request_async('svc', 'msg', TimeoutSpecification(10))
+        self.time_source.now = 110
+        self.client.poll_responses()
+        self.assertIs(self.client.check_response(request_id).state, ResponseState.TIMEOUT)
+        self.time_source.now = 115
+        self.transport.reply(request_id, ResponseState.OK, 'late')
+        self.assertEqual(self.client.poll_responses(), [])
+        self.assertEqual(self.client.late_reply_count, 1)
+        self.assertEqual(len(self.journal), 1)
+        self.assertEqual(self.journal.rates(100)[0].timeout_rate, 1.0)
+        self.assertEqual(len(self.journal.response_times()), 0)
+        self.assertEqual(list(self.journal.late_response_times()), [15])
+
+    def test_waits_on_transport_when_asked(self):
+        self.client.poll_responses(5)
+        self.assertEqual(self.transport.waits, [5])
+
+    def test_completed_interactions_are_journaled(self):
+        request_id = self.client.request_async('svc', 'msg')
+        self.time_source.now = 103
+        self.transport.reply(request_id, ResponseState.OK, 'reply')
+        self.client.poll_responses()
+        self.assertEqual(self.journal.entry(0).endpoint, 'svc')
+        self.assertEqual(list(self.journal.response_times()), [3])
+
+
+class TestRequest(ClientMixIn):
+    def test_blocking_request_times_out(self):
+        def wait(timeout_millis):
+            self.time_source.now += timeout_millis
+        self.transport.wait = wait
+        response = self.client.request('svc', 'msg')
+        self.assertIs(response.state, ResponseState.TIMEOUT)
+        self.assertEqual(self.time_source.now, 150)
+
+
+class TestLatency(unittest.TestCase):
+    def test_default_time_source_follows_the_recorder(self):
+        client = Client(FakeTransport(), latency=LatencyRecorder(TimeUnit.NANOS))
+        self.assertIs(client.time_source.units, TimeUnit.NANOS)
+        self.assertIs(Client(FakeTransport(), latency=LatencyRecorder()).time_source.units,
+                      TimeUnit.MICROS)
+
+    def test_units_mismatch_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Client(FakeTransport(), ManualTimeSource(), latency=LatencyRecorder(TimeUnit.NANOS))
+
+    def test_sub_millisecond_response_time_is_recorded(self):
+        time_source = ManualTimeSource(units=TimeUnit.MICROS)
+        latency = LatencyRecorder()
+        transport = FakeTransport()
+        client = Client(transport, time_source, latency=latency)
+        request_id = client.request_async('svc', 'msg')
+        time_source.now = 250
+        transport.reply(request_id, ResponseState.OK, 'reply')
+        client.poll_responses()
+        self.assertEqual(latency.histogram('svc', 'str').max, 250)
+
+
+class TestJournal(unittest.TestCase):
+    def test_float_time_source_needs_a_float_journal(self):
+        with self.assertRaises(TypeError):
+            Client(FakeTransport(), ManualTimeSource(100.5), journal=InteractionJournal())
+
+    def test_journal_for_float_time_source(self):
+        time_source = ManualTimeSource(100.5)
+        journal = InteractionJournal.for_time_source(time_source)
+        transport = FakeTransport()
+        client = Client(transport, time_source, journal=journal)
+        request_id = client.request_async('svc', 'msg')
+        time_source.now = 101.25
+        transport.reply(request_id, ResponseState.OK, 'reply')
+        client.poll_responses()
+        self.assertEqual(list(journal.response_times()), [0.75])
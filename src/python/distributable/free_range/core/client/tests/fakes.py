@@ -0,0 +1,48 @@
+"""
+Test doubles for client tests
+"""
+from free_range.core.common.time import TimeSource, TimeUnit
+from free_range.transport.base import Transport
+
+
+class ManualTimeSource(TimeSource):
+    def __init__(self, now=0, units=TimeUnit.MILLIS):
+        self.now = now
+        self._units = units
+
+    def timestamp(self):
+        return self.now
+
+    @property
+    def units(self):
+        return self._units
+
+    @property
+    def is_monotonic(self):
+        return True
+
+
+class FakeTransport(Transport):
+    """Records sent requests. Tests queue the replies that the next drain returns."""
+
+    def __init__(self):
+        self.sent = []
+        self.batches = []
+        self.replies = []
+        self.waits = []
+
+    def send_request(self, destination, request_id, message):
+        self.sent.append((destination, request_id, message))
+
+    def send_batch(self, destination, requests):
+        self.batches.append((destination, list(requests)))
+
+    def drain_replies(self):
+        replies, self.replies = self.replies, []
+        return replies
+
+    def wait(self, timeout_millis):
+        self.waits.append(timeout_millis)
+
+    def reply(self, request_id, state, payload):
+        self.replies.append((request_id, state, payload))
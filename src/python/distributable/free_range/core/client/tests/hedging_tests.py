@@ -0,0 +1,162 @@
+import unittest
+
+from free_range.core.client.client import Client
+from free_range.core.client.hedging import HedgingPolicy
+from free_range.core.client.tests.fakes import FakeTransport, ManualTimeSource
+from free_range.core.common.journal import InteractionJournal
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.types import ResponseState
+
+
+class HedgingMixIn(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.time_source = ManualTimeSource(0)
+        self.journal = InteractionJournal()
+        self.policy = HedgingPolicy({'svc': 'svc-b'}, percentile=50, max_ratio=1, window=10,
+                                    min_samples=4)
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(100),
+                             self.journal, self.policy)
+
+    def warm_up(self, response_time=10, count=4):
+        for _ in range(count):
+            request_id = self.client.request_async('svc', 'warm-up')
+            self.time_source.now += response_time
+            self.transport.reply(request_id, ResponseState.OK, 'reply')
+            self.client.poll_responses()
+            self.client.check_response(request_id, poll=False)
+        self.transport.sent = []
+
+
+class TestHedgingPolicy(unittest.TestCase):
+    def test_delay_is_a_percentile_of_recent_response_times(self):
+        policy = HedgingPolicy({'svc': 'svc-b'}, percentile=90, window=10, min_samples=10)
+        for response_time in range(1, 10):
+            policy.record('svc', response_time)
+        self.assertIsNone(policy.delay('svc'))
+        policy.record('svc', 10)
+        self.assertEqual(policy.delay('svc'), 9)
+
+    def test_delay_is_at_least_one_tick(self):
+        policy = HedgingPolicy({'svc': 'svc-b'}, min_samples=3)
+        for _ in range(3):
+            policy.record('svc', 0)
+        self.assertEqual(policy.delay('svc'), 1)
+        policy = HedgingPolicy({'svc': 'svc-b'}, min_samples=3, min_delay=5)
+        for _ in range(3):
+            policy.record('svc', 0)
+        self.assertEqual(policy.delay('svc'), 5)
+
+    def test_unhedged_destinations(self):
+        policy = HedgingPolicy({'svc': 'svc-b'}, min_samples=1)
+        policy.record('other', 5)
+        self.assertIsNone(policy.delay('other'))
+        self.assertIsNone(policy.alternate('other'))
+
+    def test_rate_cap(self):
+        policy = HedgingPolicy({'svc': 'svc-b'}, max_ratio=0.5, min_samples=1)
+        policy.record('svc', 5)
+        policy.delay('svc')
+        self.assertFalse(policy.admit())
+        policy.delay('svc')
+        self.assertTrue(policy.admit())
+        self.assertFalse(policy.admit())
+        self.assertEqual((policy.hedges, policy.suppressed), (1, 2))
+
+    def test_credits_are_capped_by_burst(self):
+        policy = HedgingPolicy({'svc': 'svc-b'}, max_ratio=1, burst=2, min_samples=1)
+        policy.record('svc', 5)
+        for _ in range(5):
+            policy.delay('svc')
+        self.assertEqual([policy.admit() for _ in range(3)], [True, True, False])
+
+
+class TestHedgedRequests(HedgingMixIn):
+    def test_not_hedged_without_enough_samples(self):
+        self.warm_up(count=3)
+        self.client.request_async('svc', 'msg')
+        self.time_source.now += 50
+        self.client.poll_responses()
+        self.assertEqual([s for s in self.transport.sent if s[0] == 'svc-b'], [])
+
+    def test_fast_reply_is_not_hedged(self):
+        self.warm_up()
+        request_id = self.client.request_async('svc', 'msg')
+        self.transport.reply(request_id, ResponseState.OK, 'reply')
+        self.time_source.now += 5
+        self.client.poll_responses()
+        self.time_source.now += 50
+        self.client.poll_responses()
+        self.assertEqual(self.transport.sent, [('svc', request_id, 'msg')])
+
+    def test_fast_destination_is_not_hedged_at_once(self):
+        self.warm_up(response_time=0)
+        request_id = self.client.request_async('svc', 'msg')
+        self.client.poll_responses()
+        self.assertEqual(len(self.transport.sent), 1)
+        self.time_source.now += 1
+        self.client.poll_responses()
+        self.assertEqual(self.transport.sent[-1][0], 'svc-b')
+        self.assertNotEqual(self.transport.sent[-1][1], request_id)
+
+    def test_slow_request_is_hedged_and_first_reply_wins(self):
+        self.warm_up()
+        start = self.time_source.now
+        request_id = self.client.request_async('svc', 'msg')
+        self.assertEqual(self.client.millis_to_next_deadline(), 10)
+        self.time_source.now += 10
+        self.client.poll_responses()
+        hedge_id = self.transport.sent[-1][1]
+        self.assertEqual(self.transport.sent[-1], ('svc-b', hedge_id, 'msg'))
+        self.time_source.now += 2
+        self.transport.reply(hedge_id, ResponseState.OK, 'from hedge')
+        self.assertEqual(self.client.poll_responses(), [request_id])
+        response = self.client.check_response(request_id, poll=False)
+        self.assertEqual(response.response, 'from hedge')
+        self.assertEqual(response.interaction_start_timestamp, start)
+        # the slow original reply is discarded, and timed on the journal record of the request
+        self.time_source.now += 20
+        self.transport.reply(request_id, ResponseState.OK, 'from original')
+        self.assertEqual(self.client.poll_responses(), [])
+        self.assertEqual(self.client.late_reply_count, 1)
+        self.assertEqual(len(self.journal), 5)
+        self.assertEqual(self.journal.entry(4).late_received_timestamp - start, 32)
+
+    def test_hedge_rate_is_capped(self):
+        self.policy = HedgingPolicy({'svc': 'svc-b'}, percentile=50, max_ratio=0.5, burst=1,
+                                    window=10, min_samples=4)
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(100),
+                             hedging=self.policy)
+        self.warm_up()
+        for _ in range(4):
+            self.client.request_async('svc', 'msg')
+        self.time_source.now += 10
+        self.client.poll_responses()
+        self.assertEqual(len([s for s in self.transport.sent if s[0] == 'svc-b']), 1)
+        self.assertEqual(self.policy.suppressed, 3)
+
+    def test_timed_out_request_cancels_its_hedge(self):
+        cancelled = []
+        self.transport.cancel_request = cancelled.append
+        self.warm_up()
+        request_id = self.client.request_async('svc', 'msg')
+        self.time_source.now += 10
+        self.client.poll_responses()
+        hedge_id = self.transport.sent[-1][1]
+        self.time_source.now += 90
+        self.client.poll_responses()
+        self.assertIs(self.client.check_response(request_id, poll=False).state,
+                      ResponseState.TIMEOUT)
+        self.assertEqual(cancelled, [request_id, hedge_id])
+
+    def test_failed_hedge_leaves_the_request_pending(self):
+        self.warm_up()
+        request_id = self.client.request_async('svc', 'msg')
+        def fail(*args):
+            raise OSError('boom')
+        self.transport.send_request = fail
+        self.time_source.now += 10
+        self.client.poll_responses()
+        self.assertEqual(self.policy.failed, 1)
+        self.transport.reply(request_id, ResponseState.OK, 'reply')
+        self.assertEqual(self.client.poll_responses(), [request_id])
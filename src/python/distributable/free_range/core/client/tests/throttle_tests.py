@@ -0,0 +1,164 @@
+import unittest
+
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import FakeTransport, ManualTimeSource
+from free_range.core.client.throttle import Overflow, Throttle
+from free_range.core.common.journal import InteractionJournal
+from free_range.core.common.time import TimeoutSpecification, TimeUnit
+from free_range.core.common.types import ResponseState
+
+MILLIS = TimeUnit.MILLIS
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        throttle = Throttle(rate=10, burst=3)
+        admitted = [throttle.admit('svc', i, i, 0, MILLIS) for i in range(4)]
+        self.assertEqual(admitted, [None, None, None, Overflow.BOUNCE])
+        self.assertEqual(throttle.admit('svc', 4, 4, 99, MILLIS), Overflow.BOUNCE)
+        self.assertIsNone(throttle.admit('svc', 5, 5, 100, MILLIS))
+        self.assertEqual((throttle.admitted, throttle.bounced), (4, 2))
+
+    def test_quiet_flow_saves_up_to_the_burst(self):
+        throttle = Throttle(rate=1000, burst=2)
+        throttle.admit('svc', 1, 1, 0, MILLIS)
+        throttle.admit('svc', 2, 2, 0, MILLIS)
+        admitted = [throttle.admit('svc', i, i, 10000, MILLIS) for i in range(3, 6)]
+        self.assertEqual(admitted, [None, None, Overflow.BOUNCE])
+
+    def test_flows_are_independent(self):
+        throttle = Throttle(rate=1, flow_of=lambda destination, message: message['flow'])
+        self.assertEqual(throttle.flow_of('svc', {'flow': 'bulk'}), 'bulk')
+        self.assertIsNone(throttle.admit('bulk', 1, 1, 0, MILLIS))
+        self.assertEqual(throttle.admit('bulk', 2, 2, 0, MILLIS), Overflow.BOUNCE)
+        self.assertIsNone(throttle.admit('interactive', 3, 3, 0, MILLIS))
+
+    def test_no_default_rate_only_limits_configured_flows(self):
+        throttle = Throttle()
+        throttle.set_limit('limited', 1, overflow=Overflow.DROP)
+        self.assertIsNone(throttle.limit('free'))
+        self.assertEqual(throttle.limit('limited'), (1, 1, Overflow.DROP, 1000))
+        self.assertTrue(all(throttle.admit('free', i, i, 0, MILLIS) is None for i in range(100)))
+        self.assertIsNone(throttle.admit('limited', 100, 100, 0, MILLIS))
+        self.assertIs(throttle.admit('limited', 101, 101, 0, MILLIS), Overflow.DROP)
+        self.assertEqual(throttle.dropped, 1)
+
+    def test_limits_change_at_runtime(self):
+        throttle = Throttle(rate=1, burst=5)
+        self.assertIsNone(throttle.admit('svc', 1, 1, 0, MILLIS))
+        throttle.set_limit('svc', 1, burst=1)
+        self.assertIsNone(throttle.admit('svc', 2, 2, 0, MILLIS))
+        self.assertEqual(throttle.admit('svc', 3, 3, 0, MILLIS), Overflow.BOUNCE)
+        throttle.set_limit('svc', None)
+        self.assertEqual(throttle.limit('svc'), (1, 5, Overflow.BOUNCE, 1000))
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            Throttle(rate=0)
+        throttle = Throttle(overflow=Overflow.SPOOL)
+        with self.assertRaises(ValueError):
+            throttle.set_limit('svc', 0)
+        with self.assertRaises(ValueError):
+            throttle.set_limit('svc', -1)
+        self.assertIsNone(throttle.limit('svc'))
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.throttle = Throttle(rate=10, burst=1, overflow=Overflow.SPOOL, max_spooled=2)
+
+    def test_spool_drains_as_tokens_refill(self):
+        overflows = [self.throttle.admit('svc', i, f'r{i}', 0, MILLIS) for i in range(4)]
+        self.assertEqual(overflows, [None, Overflow.SPOOL, Overflow.SPOOL, Overflow.BOUNCE])
+        self.assertEqual(self.throttle.next_release(0, MILLIS), 100)
+        self.assertEqual(self.throttle.release(50, MILLIS), [])
+        self.assertEqual(self.throttle.release(100, MILLIS), ['r1'])
+        self.assertEqual(self.throttle.release(300, MILLIS), ['r2'])
+        self.assertIsNone(self.throttle.next_release(300, MILLIS))
+        self.assertEqual((self.throttle.spooled, self.throttle.spool_depth), (2, 0))
+
+    def test_new_requests_do_not_overtake_spooled_ones(self):
+        self.throttle.admit('svc', 1, 'r1', 0, MILLIS)
+        self.throttle.admit('svc', 2, 'r2', 0, MILLIS)
+        self.assertIs(self.throttle.admit('svc', 3, 'r3', 100, MILLIS), Overflow.SPOOL)
+        self.assertEqual(self.throttle.release(100, MILLIS), ['r2'])
+
+    def test_cancelled_requests_leave_the_spool(self):
+        self.throttle.admit('svc', 1, 'r1', 0, MILLIS)
+        self.throttle.admit('svc', 2, 'r2', 0, MILLIS)
+        self.assertTrue(self.throttle.cancel(2))
+        self.assertFalse(self.throttle.cancel(2))
+        self.assertEqual(self.throttle.release(1000, MILLIS), [])
+
+    def test_removing_the_limit_releases_the_spool(self):
+        throttle = Throttle(overflow=Overflow.SPOOL)
+        throttle.set_limit('svc', 1)
+        throttle.admit('svc', 1, 'r1', 0, MILLIS)
+        throttle.admit('svc', 2, 'r2', 0, MILLIS)
+        throttle.set_limit('svc', None)
+        self.assertEqual(throttle.release(0, MILLIS), ['r2'])
+
+
+class ThrottledClientMixIn(unittest.TestCase):
+    overflow = Overflow.BOUNCE
+
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.time_source = ManualTimeSource(0)
+        self.journal = InteractionJournal()
+        self.throttle = Throttle(rate=10, burst=1, overflow=self.overflow)
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(1000),
+                             self.journal, throttle=self.throttle)
+
+
+class TestBounce(ThrottledClientMixIn):
+    def test_bounced_request_completes_at_once(self):
+        sent, bounced = self.client.request_async('svc', 'a'), self.client.request_async('svc', 'b')
+        self.assertEqual(self.transport.sent, [('svc', sent, 'a')])
+        response = self.client.check_response(bounced, poll=False)
+        self.assertIs(response.state, ResponseState.REJECTED)
+        self.assertEqual(self.journal.entry(0).outcome, ResponseState.REJECTED)
+
+    def test_batch_sends_what_the_throttle_admits(self):
+        ids = self.client.request_batch_async('svc', ['a', 'b'])
+        self.assertEqual(self.transport.batches, [('svc', [(ids[0], 'a')])])
+        self.assertIs(self.client.check_response(ids[1], poll=False).state,
+                      ResponseState.REJECTED)
+
+
+class TestDrop(ThrottledClientMixIn):
+    overflow = Overflow.DROP
+
+    def test_dropped_request_times_out(self):
+        self.client.request_async('svc', 'a')
+        dropped = self.client.request_async('svc', 'b')
+        self.assertEqual(len(self.transport.sent), 1)
+        self.time_source.now = 1000
+        self.client.poll_responses()
+        self.assertIs(self.client.check_response(dropped, poll=False).state,
+                      ResponseState.TIMEOUT)
+
+
+class TestSpooledClient(ThrottledClientMixIn):
+    overflow = Overflow.SPOOL
+
+    def test_spooled_requests_are_sent_as_tokens_refill(self):
+        ids = [self.client.request_async('svc', message) for message in 'abc']
+        self.assertEqual(len(self.transport.sent), 1)
+        self.assertEqual(self.client.millis_to_next_deadline(), 100)
+        self.time_source.now = 100
+        self.client.poll_responses()
+        self.assertEqual(self.transport.sent[1], ('svc', ids[1], 'b'))
+        self.time_source.now = 200
+        self.client.poll_responses()
+        self.assertEqual([message for _, _, message in self.transport.sent], ['a', 'b', 'c'])
+
+    def test_timed_out_request_leaves_the_spool(self):
+        self.client.request_async('svc', 'a')
+        spooled = self.client.request_async('svc', 'b', TimeoutSpecification(50))
+        self.time_source.now = 50
+        self.assertEqual(self.client.poll_responses(), [spooled])
+        self.assertEqual(self.throttle.spool_depth, 0)
+        self.time_source.now = 100
+        self.client.poll_responses()
+        self.assertEqual(len(self.transport.sent), 1)
@@ -0,0 +1,271 @@
+"""
+Flow throttles: a token bucket per flow, limiting the rate of the requests a Client sends.
+A flow is a destination by default, or any name a flow_of function derives from the destination
+and the request message. Each throttled flow has a rate in requests per second and a burst, the
+number of tokens a flow saves up while it is quiet. Every request sent takes a token.
+A request finding no token overflows, in one of three ways (see notes/core_principles.md):
+- DROP: the request is not sent, and times out like a lost request
+- BOUNCE: the request completes right away with a RejectedResponse
+- SPOOL: the request waits in a bounded local queue of the flow, and is sent as tokens refill.
+  A request finding the spool full is bounced.
+Buckets refill lazily when a request comes, so a request costs a few arithmetic operations and
+dictionary lookups whatever the rate, and a quiet flow costs nothing. Limits can be changed at
+any time, and a flow keeps its tokens and spool across changes.
+"""
+from collections import OrderedDict
+from enum import IntEnum
+
+DEFAULT_MAX_SPOOLED = 1000
+
+
+class Overflow(IntEnum):
+    """
+    What happens to a request that finds no token.
+    """
+    DROP = 1
+    BOUNCE = 2
+    SPOOL = 3
+
+
+class _Bucket:
+    """
+    The token bucket and the spool of a flow. The rate is in tokens per second, and timestamps
+    are converted with the units passed along with them.
+    """
+    __slots__ = ('rate', 'burst', 'overflow', 'max_spooled', 'tokens', 'updated', 'spool')
+
+    def __init__(self, rate, burst, overflow, max_spooled):
+        self.rate = rate
+        self.burst = burst
+        self.overflow = overflow
+        self.max_spooled = max_spooled
+        self.tokens = float(burst)
+        self.updated = None
+        self.spool = OrderedDict()  # request ID -> request, oldest first
+
+    def refill(self, now, units):
+        updated = self.updated
+        self.updated = now
+        if updated is not None and now > updated:
+            self.tokens = min(self.burst,
+                              self.tokens + units.to_millis(now - updated) * self.rate / 1000)
+
+
+class Throttle:
+    """
+    The flow throttles of a Client.
+    The throttle does not send anything: the client asks admit() whether a request may be sent,
+    and sends what release() hands back from the spools.
+    """
+
+    def __init__(self, rate=None, burst=None, overflow=Overflow.BOUNCE,
+                 max_spooled=DEFAULT_MAX_SPOOLED, flow_of=None):
+        """
+        :param rate: the default rate limit of every flow, in requests per second, which must be
+            positive. None for no limit on the flows without a limit of their own.
+        :param burst: the default burst. Defaults to one second worth of requests, at least one.
+        :param overflow: the default Overflow policy
+        :param max_spooled: the default spool capacity of a flow
+        :param flow_of: a callable taking a destination and a request message and returning the
+            name of the flow. Defaults to the destination.
+        """
+        _check_rate(rate)
+        self._default = (rate, burst, overflow, max_spooled)
+        self._limits = {}  # flow -> (rate, burst, overflow, max_spooled), overriding the default
+        self._buckets = {}
+        self._spooling = {}  # flow -> _Bucket, for the flows with spooled requests
+        self._spooled_in = {}  # request ID -> _Bucket
+        self._flow_of = flow_of
+        self._admitted = 0
+        self._dropped = 0
+        self._bounced = 0
+        self._spooled = 0
+
+    @property
+    def admitted(self):
+        return self._admitted
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def bounced(self):
+        """
+        :return: the number of bounced requests, including the ones that found the spool full
+        """
+        return self._bounced
+
+    @property
+    def spooled(self):
+        """
+        :return: the number of requests spooled so far, sent or not
+        """
+        return self._spooled
+
+    @property
+    def spool_depth(self):
+        """
+        :return: the number of requests waiting in the spools
+        """
+        return len(self._spooled_in)
+
+    def flow_of(self, destination, message):
+        """
+        :return: the name of the flow of a request
+        """
+        return destination if self._flow_of is None else self._flow_of(destination, message)
+
+    def set_limit(self, flow, rate, burst=None, overflow=None, max_spooled=None):
+        """
+        Sets or changes the limit of a flow. The flow keeps the tokens it holds, up to the new
+        burst, and its spooled requests.
+        :param flow: the name of the flow
+        :param rate: the rate limit in requests per second, which must be positive, or None to
+            remove the limit of the flow and have it follow the default again
+        :param burst: the burst. Defaults to one second worth of requests, at least one.
+        :param overflow: the Overflow policy. Defaults to the throttle default.
+        :param max_spooled: the spool capacity. Defaults to the throttle default.
+        """
+        _check_rate(rate)
+        if rate is None:
+            self._limits.pop(flow, None)
+        else:
+            _, _, default_overflow, default_max_spooled = self._default
+            self._limits[flow] = (rate, burst,
+                                  default_overflow if overflow is None else overflow,
+                                  default_max_spooled if max_spooled is None else max_spooled)
+        bucket = self._buckets.get(flow)
+        if bucket is not None:
+            self._configure(flow, bucket)
+
+    def limit(self, flow):
+        """
+        :return: a (rate, burst, overflow, max_spooled) tuple for a flow, or None if the flow is
+            not limited
+        """
+        bucket = self._buckets.get(flow)
+        if bucket is None:
+            bucket = self._new_bucket(flow)
+        if bucket.rate is None:
+            return None
+        return bucket.rate, bucket.burst, bucket.overflow, bucket.max_spooled
+
+    def admit(self, flow, request_id, request, now, units):
+        """
+        Takes a token for a request, or applies the overflow policy of its flow.
+        :param flow: the name of the flow of the request
+        :param request_id: the request ID
+        :param request: what release() hands back if the request is spooled
+        :param now: the current timestamp
+        :param units: the TimeUnit of the timestamp
+        :return: None if the request may be sent now, otherwise the Overflow policy applied to
+            it. A request finding the spool full is bounced.
+        """
+        bucket = self._buckets.get(flow)
+        if bucket is None:
+            bucket = self._buckets[flow] = self._new_bucket(flow)
+        if bucket.rate is None:
+            self._admitted += 1
+            return None
+        bucket.refill(now, units)
+        if bucket.tokens >= 1 and not bucket.spool:
+            bucket.tokens -= 1
+            self._admitted += 1
+            return None
+        overflow = bucket.overflow
+        if overflow is Overflow.DROP:
+            self._dropped += 1
+            return overflow
+        if overflow is Overflow.SPOOL and len(bucket.spool) < bucket.max_spooled:
+            bucket.spool[request_id] = request
+            self._spooling[flow] = bucket
+            self._spooled_in[request_id] = bucket
+            self._spooled += 1
+            return overflow
+        self._bounced += 1
+        return Overflow.BOUNCE
+
+    def cancel(self, request_id):
+        """
+        Removes a request from its spool, when the client gives up on it.
+        :return: True if the request was spooled
+        """
+        bucket = self._spooled_in.pop(request_id, None)
+        if bucket is None:
+            return False
+        del bucket.spool[request_id]
+        return True
+
+    def release(self, now, units):
+        """
+        Takes tokens for the spooled requests, oldest first within each flow, as far as tokens
+        allow.
+        :param now: the current timestamp
+        :param units: the TimeUnit of the timestamp
+        :return: the list of the requests to send now
+        """
+        released = []
+        if not self._spooled_in:
+            self._spooling.clear()
+            return released
+        spooled_in = self._spooled_in
+        for flow, bucket in list(self._spooling.items()):
+            spool = bucket.spool
+            if bucket.rate is None:
+                tokens = len(spool)  # no longer limited
+            else:
+                bucket.refill(now, units)
+                tokens = min(int(bucket.tokens), len(spool))
+                bucket.tokens -= tokens
+            for _ in range(tokens):
+                request_id, request = spool.popitem(last=False)
+                del spooled_in[request_id]
+                released.append(request)
+            if not spool:
+                del self._spooling[flow]
+        self._admitted += len(released)
+        return released
+
+    def next_release(self, now, units):
+        """
+        :param now: the current timestamp
+        :param units: the TimeUnit of the timestamp
+        :return: the timestamp from which a spooled request can be released, or None if no
+            request is spooled
+        """
+        if not self._spooled_in:
+            return None
+        next_release = None
+        for bucket in self._spooling.values():
+            if not bucket.spool:
+                continue
+            if bucket.rate is None:
+                return now
+            bucket.refill(now, units)
+            missing = 1 - bucket.tokens
+            due = now if missing <= 0 else now + units.from_millis(missing * 1000 / bucket.rate)
+            if next_release is None or due < next_release:
+                next_release = due
+        return next_release
+
+    def _new_bucket(self, flow):
+        bucket = _Bucket(None, 0, Overflow.BOUNCE, 0)
+        self._configure(flow, bucket)
+        return bucket
+
+    def _configure(self, flow, bucket):
+        rate, burst, overflow, max_spooled = self._limits.get(flow, self._default)
+        if burst is None:
+            burst = max(1, rate or 0)
+        bucket.rate = rate
+        bucket.burst = burst
+        bucket.overflow = overflow
+        bucket.max_spooled = max_spooled
+        bucket.tokens = min(bucket.tokens, burst) if bucket.updated is not None else float(burst)
+
+
+def _check_rate(rate):
+    if rate is not None and not rate > 0:
+        raise ValueError(f'Invalid throttle rate {rate}: a rate must be positive, or None for '
+                         f'no limit')
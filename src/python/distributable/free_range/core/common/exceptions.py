@@ -56,3 +56,39 @@ class FreeRangeFrameworkBug(FreeRangeError):
                          request_id, response, *args, **kwargs)
 
     # fixme: _str__
+
+class MalformedMessage(FreeRangeError):
+    """
+    A message received from the network could not be parsed.
+    """
+    def __init__(self, msg=None, caused_by=None, request_id=None, response=None, *args, **kwargs):
+        super().__init__(msg or 'Malformed message', caused_by, request_id, response, *args,
+                         **kwargs)
+
+
+class SocketPoolExhausted(FreeRangeError):
+    """
+    Every socket of a pool is in use and the pool is at its maximum size.
+    """
+    def __init__(self, msg=None, caused_by=None, request_id=None, response=None, *args, **kwargs):
+        super().__init__(msg or 'Socket pool exhausted', caused_by, request_id, response, *args,
+                         **kwargs)
+
+
+class RequestRejected(FreeRangeError):
+    """
+    A request was refused on the client side before reaching its destination, for lack of
+    capacity: no flow control credit, for instance. The request was not sent.
+    """
+    def __init__(self, msg=None, caused_by=None, request_id=None, response=None, *args, **kwargs):
+        super().__init__(msg or 'Request rejected', caused_by, request_id, response, *args,
+                         **kwargs)
+
+
+class CircuitOpen(RequestRejected):
+    """
+    A request was refused on the client side because the circuit breaker of its destination is
+    open: the destination failed too often recently. The request was not sent.
+    """
+    def __init__(self, msg=None, caused_by=None, request_id=None, response=None, *args, **kwargs):
+        super().__init__(msg or 'Circuit open', caused_by, request_id, response, *args, **kwargs)
@@ -0,0 +1,296 @@
+"""
+Latency histograms with bounded memory, for live per-endpoint and per-message-type latency
+tracking without keeping the individual response times.
+Buckets are log-linear, as in HdrHistogram: values below 2 ** significant_bits each have a bucket
+of their own, and every power of two above is split into 2 ** (significant_bits - 1) equal
+buckets. The relative error of a recorded value is then below 2 ** (1 - significant_bits), 3% for
+the default of 6 bits, whatever the magnitude of the value.
+"""
+from array import array
+
+from free_range.core.common.time import TimeUnit
+
+DEFAULT_SIGNIFICANT_BITS = 6
+DEFAULT_MAX_VALUE = 3600 * 1000 * 1000  # one hour in microseconds
+
+
+class LatencyHistogram:
+    """
+    Counts of non-negative integer values in log-linear buckets. Recording is constant time and
+    does not allocate: the bucket counts are an array sized once, for values up to max_value.
+    Larger values are counted in the last bucket, but still reported by max.
+    Histograms with the same layout (significant_bits and max_value) can be merged, for instance
+    across processes through snapshot() and from_snapshot().
+    """
+
+    def __init__(self, max_value=DEFAULT_MAX_VALUE, significant_bits=DEFAULT_SIGNIFICANT_BITS):
+        """
+        :param max_value: the largest value recorded in a bucket of its own
+        :param significant_bits: the number of significant bits of the bucket boundaries
+        """
+        if significant_bits < 1 or max_value < 1:
+            raise ValueError(f'Invalid histogram layout: max value {max_value}, '
+                             f'{significant_bits} significant bits')
+        self._max_value = max_value
+        self._bits = significant_bits
+        self._half = 1 << (significant_bits - 1)
+        self._counts = array('Q', bytes(8 * (self._index(max_value) + 1)))
+        self._last = len(self._counts) - 1
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def layout(self):
+        """
+        :return: a (max_value, significant_bits) tuple. Only histograms of the same layout merge.
+        """
+        return self._max_value, self._bits
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def mean(self):
+        return self._sum / self._count if self._count else None
+
+    def record(self, value, count=1):
+        """
+        :param value: a non-negative integer value. Negative values are recorded as 0.
+        :param count: the number of occurrences of the value
+        """
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self._bits
+        if shift < 0:
+            shift = 0
+        index = shift * self._half + (value >> shift)
+        self._counts[index if index < self._last else self._last] += count
+        self._count += count
+        self._sum += value * count
+        if self._min is None or value < self._min:
+            self._min = value
+        if self._max is None or value > self._max:
+            self._max = value
+
+    def percentile(self, percent):
+        """
+        :param percent: a percentile in the range [0, 100]
+        :return: the highest value equivalent to the nearest-rank percentile (the upper bound of
+            its bucket, capped by the max), or None if nothing was recorded
+        """
+        if not self._count:
+            return None
+        rank = max(1, -(-percent * self._count // 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                # the last bucket also counts the values beyond max_value
+                return self._max if index == self._last else min(self._upper(index), self._max)
+        return self._max
+
+    def percentiles(self, percents):
+        """
+        :param percents: an iterable of percentiles in the range [0, 100]
+        :return: a list of values, see percentile()
+        """
+        return [self.percentile(p) for p in percents]
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram to this one.
+        :param other: a LatencyHistogram of the same layout
+        :raises: ValueError if the layouts differ
+        """
+        if other.layout != self.layout:
+            raise ValueError(f'Cannot merge a histogram of layout {other.layout} into one of '
+                             f'layout {self.layout}')
+        if not other._count:
+            return
+        counts = self._counts
+        for index, count in enumerate(other._counts):
+            if count:
+                counts[index] += count
+        self._merge_totals(other._count, other._sum, other._min, other._max)
+
+    def reset(self):
+        self._counts = array('Q', bytes(8 * len(self._counts)))
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def snapshot(self):
+        """
+        :return: a JSON serializable dict holding the layout, totals and non-empty buckets
+        """
+        return {'max_value': self._max_value,
+                'significant_bits': self._bits,
+                'count': self._count,
+                'sum': self._sum,
+                'min': self._min,
+                'max': self._max,
+                'buckets': [[index, count] for index, count in enumerate(self._counts) if count]}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        :param snapshot: a dict returned by snapshot()
+        :return: a new LatencyHistogram with the same content
+        """
+        histogram = cls(snapshot['max_value'], snapshot['significant_bits'])
+        counts = histogram._counts
+        for index, count in snapshot['buckets']:
+            counts[index] = count
+        histogram._merge_totals(snapshot['count'], snapshot['sum'], snapshot['min'],
+                                snapshot['max'])
+        return histogram
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self._bits)
+        return shift * self._half + (value >> shift)
+
+    def _upper(self, index):
+        """
+        :return: the largest value counted in a bucket
+        """
+        shift = max(0, index // self._half - 1)
+        return ((index - shift * self._half + 1) << shift) - 1
+
+    def _merge_totals(self, count, total, low, high):
+        self._count += count
+        self._sum += total
+        if low is not None and (self._min is None or low < self._min):
+            self._min = low
+        if high is not None and (self._max is None or high > self._max):
+            self._max = high
+
+
+def message_type_name(message):
+    """
+    The default message type key of a LatencyRecorder: the class name of the message.
+    """
+    return type(message).__name__
+
+
+class LatencyRecorder:
+    """
+    Latency histograms by endpoint and message type, in microseconds.
+    Response times are converted from the units of the time source that measured them, so that
+    recorders of processes using different time sources can be merged.
+    The snapshot of a recorder is JSON serializable, for scraping by a monitoring system, and can
+    be merged into another recorder.
+    The units default to microseconds: local round trips take well under a millisecond, and a
+    millisecond time source would record them all as zero. A Client or RouterServer without a
+    time source of its own measures in the units of its recorder.
+    """
+
+    def __init__(self, units=TimeUnit.MICROS, registry=None, max_value=DEFAULT_MAX_VALUE,
+                 significant_bits=DEFAULT_SIGNIFICANT_BITS):
+        """
+        :param units: the TimeUnit of the response times passed to record()
+        :param registry: a CodecRegistry. Message types are then keyed by type ID, which is
+            stable across processes, rather than by class name.
+        :param max_value: the max_value of the histograms, in microseconds
+        :param significant_bits: the significant_bits of the histograms
+        """
+        self._units = units
+        self._micros_per_unit = 1000.0 / units.units_per_milli
+        self._type_of = registry.type_id_of if registry is not None else message_type_name
+        self._layout = (max_value, significant_bits)
+        self._by_endpoint = {}  # endpoint -> {message type -> LatencyHistogram}
+
+    @property
+    def units(self):
+        return self._units
+
+    def type_of(self, message):
+        """
+        :return: the message type key of a message
+        """
+        return self._type_of(message)
+
+    def record(self, endpoint, message_type, response_time):
+        """
+        :param endpoint: the endpoint name
+        :param message_type: a message type key, see type_of()
+        :param response_time: the response time, in the units of the recorder
+        """
+        by_type = self._by_endpoint.get(endpoint)
+        if by_type is None:
+            by_type = self._by_endpoint[endpoint] = {}
+        histogram = by_type.get(message_type)
+        if histogram is None:
+            histogram = by_type[message_type] = LatencyHistogram(*self._layout)
+        histogram.record(int(response_time * self._micros_per_unit))
+
+    def histogram(self, endpoint, message_type=None):
+        """
+        :param endpoint: the endpoint name
+        :param message_type: a message type key, or None to merge the histograms of all types
+        :return: a LatencyHistogram, empty if nothing was recorded
+        """
+        by_type = self._by_endpoint.get(endpoint, {})
+        if message_type is not None:
+            return by_type.get(message_type) or LatencyHistogram(*self._layout)
+        merged = LatencyHistogram(*self._layout)
+        for histogram in by_type.values():
+            merged.merge(histogram)
+        return merged
+
+    def keys(self):
+        """
+        :return: a list of the (endpoint, message type) pairs that have a histogram
+        """
+        return [(endpoint, message_type) for endpoint, by_type in self._by_endpoint.items()
+                for message_type in by_type]
+
+    def percentiles(self, endpoint, message_type, percents):
+        """
+        :return: the percentiles of the response times, in microseconds, see
+            LatencyHistogram.percentile()
+        """
+        return self.histogram(endpoint, message_type).percentiles(percents)
+
+    def snapshot(self):
+        """
+        :return: a JSON serializable list of histogram snapshots, each with its 'endpoint' and
+            'message_type'
+        """
+        return [dict(histogram.snapshot(), endpoint=endpoint, message_type=message_type)
+                for endpoint, by_type in self._by_endpoint.items()
+                for message_type, histogram in by_type.items()]
+
+    def merge_snapshot(self, snapshot):
+        """
+        Adds the histograms of a snapshot, for instance one taken in another process.
+        :param snapshot: a list returned by snapshot()
+        :raises: ValueError if a histogram layout differs from the layout of this recorder
+        """
+        for entry in snapshot:
+            by_type = self._by_endpoint.setdefault(entry['endpoint'], {})
+            histogram = LatencyHistogram.from_snapshot(entry)
+            existing = by_type.get(entry['message_type'])
+            if existing is None:
+                if histogram.layout != self._layout:
+                    raise ValueError(f'Cannot merge a histogram of layout {histogram.layout}')
+                by_type[entry['message_type']] = histogram
+            else:
+                existing.merge(histogram)
+
+    def reset(self):
+        self._by_endpoint = {}
@@ -0,0 +1,251 @@
+"""
+An append-only, columnar journal of completed interactions, for in-process latency and error
+analysis over large numbers of interactions.
+"""
+from array import array
+from collections import Counter, namedtuple
+from heapq import nlargest
+from itertools import compress, repeat
+from math import ceil
+from operator import and_, eq, floordiv, ne, sub
+
+from free_range.core.common.types import ResponseState
+
+JournalEntry = namedtuple('JournalEntry',
+                          'request_id interaction_start_timestamp received_timestamp '
+                          'outcome endpoint late_received_timestamp')
+WindowRates = namedtuple('WindowRates', 'window_start count error_rate timeout_rate')
+
+# the stored value of a missing timestamp, in integer and in float timestamp columns
+_MISSING_INT = -(1 << 63)
+_MISSING_FLOAT = float('-inf')
+
+_ERROR_OUTCOMES = frozenset((ResponseState.REMOTE_ERROR, ResponseState.FRAMEWORK_ERROR))
+
+
+class InteractionJournal:
+    """
+    Records completed interactions in typed arrays, one column per field, instead of keeping the
+    MaybeResponse objects around. A record costs a few dozen bytes, so millions of interactions
+    can be held in memory, and the queries below run over whole columns without materializing
+    per-interaction objects.
+    Request IDs must be integers (or strings of integers), as produced by the client.
+    Endpoints are interned into small integer IDs. Endpoint ID 0 stands for "no endpoint".
+    A reply that arrives after its request timed out does not make a second record: its received
+    timestamp goes in the late column of the timeout record, see record_late_reply().
+    Timestamps are stored as 64-bit integers by default, which is exact for the integer
+    timestamps of a MonotonicTimeSource in any unit, where doubles would lose nanosecond
+    precision after about 104 days of uptime. Float timestamps, such as those of the wall clock
+    TimeSource, need a journal created with integer_timestamps=False, or with for_time_source().
+    """
+
+    def __init__(self, integer_timestamps=True):
+        """
+        :param integer_timestamps: store timestamps as 64-bit integers rather than doubles.
+            Recording a float timestamp in an integer journal raises TypeError.
+        """
+        self._integer_timestamps = integer_timestamps
+        typecode = 'q' if integer_timestamps else 'd'
+        self._missing = _MISSING_INT if integer_timestamps else _MISSING_FLOAT
+        self._request_ids = array('q')
+        self._starts = array(typecode)
+        self._receiveds = array(typecode)
+        self._late_receiveds = array(typecode)
+        self._outcomes = array('B')
+        self._endpoint_ids = array('I')
+        self._endpoint_names = [None]
+        self._endpoint_id_by_name = {None: 0}
+
+    @classmethod
+    def for_time_source(cls, time_source):
+        """
+        :param time_source: the TimeSource of the recorded timestamps
+        :return: a journal storing timestamps as integers if the time source produces integers,
+            and as doubles otherwise
+        """
+        return cls(integer_timestamps=not isinstance(time_source.timestamp(), float))
+
+    def __len__(self):
+        return len(self._request_ids)
+
+    @property
+    def integer_timestamps(self):
+        """
+        :return: True if timestamps are stored as 64-bit integers, False if as doubles
+        """
+        return self._integer_timestamps
+
+    def endpoint_id(self, endpoint):
+        """
+        :param endpoint: an endpoint name (or None)
+        :return: the interned ID of the endpoint, allocating one if needed
+        """
+        endpoint_id = self._endpoint_id_by_name.get(endpoint)
+        if endpoint_id is None:
+            endpoint_id = self._endpoint_id_by_name[endpoint] = len(self._endpoint_names)
+            self._endpoint_names.append(endpoint)
+        return endpoint_id
+
+    def record(self, response, endpoint=None):
+        """
+        Records a completed interaction.
+        :param response: a MaybeResponse. Incomplete responses are not recorded.
+        :param endpoint: the endpoint the request was sent to (optional)
+        :return: the record position in the journal, or None if the response was not recorded
+        """
+        outcome = response.state
+        if outcome is ResponseState.INCOMPLETE:
+            return None
+        return self.record_interaction(response.request_id,
+                                       response.interaction_start_timestamp,
+                                       response.received_timestamp, outcome,
+                                       self.endpoint_id(endpoint))
+
+    def record_interaction(self, request_id, interaction_start_timestamp, received_timestamp,
+                           outcome, endpoint_id=0):
+        """
+        Records a completed interaction from its raw fields.
+        :param request_id: the integer request ID
+        :param interaction_start_timestamp: the start timestamp (None if unknown)
+        :param received_timestamp: the received (or expiry) timestamp (None if unknown)
+        :param outcome: a ResponseState
+        :param endpoint_id: an ID obtained from endpoint_id()
+        :return: the record position in the journal
+        """
+        self._request_ids.append(int(request_id) if request_id is not None else -1)
+        missing = self._missing
+        self._starts.append(missing if interaction_start_timestamp is None
+                            else interaction_start_timestamp)
+        self._receiveds.append(missing if received_timestamp is None else received_timestamp)
+        self._late_receiveds.append(missing)
+        self._outcomes.append(outcome)
+        self._endpoint_ids.append(endpoint_id)
+        return len(self._request_ids) - 1
+
+    def record_late_reply(self, index, received_timestamp):
+        """
+        Records the arrival of a reply for an interaction that already completed, typically by
+        timing out. The record keeps its outcome and received timestamp, so late replies do not
+        count twice in rates and percentiles.
+        :param index: the record position of the interaction, as returned by record_interaction()
+        :param received_timestamp: the timestamp the late reply was received at
+        """
+        self._late_receiveds[index] = received_timestamp
+
+    def late_response_times(self, endpoint=None):
+        """
+        :param endpoint: only include interactions with this endpoint. Omit for all.
+        :return: an array of the response times (late received - start) of the interactions
+            whose reply arrived after they completed
+        """
+        missing = self._missing
+        present = map(and_, map(ne, self._starts, repeat(missing)),
+                      map(ne, self._late_receiveds, repeat(missing)))
+        selector = self._selector(None, endpoint)
+        selector = array('B', present if selector is None else map(and_, present, selector))
+        return array(self._starts.typecode, map(sub, compress(self._late_receiveds, selector),
+                                                compress(self._starts, selector)))
+
+    def response_times(self, outcome=ResponseState.OK, endpoint=None):
+        """
+        :param outcome: only include interactions with this ResponseState. None for all.
+        :param endpoint: only include interactions with this endpoint. Omit for all.
+        :return: an array of the response times (received - start) of the selected interactions.
+            Interactions with missing timing data are excluded.
+        """
+        selector = self._timed_selector(outcome, endpoint)
+        return array(self._starts.typecode, map(sub, compress(self._receiveds, selector),
+                                                compress(self._starts, selector)))
+
+    def percentiles(self, percents, outcome=ResponseState.OK, endpoint=None):
+        """
+        Computes nearest-rank percentiles of the response times.
+        :param percents: an iterable of percentiles in the range [0, 100]
+        :param outcome: see response_times()
+        :param endpoint: see response_times()
+        :return: a list of response times, one per requested percentile (None if there is no data)
+        """
+        ordered = sorted(self.response_times(outcome, endpoint))
+        if not ordered:
+            return [None for _ in percents]
+        last = len(ordered) - 1
+        return [ordered[min(last, max(0, ceil(p / 100.0 * len(ordered)) - 1))] for p in percents]
+
+    def rates(self, window, endpoint=None):
+        """
+        Computes the error and timeout rates per time window, windows being aligned to the first
+        received timestamp in the journal. Remote and framework errors both count as errors.
+        :param window: the window length, in time source units
+        :param endpoint: only include interactions with this endpoint. Omit for all.
+        :return: a list of WindowRates, ordered by window start, skipping empty windows
+        """
+        selector = self._selector(None, endpoint)
+        present = map(ne, self._receiveds, repeat(self._missing))
+        selector = array('B', present if selector is None else map(and_, present, selector))
+        receiveds = array(self._receiveds.typecode, compress(self._receiveds, selector))
+        outcomes = array('B', compress(self._outcomes, selector))
+        if not receiveds:
+            return []
+        origin = min(receiveds)
+        windows = list(map(floordiv, map(sub, receiveds, repeat(origin)), repeat(window)))
+        totals = Counter(windows)
+        errors = Counter(compress(windows, map(_ERROR_OUTCOMES.__contains__, outcomes)))
+        timeouts = Counter(compress(windows, map(eq, outcomes, repeat(ResponseState.TIMEOUT))))
+        return [WindowRates(origin + w * window, totals[w], errors[w] / totals[w],
+                            timeouts[w] / totals[w])
+                for w in sorted(totals)]
+
+    def slowest(self, n, outcome=None, endpoint=None):
+        """
+        :param n: the number of interactions to return
+        :param outcome: see response_times(). Defaults to all outcomes.
+        :param endpoint: see response_times()
+        :return: a list of up to n JournalEntry tuples, slowest first
+        """
+        receiveds = self._receiveds
+        starts = self._starts
+        indexes = compress(range(len(starts)), self._timed_selector(outcome, endpoint))
+        return [self.entry(i)
+                for i in nlargest(n, indexes, key=lambda i: receiveds[i] - starts[i])]
+
+    def entry(self, index):
+        """
+        Materializes a single journal record.
+        :param index: the record position in the journal
+        :return: a JournalEntry
+        """
+        start = self._starts[index]
+        received = self._receiveds[index]
+        late_received = self._late_receiveds[index]
+        missing = self._missing
+        return JournalEntry(self._request_ids[index],
+                            None if start == missing else start,
+                            None if received == missing else received,
+                            ResponseState(self._outcomes[index]),
+                            self._endpoint_names[self._endpoint_ids[index]],
+                            None if late_received == missing else late_received)
+
+    def _selector(self, outcome, endpoint):
+        """
+        :return: an iterable of booleans selecting records, or None to select everything
+        """
+        if outcome is None and endpoint is None:
+            return None
+        if endpoint is None:
+            return map(eq, self._outcomes, repeat(outcome))
+        endpoint_id = self._endpoint_id_by_name.get(endpoint, -1)
+        by_endpoint = map(eq, self._endpoint_ids, repeat(endpoint_id))
+        if outcome is None:
+            return by_endpoint
+        return map(and_, by_endpoint, map(eq, self._outcomes, repeat(outcome)))
+
+    def _timed_selector(self, outcome, endpoint):
+        """
+        :return: an array of booleans selecting records that match the outcome and endpoint and
+            have both timestamps
+        """
+        missing = self._missing
+        present = map(and_, map(ne, self._starts, repeat(missing)),
+                      map(ne, self._receiveds, repeat(missing)))
+        selector = self._selector(outcome, endpoint)
+        return array('B', present if selector is None else map(and_, present, selector))
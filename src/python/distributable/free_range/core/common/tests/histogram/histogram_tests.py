@@ -0,0 +1,106 @@
+import json
+import unittest
+
+from free_range.core.common.histogram import LatencyHistogram, LatencyRecorder
+from free_range.core.common.time import TimeUnit
+from free_range.core.messages.codecs import CodecRegistry, JsonCodec
+
+
+class LatencyHistogramMixIn(unittest.TestCase):
+    def setUp(self):
+        self.histogram = LatencyHistogram(max_value=10 ** 6, significant_bits=5)
+        for value in range(1, 1001):
+            self.histogram.record(value)
+
+
+class TestLatencyHistogram(LatencyHistogramMixIn):
+    def test_totals(self):
+        self.assertEqual((self.histogram.count, self.histogram.min, self.histogram.max),
+                         (1000, 1, 1000))
+        self.assertEqual(self.histogram.mean, 500.5)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram(significant_bits=5)
+        for value in range(32):
+            histogram.record(value)
+        self.assertEqual(histogram.percentiles([0, 50, 100]), [0, 15, 31])
+
+    def test_percentiles_within_relative_error(self):
+        for percent, exact in ((50, 500), (90, 900), (99, 990)):
+            value = self.histogram.percentile(percent)
+            self.assertGreaterEqual(value, exact)
+            self.assertLess((value - exact) / exact, 2 ** -4)
+        self.assertEqual(self.histogram.percentile(100), 1000)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+    def test_values_beyond_max_value_are_counted(self):
+        histogram = LatencyHistogram(max_value=1000)
+        histogram.record(10 ** 9)
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(histogram.percentile(100), 10 ** 9)
+
+    def test_negative_values_are_recorded_as_zero(self):
+        histogram = LatencyHistogram()
+        histogram.record(-5)
+        self.assertEqual(histogram.max, 0)
+
+    def test_merge(self):
+        other = LatencyHistogram(max_value=10 ** 6, significant_bits=5)
+        other.record(5000, count=1000)
+        self.histogram.merge(other)
+        self.assertEqual((self.histogram.count, self.histogram.max), (2000, 5000))
+        self.assertGreaterEqual(self.histogram.percentile(75), 4900)
+
+    def test_merge_requires_the_same_layout(self):
+        with self.assertRaises(ValueError):
+            self.histogram.merge(LatencyHistogram())
+
+    def test_snapshot_round_trip(self):
+        snapshot = json.loads(json.dumps(self.histogram.snapshot()))
+        copy = LatencyHistogram.from_snapshot(snapshot)
+        self.assertEqual(copy.snapshot(), self.histogram.snapshot())
+        self.assertEqual(copy.percentile(99), self.histogram.percentile(99))
+
+    def test_reset(self):
+        self.histogram.reset()
+        self.assertEqual((self.histogram.count, self.histogram.max), (0, None))
+
+
+class TestLatencyRecorder(unittest.TestCase):
+    def setUp(self):
+        self.recorder = LatencyRecorder(TimeUnit.MILLIS)
+
+    def test_records_in_microseconds_by_endpoint_and_type(self):
+        self.recorder.record('svc', 'Get', 2)
+        self.recorder.record('svc', 'Put', 7)
+        self.assertEqual(sorted(self.recorder.keys()), [('svc', 'Get'), ('svc', 'Put')])
+        self.assertEqual(self.recorder.histogram('svc', 'Get').max, 2000)
+        self.assertEqual(self.recorder.histogram('svc').count, 2)
+        self.assertEqual(self.recorder.percentiles('svc', 'Put', [100]), [7000])
+
+    def test_nanosecond_time_source(self):
+        recorder = LatencyRecorder(TimeUnit.NANOS)
+        recorder.record('svc', 'Get', 1500)
+        self.assertEqual(recorder.histogram('svc', 'Get').max, 1)
+
+    def test_unknown_histogram_is_empty(self):
+        self.assertEqual(self.recorder.histogram('other', 'Get').count, 0)
+
+    def test_message_types(self):
+        self.assertEqual(self.recorder.type_of({}), 'dict')
+        registry = CodecRegistry()
+        registry.register(3, JsonCodec(), dict)
+        self.assertEqual(LatencyRecorder(registry=registry).type_of({}), 3)
+
+    def test_merge_snapshot(self):
+        self.recorder.record('svc', 'Get', 2)
+        other = LatencyRecorder(TimeUnit.MILLIS)
+        other.record('svc', 'Get', 4)
+        other.record('svc-b', 'Get', 1)
+        self.recorder.merge_snapshot(json.loads(json.dumps(other.snapshot())))
+        self.assertEqual(self.recorder.histogram('svc', 'Get').count, 2)
+        self.assertEqual(self.recorder.histogram('svc-b', 'Get').max, 1000)
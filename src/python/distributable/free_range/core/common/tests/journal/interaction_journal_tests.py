@@ -0,0 +1,132 @@
+import unittest
+
+from free_range.core.common.journal import InteractionJournal
+from free_range.core.common.time import MonotonicTimeSource, TimeSource
+from free_range.core.common.types import (
+    FrameworkErrorResponse, IncompleteResponse, NormalResponse, RemoteErrorResponse, ResponseState,
+    TimeoutResponse,
+)
+
+
+class InteractionJournalMixIn(unittest.TestCase):
+    def setUp(self):
+        self.journal = InteractionJournal()
+        for i in range(1, 11):
+            self.journal.record(NormalResponse('ok', 100 * i, 100 * i + i, request_id=i),
+                                endpoint='svc-a')
+        self.journal.record(RemoteErrorResponse('error', 11, 1000, 1005), endpoint='svc-b')
+        self.journal.record(TimeoutResponse('timeout', 12, 1000, 1500), endpoint='svc-b')
+
+
+class TestRecord(InteractionJournalMixIn):
+    def test_length(self):
+        self.assertEqual(len(self.journal), 12)
+
+    def test_incomplete_response_is_not_recorded(self):
+        self.assertIsNone(self.journal.record(IncompleteResponse(13, 10)))
+        self.assertEqual(len(self.journal), 12)
+
+    def test_entry(self):
+        entry = self.journal.entry(10)
+        self.assertEqual(entry.request_id, 11)
+        self.assertEqual(entry.outcome, ResponseState.REMOTE_ERROR)
+        self.assertEqual(entry.endpoint, 'svc-b')
+        self.assertEqual(entry.received_timestamp - entry.interaction_start_timestamp, 5)
+
+
+    def test_record_returns_the_record_position(self):
+        self.assertEqual(self.journal.record(NormalResponse('ok', 1, 2, request_id=13)), 12)
+
+
+class TestLateReplies(InteractionJournalMixIn):
+    def test_late_reply_updates_the_timeout_record(self):
+        self.journal.record_late_reply(11, 1600)
+        self.assertEqual(len(self.journal), 12)
+        self.assertEqual(self.journal.entry(11).outcome, ResponseState.TIMEOUT)
+        self.assertEqual(self.journal.entry(11).late_received_timestamp, 1600)
+        self.assertIsNone(self.journal.entry(10).late_received_timestamp)
+        self.assertEqual(list(self.journal.response_times(ResponseState.TIMEOUT)), [500])
+
+    def test_late_response_times(self):
+        self.journal.record_late_reply(11, 1600)
+        self.assertEqual(list(self.journal.late_response_times()), [600])
+        self.assertEqual(list(self.journal.late_response_times('svc-b')), [600])
+        self.assertEqual(len(self.journal.late_response_times('svc-a')), 0)
+
+
+class TestResponseTimes(InteractionJournalMixIn):
+    def test_ok_response_times(self):
+        self.assertEqual(list(self.journal.response_times()), list(range(1, 11)))
+
+    def test_all_outcomes_for_endpoint(self):
+        self.assertEqual(list(self.journal.response_times(None, 'svc-b')), [5, 500])
+
+    def test_unknown_endpoint_has_no_response_times(self):
+        self.assertEqual(len(self.journal.response_times(None, 'svc-c')), 0)
+
+    def test_missing_timing_data_is_excluded(self):
+        self.journal.record_interaction(14, 10, None, ResponseState.OK)
+        self.assertEqual(len(self.journal.response_times()), 10)
+
+
+class TestPercentiles(InteractionJournalMixIn):
+    def test_percentiles(self):
+        self.assertEqual(self.journal.percentiles([0, 50, 90, 100]), [1, 5, 9, 10])
+
+    def test_percentiles_without_data(self):
+        self.assertEqual(self.journal.percentiles([50], endpoint='svc-c'), [None])
+
+
+class TestRates(InteractionJournalMixIn):
+    def test_rates(self):
+        rates = self.journal.rates(500)
+        self.assertEqual([r.count for r in rates], [5, 6, 1])
+        self.assertEqual([r.window_start for r in rates], [101, 601, 1101])
+        self.assertEqual([r.error_rate for r in rates], [0, 1 / 6, 0])
+        self.assertEqual([r.timeout_rate for r in rates], [0, 0, 1])
+
+    def test_rates_for_endpoint(self):
+        rates = self.journal.rates(1000, endpoint='svc-b')
+        self.assertEqual(len(rates), 1)
+        self.assertEqual(rates[0].window_start, 1005)
+        self.assertEqual(rates[0].error_rate, 0.5)
+
+    def test_framework_errors_are_errors(self):
+        self.journal.record(FrameworkErrorResponse(RuntimeError('bug'), 13, 1000, 1010),
+                            endpoint='svc-b')
+        rates = self.journal.rates(1000, endpoint='svc-b')
+        self.assertEqual(rates[0].error_rate, 2 / 3)
+
+
+class TestSlowest(InteractionJournalMixIn):
+    def test_slowest(self):
+        self.assertEqual([e.request_id for e in self.journal.slowest(3)], [12, 10, 9])
+
+    def test_slowest_ok(self):
+        self.assertEqual([e.request_id for e in self.journal.slowest(2, ResponseState.OK)],
+                         [10, 9])
+
+
+class TestTimestampTypes(unittest.TestCase):
+    def test_nanosecond_uptimes_are_exact(self):
+        journal = InteractionJournal()
+        start = 200 * 24 * 3600 * 10 ** 9 + 1  # 200 days of uptime, in nanoseconds
+        journal.record_interaction(1, start, start + 3, ResponseState.OK)
+        self.assertEqual(list(journal.response_times()), [3])
+        self.assertEqual(journal.entry(0).interaction_start_timestamp, start)
+
+    def test_float_timestamps(self):
+        journal = InteractionJournal(integer_timestamps=False)
+        journal.record_interaction(1, 10.25, 11.0, ResponseState.OK)
+        journal.record_interaction(2, None, 11.0, ResponseState.OK)
+        self.assertEqual(list(journal.response_times()), [0.75])
+        self.assertIsNone(journal.entry(1).interaction_start_timestamp)
+
+    def test_integer_journal_rejects_float_timestamps(self):
+        with self.assertRaises(TypeError):
+            InteractionJournal().record_interaction(1, 10.25, 11.0, ResponseState.OK)
+
+    def test_journal_for_time_source(self):
+        journal = InteractionJournal.for_time_source(MonotonicTimeSource())
+        self.assertTrue(journal.integer_timestamps)
+        self.assertFalse(InteractionJournal.for_time_source(TimeSource()).integer_timestamps)
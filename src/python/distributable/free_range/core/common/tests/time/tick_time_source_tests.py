@@ -0,0 +1,36 @@
+import unittest
+
+from free_range.core.common.time import TickTimeSource, TimeUnit
+
+
+class TickTimeSourceMixIn(unittest.TestCase):
+    def setUp(self):
+        self.clock = TickTimeSource()
+
+
+class TestTimestamp(TickTimeSourceMixIn):
+    def test_starts_at_zero(self):
+        self.assertEqual(self.clock.timestamp(), 0)
+
+    def test_units(self):
+        self.assertEqual(self.clock.units, TimeUnit.TICKS)
+
+    def test_skew_is_added_to_timestamps(self):
+        clock = TickTimeSource(tick=10, skew=-3)
+        self.assertEqual(clock.timestamp(), 7)
+        self.assertEqual(clock.tick, 10)
+
+
+class TestAdvance(TickTimeSourceMixIn):
+    def test_advance(self):
+        self.assertEqual(self.clock.advance(5), 5)
+        self.assertEqual(self.clock.timestamp(), 5)
+
+    def test_set_tick(self):
+        self.clock.set_tick(100)
+        self.assertEqual(self.clock.timestamp(), 100)
+
+    def test_cannot_go_backwards(self):
+        self.clock.set_tick(100)
+        with self.assertRaises(ValueError):
+            self.clock.set_tick(99)
@@ -0,0 +1,74 @@
+import unittest
+
+from free_range.core.common.time import (
+    CachedTimeSource, MonotonicTimeSource, TimeSource, TimeUnit,
+)
+from free_range.core.common.types import NormalResponse, ResponseState
+
+
+class TestTimeUnit(unittest.TestCase):
+    def test_to_millis(self):
+        self.assertEqual(TimeUnit.NANOS.to_millis(3000000), 3)
+
+    def test_from_millis(self):
+        self.assertEqual(TimeUnit.MICROS.from_millis(2), 2000)
+
+    def test_ticks_stand_in_for_millis(self):
+        self.assertEqual(TimeUnit.TICKS.units_per_milli, 1)
+
+
+class TestTimeSource(unittest.TestCase):
+    def test_default_time_source_is_wall_clock_millis(self):
+        source = TimeSource()
+        self.assertEqual(source.units, TimeUnit.MILLIS)
+        self.assertFalse(source.is_monotonic)
+        self.assertGreater(source.timestamp(), 1.5e12)
+
+
+class TestMonotonicTimeSource(unittest.TestCase):
+    def test_timestamps_are_integers(self):
+        self.assertIsInstance(MonotonicTimeSource().timestamp(), int)
+
+    def test_timestamps_never_go_backwards(self):
+        source = MonotonicTimeSource(TimeUnit.NANOS)
+        timestamps = [source.timestamp() for _ in range(1000)]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertTrue(source.is_monotonic)
+
+    def test_units(self):
+        self.assertEqual(MonotonicTimeSource(TimeUnit.MICROS).units, TimeUnit.MICROS)
+
+    def test_ticks_are_not_supported(self):
+        with self.assertRaises(ValueError):
+            MonotonicTimeSource(TimeUnit.TICKS)
+
+    def test_responses_accept_integer_timestamps(self):
+        source = MonotonicTimeSource(TimeUnit.NANOS)
+        start = source.timestamp()
+        response = NormalResponse('response', start, source.timestamp(), request_id=1)
+        self.assertIs(response.state, ResponseState.OK)
+        self.assertIsInstance(response.response_time_millis, int)
+
+
+class TestCachedTimeSource(unittest.TestCase):
+    def setUp(self):
+        self.underlying = MonotonicTimeSource(TimeUnit.NANOS)
+        self.cached = CachedTimeSource(self.underlying)
+
+    def test_timestamp_is_cached_until_refresh(self):
+        first = self.cached.timestamp()
+        self.underlying.timestamp()
+        self.assertEqual(self.cached.timestamp(), first)
+
+    def test_refresh(self):
+        first = self.cached.timestamp()
+        refreshed = self.cached.refresh()
+        self.assertGreater(refreshed, first)
+        self.assertEqual(self.cached.timestamp(), refreshed)
+
+    def test_describes_underlying_source(self):
+        self.assertEqual(self.cached.units, TimeUnit.NANOS)
+        self.assertTrue(self.cached.is_monotonic)
+
+    def test_defaults_to_monotonic_millis(self):
+        self.assertEqual(CachedTimeSource().units, TimeUnit.MILLIS)
@@ -0,0 +1,32 @@
+import unittest
+
+from free_range.core.common.time import MonotonicTimeSource, TimeUnit, TimeoutSpecification
+
+
+class TestTimeoutSpecification(unittest.TestCase):
+    def test_defaults_to_millis(self):
+        self.assertEqual(TimeoutSpecification(10).units, TimeUnit.MILLIS)
+
+    def test_units_of_time_source(self):
+        spec = TimeoutSpecification(10, MonotonicTimeSource(TimeUnit.NANOS))
+        self.assertEqual(spec.units, TimeUnit.NANOS)
+
+    def test_negative_duration_is_invalid(self):
+        with self.assertRaises(ValueError):
+            TimeoutSpecification(-1)
+
+    def test_deadline(self):
+        self.assertEqual(TimeoutSpecification(10).deadline(5), 15)
+
+    def test_deadline_in_other_units(self):
+        self.assertEqual(TimeoutSpecification(10).deadline(5, TimeUnit.MICROS), 10005)
+
+    def test_is_expired(self):
+        spec = TimeoutSpecification(10)
+        self.assertFalse(spec.is_expired(5, 14))
+        self.assertTrue(spec.is_expired(5, 15))
+
+    def test_is_expired_defaults_to_the_monotonic_clock(self):
+        start = MonotonicTimeSource().timestamp()
+        self.assertFalse(TimeoutSpecification(60000).is_expired(start))
+        self.assertTrue(TimeoutSpecification(0).is_expired(start))
@@ -0,0 +1,78 @@
+import time
+import unittest
+
+from free_range.core.common.time import TimeSource, TimeUnit, TimeoutSpecification
+from free_range.core.common.timeouts import TimeoutManager
+from free_range.core.common.types import ResponseState
+
+
+class ManualTimeSource(TimeSource):
+    def __init__(self, units=TimeUnit.MILLIS):
+        self.now = 0
+        self._units = units
+
+    def timestamp(self):
+        return self.now
+
+    @property
+    def units(self):
+        return self._units
+
+
+class TimeoutManagerMixIn(unittest.TestCase):
+    def setUp(self):
+        self.time_source = ManualTimeSource()
+        self.manager = TimeoutManager(self.time_source)
+        self.manager.track(1, TimeoutSpecification(10))
+        self.manager.track(2, TimeoutSpecification(20))
+
+
+class TestExpire(TimeoutManagerMixIn):
+    def test_nothing_expires_early(self):
+        self.time_source.now = 9
+        self.assertEqual(self.manager.expire(), [])
+
+    def test_expired_requests_become_timeout_responses(self):
+        self.time_source.now = 15
+        responses = self.manager.expire()
+        self.assertEqual([r.request_id for r in responses], ['1'])
+        self.assertIs(responses[0].state, ResponseState.TIMEOUT)
+        self.assertEqual(responses[0].timeout.duration, 10)
+        self.assertEqual(responses[0].received_timestamp, 15)
+        self.assertNotIn(1, self.manager)
+
+    def test_batch_expiry(self):
+        self.time_source.now = 100
+        self.assertEqual(sorted(r.request_id for r in self.manager.expire()), ['1', '2'])
+        self.assertEqual(len(self.manager), 0)
+
+    def test_cancelled_request_does_not_expire(self):
+        self.assertTrue(self.manager.cancel(1))
+        self.time_source.now = 100
+        self.assertEqual([r.request_id for r in self.manager.expire()], ['2'])
+
+    def test_timeout_is_converted_to_time_source_units(self):
+        time_source = ManualTimeSource(TimeUnit.MICROS)
+        manager = TimeoutManager(time_source, resolution=1000)
+        manager.track(1, TimeoutSpecification(10))
+        time_source.now = 9999
+        self.assertEqual(manager.expire(), [])
+        time_source.now = 10000
+        self.assertEqual(len(manager.expire()), 1)
+
+    def test_default_resolution_is_one_millisecond(self):
+        time_source = ManualTimeSource(TimeUnit.NANOS)
+        manager = TimeoutManager(time_source)
+        manager.track(1, TimeoutSpecification(60000))
+        # a minute of nanoseconds would be 6e10 wheel ticks at a resolution of one unit
+        time_source.now = 59999 * 1000000
+        started = time.monotonic()
+        self.assertEqual(manager.expire(), [])
+        time_source.now = 60000 * 1000000
+        self.assertEqual(len(manager.expire()), 1)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class TestNextDeadline(TimeoutManagerMixIn):
+    def test_next_deadline_is_not_after_first_timeout(self):
+        self.assertLessEqual(self.manager.next_deadline(), 10)
@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from free_range.core.common.timeouts import TimingWheel
+
+
+class TimingWheelMixIn(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimingWheel(now=0, resolution=1, slot_bits=2, levels=3)
+
+
+class TestSchedule(TimingWheelMixIn):
+    def test_expires_at_deadline(self):
+        self.wheel.schedule('a', 3)
+        self.assertEqual(self.wheel.advance(2), [])
+        self.assertEqual(self.wheel.advance(3), ['a'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_overdue_key_expires_on_next_advance(self):
+        self.wheel.schedule('a', -5)
+        self.assertEqual(self.wheel.advance(0), ['a'])
+
+    def test_reschedule_replaces_deadline(self):
+        self.wheel.schedule('a', 3)
+        self.wheel.schedule('a', 10)
+        self.assertEqual(self.wheel.advance(9), [])
+        self.assertEqual(self.wheel.advance(10), ['a'])
+
+    def test_deadline_beyond_wheel_range(self):
+        self.wheel.schedule('a', 1000)  # the wheel spans 64 ticks
+        self.assertEqual(self.wheel.advance(999), [])
+        self.assertEqual(self.wheel.advance(1000), ['a'])
+
+    def test_fractional_deadlines_never_expire_early(self):
+        wheel = TimingWheel(now=0, resolution=10)
+        wheel.schedule('a', 15)
+        self.assertEqual(wheel.advance(15), [])
+        self.assertEqual(wheel.advance(20), ['a'])
+
+    def test_matches_naive_expiry(self):
+        rng = random.Random(42)
+        deadlines = {key: rng.randrange(1, 500) for key in range(300)}
+        for key, deadline in deadlines.items():
+            self.wheel.schedule(key, deadline)
+        now = 0
+        while now < 520:
+            now += rng.randrange(1, 7)
+            for key in self.wheel.advance(now):
+                self.assertLessEqual(deadlines.pop(key), now)
+            self.assertTrue(all(d > now for d in deadlines.values()))
+        self.assertEqual(deadlines, {})
+
+
+class TestCancel(TimingWheelMixIn):
+    def test_cancelled_key_does_not_expire(self):
+        self.wheel.schedule('a', 3)
+        self.assertTrue(self.wheel.cancel('a'))
+        self.assertEqual(self.wheel.advance(10), [])
+
+    def test_cancel_unknown_key(self):
+        self.assertFalse(self.wheel.cancel('a'))
+
+    def test_cancel_after_cascade(self):
+        self.wheel.schedule('a', 20)
+        self.wheel.advance(17)
+        self.assertTrue(self.wheel.cancel('a'))
+        self.assertEqual(self.wheel.advance(30), [])
+
+
+class TestNextDeadline(TimingWheelMixIn):
+    def test_empty_wheel(self):
+        self.assertIsNone(self.wheel.next_deadline())
+
+    def test_never_after_next_expiry(self):
+        self.wheel.schedule('a', 2)
+        self.assertLessEqual(self.wheel.next_deadline(), 2)
+
+    def test_overdue(self):
+        self.wheel.schedule('a', 0)
+        self.assertEqual(self.wheel.next_deadline(), 0)
+
+    def test_earlier_schedule_lowers_cached_bound(self):
+        self.wheel.schedule('far', 40)
+        self.assertLessEqual(self.wheel.next_deadline(), 40)
+        self.wheel.schedule('near', 1)
+        self.assertLessEqual(self.wheel.next_deadline(), 1)
+
+    def test_never_after_next_expiry_as_time_passes(self):
+        deadlines = {key: deadline for key, deadline in enumerate((3, 9, 17, 30))}
+        for key, deadline in deadlines.items():
+            self.wheel.schedule(key, deadline)
+        for now in range(31):
+            for key in self.wheel.advance(now):
+                del deadlines[key]
+            if deadlines:
+                self.assertLessEqual(self.wheel.next_deadline(), min(deadlines.values()))
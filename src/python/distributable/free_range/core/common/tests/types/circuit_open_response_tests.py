@@ -0,0 +1,25 @@
+import unittest
+
+from free_range.core.common.exceptions import CircuitOpen, RequestRejected
+from free_range.core.common.types import CircuitOpenResponse, RejectedResponse, ResponseState
+
+
+class TestCircuitOpenResponse(unittest.TestCase):
+    def setUp(self):
+        self.rejection = CircuitOpen('circuit to svc open', request_id=7)
+        self.response = CircuitOpenResponse(self.rejection, 7, 10, 10)
+
+    def test_is_a_valid_rejection(self):
+        self.assertIsInstance(self.response, RejectedResponse)
+        self.assertTrue(self.response.is_valid())
+        self.assertIs(self.response.state, ResponseState.REJECTED)
+        self.assertTrue(self.response.is_completed)
+
+    def test_response_raises_circuit_open(self):
+        with self.assertRaises(CircuitOpen) as raised:
+            self.response.response
+        self.assertIsInstance(raised.exception, RequestRejected)
+        self.assertIs(raised.exception.caused_by, self.rejection)
+
+    def test_has_no_instance_dict(self):
+        self.assertFalse(hasattr(self.response, '__dict__'))
@@ -0,0 +1,44 @@
+import unittest
+
+from free_range.core.common.exceptions import FreeRangeFrameworkBug, RequestRejected
+from free_range.core.common.types import RejectedResponse, ResponseState
+
+
+class RejectedResponseMixIn(unittest.TestCase):
+    def setUp(self):
+        self.rejection = RequestRejected('queue full', request_id=7)
+        self.full = RejectedResponse(self.rejection, 7, 10, 10)
+        self.no_rejection = RejectedResponse(None, 7, 10, 10)
+        self.no_id = RejectedResponse(self.rejection, None, 10, 10)
+
+
+class TestIsValid(RejectedResponseMixIn):
+    def test_full_case_is_valid(self):
+        self.assertTrue(self.full.is_valid())
+
+    def test_no_rejection_case_is_not_valid(self):
+        self.assertFalse(self.no_rejection.is_valid())
+
+    def test_no_id_case_is_not_valid(self):
+        self.assertFalse(self.no_id.is_valid())
+
+
+class TestState(RejectedResponseMixIn):
+    def test_full_case_is_rejected_and_completed(self):
+        self.assertIs(self.full.state, ResponseState.REJECTED)
+        self.assertTrue(self.full.is_completed)
+        self.assertEqual(self.full.rejection, self.rejection)
+
+    def test_try_response(self):
+        self.assertEqual(self.full.try_response(), (ResponseState.REJECTED, self.rejection))
+
+
+class TestResponse(RejectedResponseMixIn):
+    def test_full_case_raises_the_rejection(self):
+        self.assertFalse(self.full.has_response)
+        with self.assertRaises(RequestRejected):
+            self.full.response
+
+    def test_no_rejection_case_has_no_response(self):
+        with self.assertRaises(FreeRangeFrameworkBug):
+            self.no_rejection.response
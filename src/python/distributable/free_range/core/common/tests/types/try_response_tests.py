@@ -0,0 +1,68 @@
+import unittest
+
+from free_range.core.common.types import (
+    FrameworkErrorResponse, IncompleteResponse, MaybeResponse, NormalResponse,
+    RemoteErrorResponse, ResponseState, TimeoutResponse,
+)
+
+
+class TestState(unittest.TestCase):
+    def test_normal_response_is_ok(self):
+        self.assertIs(NormalResponse('response', 10, 11, 'req-1').state, ResponseState.OK)
+
+    def test_remote_error_response_is_remote_error(self):
+        self.assertIs(RemoteErrorResponse('error', 'req-1', 1, 2).state,
+                      ResponseState.REMOTE_ERROR)
+
+    def test_framework_error_response_is_framework_error(self):
+        self.assertIs(FrameworkErrorResponse(Exception('boom'), 'req-1', 1, 2).state,
+                      ResponseState.FRAMEWORK_ERROR)
+
+    def test_timeout_response_is_timeout(self):
+        self.assertIs(TimeoutResponse('timeout', 'req-1', 1, 2).state, ResponseState.TIMEOUT)
+
+    def test_incomplete_response_is_incomplete(self):
+        self.assertIs(IncompleteResponse('req-1', 1).state, ResponseState.INCOMPLETE)
+
+    def test_bad_timing_is_invalid(self):
+        self.assertIs(NormalResponse('response', 10, 9, 'req-1').state, ResponseState.INVALID)
+
+    def test_state_is_cached(self):
+        maybe = MaybeResponse('req-1', 10)
+        self.assertIs(maybe.state, maybe.state)
+
+
+class TestTryResponse(unittest.TestCase):
+    def test_normal_response(self):
+        self.assertEqual(NormalResponse('response', 10, 11, 'req-1').try_response(),
+                         (ResponseState.OK, 'response'))
+
+    def test_remote_error_response(self):
+        self.assertEqual(RemoteErrorResponse('error', 'req-1', 1, 2).try_response(),
+                         (ResponseState.REMOTE_ERROR, 'error'))
+
+    def test_framework_error_response(self):
+        boom = Exception('boom')
+        self.assertEqual(FrameworkErrorResponse(boom, 'req-1', 1, 2).try_response(),
+                         (ResponseState.FRAMEWORK_ERROR, boom))
+
+    def test_timeout_response(self):
+        self.assertEqual(TimeoutResponse('timeout', 'req-1', 1, 2).try_response(),
+                         (ResponseState.TIMEOUT, 'timeout'))
+
+    def test_incomplete_response(self):
+        self.assertEqual(IncompleteResponse('req-1', 1).try_response(),
+                         (ResponseState.INCOMPLETE, None))
+
+    def test_invalid_response_does_not_raise(self):
+        self.assertEqual(NormalResponse(None, 10, 11, 'req-1').try_response(),
+                         (ResponseState.INVALID, None))
+
+
+class TestSlots(unittest.TestCase):
+    def test_responses_have_no_instance_dict(self):
+        for maybe in (MaybeResponse('req-1', 1), NormalResponse('response', 1, 2, 'req-1'),
+                      RemoteErrorResponse('error', 'req-1', 1, 2),
+                      FrameworkErrorResponse(Exception('boom'), 'req-1', 1, 2),
+                      TimeoutResponse('timeout', 'req-1', 1, 2), IncompleteResponse('req-1', 1)):
+            self.assertFalse(hasattr(maybe, '__dict__'), type(maybe).__name__)
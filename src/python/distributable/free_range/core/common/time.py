@@ -1,25 +1,192 @@
 """
 Common framework classes having to do with time and timeouts
 """
-from datetime import datetime
 from enum import Enum
+from time import monotonic_ns, time
 
 
 class TimeUnit(Enum):
+    """
+    The units of the timestamps produced by a time source.
+    """
     MILLIS = 'millis'
+    MICROS = 'micros'
+    NANOS = 'nanos'
     TICKS = 'ticks'
 
+    @property
+    def units_per_milli(self):
+        """
+        :return: the number of units in one millisecond. A tick of a coordinated tick time source
+            stands in for one millisecond.
+        """
+        return _UNITS_PER_MILLI[self]
+
+    def to_millis(self, value):
+        """
+        :param value: a time difference in this unit
+        :return: the same difference in milliseconds
+        """
+        units_per_milli = _UNITS_PER_MILLI[self]
+        return value if units_per_milli == 1 else value / units_per_milli
+
+    def from_millis(self, millis):
+        """
+        :param millis: a time difference in milliseconds
+        :return: the same difference in this unit
+        """
+        return millis * _UNITS_PER_MILLI[self]
+
+
+_UNITS_PER_MILLI = {
+    TimeUnit.MILLIS: 1,
+    TimeUnit.MICROS: 1000,
+    TimeUnit.NANOS: 1000000,
+    TimeUnit.TICKS: 1,
+}
+
+_NANOS_PER_UNIT = {
+    TimeUnit.MILLIS: 1000000,
+    TimeUnit.MICROS: 1000,
+    TimeUnit.NANOS: 1,
+}
+
 
 class TimeSource:
-    """The default time source: based on datetime.now()"""
+    """The default time source: wall clock milliseconds (as with datetime.now()). Not monotonic"""
 
     def timestamp(self):
-        return datetime.now().timestamp() * 1000.0
+        return time() * 1000.0
 
     @property
     def units(self):
         return TimeUnit.MILLIS
 
+    @property
+    def is_monotonic(self):
+        """
+        :return: True if the timestamps never go backwards (e.g. on an NTP clock step)
+        """
+        return False
+
+
+class MonotonicTimeSource(TimeSource):
+    """
+    A time source based on time.monotonic_ns(). Produces integer timestamps that never go
+    backwards, so response times computed from it are never negative.
+    The timestamps have no relation to the wall clock and are only comparable within a process.
+    """
+
+    def __init__(self, units=TimeUnit.MILLIS):
+        """
+        :param units: TimeUnit.MILLIS, TimeUnit.MICROS or TimeUnit.NANOS
+        """
+        if units not in _NANOS_PER_UNIT:
+            raise ValueError(f'Unsupported monotonic time source units: {units}')
+        self._units = units
+        self._nanos_per_unit = _NANOS_PER_UNIT[units]
+
+    def timestamp(self):
+        return monotonic_ns() // self._nanos_per_unit
+
+    @property
+    def units(self):
+        return self._units
+
+    @property
+    def is_monotonic(self):
+        return True
+
+
+class CachedTimeSource(TimeSource):
+    """
+    A coarse clock for hot paths. It reads an underlying time source only when refreshed, which
+    a control loop does once per poll iteration, so that every timestamp taken while handling
+    the messages of one iteration costs an attribute read.
+    """
+
+    def __init__(self, source=None):
+        """
+        :param source: the time source to cache. Defaults to a MonotonicTimeSource.
+        """
+        self._source = source or MonotonicTimeSource()
+        self._timestamp = self._source.timestamp()
+
+    def refresh(self):
+        """
+        Reads the underlying time source.
+        :return: the new cached timestamp
+        """
+        self._timestamp = self._source.timestamp()
+        return self._timestamp
+
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def units(self):
+        return self._source.units
+
+    @property
+    def is_monotonic(self):
+        return self._source.is_monotonic
+
+
+class TickTimeSource(TimeSource):
+    """
+    A virtual clock measured in ticks, which only moves when advanced. Used in testing, typically
+    as the local view of a network coordinated clock, so that timeout scenarios run as fast as the
+    ticks can be coordinated instead of in real time.
+    A constant skew can be applied to simulate a node whose clock is off.
+    """
+
+    def __init__(self, tick=0, skew=0):
+        """
+        :param tick: the initial tick
+        :param skew: the number of ticks added to every timestamp of this clock
+        """
+        self._tick = tick
+        self._skew = skew
+
+    def timestamp(self):
+        return self._tick + self._skew
+
+    @property
+    def units(self):
+        return TimeUnit.TICKS
+
+    @property
+    def is_monotonic(self):
+        return True
+
+    @property
+    def tick(self):
+        """
+        :return: the current tick, without skew
+        """
+        return self._tick
+
+    @property
+    def skew(self):
+        return self._skew
+
+    def advance(self, ticks=1):
+        """
+        :param ticks: the number of ticks to move forward
+        :return: the new tick
+        """
+        return self.set_tick(self._tick + ticks)
+
+    def set_tick(self, tick):
+        """
+        :param tick: the new tick. Must not be before the current tick.
+        :return: the new tick
+        """
+        if tick < self._tick:
+            raise ValueError(f'Tick time cannot go backwards: {tick} < {self._tick}')
+        self._tick = tick
+        return tick
+
 
 class TimeoutSpecification:
     """
@@ -29,5 +196,63 @@ class TimeoutSpecification:
     Technically, they are expressed as "time source ticks" which are always milliseconds except
     when a specialized network coordinated tme source is used in testing.
     """
-    pass  # fixme: timeout specification: time + time source
 
+    def __init__(self, duration, time_source=None):
+        """
+        :param duration: the timeout duration, in the units of the time source
+        :param time_source: the time source the duration is expressed in. If omitted, the
+            duration is in milliseconds.
+        """
+        if duration is None or duration < 0:
+            raise ValueError(f'Invalid timeout duration: {duration}')
+        self._duration = duration
+        self._time_source = time_source
+
+    def __str__(self):
+        return str({'type': type(self),
+                    'state': {'duration': self._duration, 'units': self.units}})
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @property
+    def time_source(self):
+        return self._time_source
+
+    @property
+    def units(self):
+        return self._time_source.units if self._time_source else TimeUnit.MILLIS
+
+    def duration_in(self, units):
+        """
+        :param units: a TimeUnit
+        :return: the duration converted to the given units
+        """
+        own_units = self.units
+        if units is own_units:
+            return self._duration
+        return units.from_millis(own_units.to_millis(self._duration))
+
+    def deadline(self, start, units=None):
+        """
+        :param start: the timestamp at which the timed interaction started
+        :param units: the units of start. Defaults to the units of this specification.
+        :return: the timestamp at which the interaction times out
+        """
+        return start + (self._duration if units is None else self.duration_in(units))
+
+    def is_expired(self, start, now=None):
+        """
+        :param start: the timestamp at which the timed interaction started
+        :param now: the current timestamp. Defaults to reading the time source, or a
+            MonotonicTimeSource in milliseconds, which the default start timestamps of the
+            framework come from, when the specification has none.
+        :return: True if the timeout elapsed
+        """
+        if now is None:
+            now = (self._time_source or _DEFAULT_TIME_SOURCE).timestamp()
+        return now >= start + self._duration
+
+
+_DEFAULT_TIME_SOURCE = MonotonicTimeSource()
@@ -0,0 +1,249 @@
+"""
+Deadline tracking for in-flight interactions.
+The control plane keeps a deadline for every pending request and must notice expired ones on
+each control loop tick, without a timer per request and without scanning all pending requests.
+"""
+from free_range.core.common.time import MonotonicTimeSource
+from free_range.core.common.types import TimeoutResponse
+
+
+class TimingWheel:
+    """
+    A hierarchical timing wheel. Keys are scheduled against a deadline timestamp and are returned
+    by advance() once the time passes the deadline.
+    Level 0 has one slot per tick (a tick being `resolution` time source units). Each higher level
+    has slots covering a whole rotation of the level below. Entries on higher levels cascade down
+    when the wheel reaches their slot, so scheduling, cancelling and expiring are all O(1) per
+    key, and advancing costs O(1) per elapsed tick.
+    Deadlines are rounded up to whole ticks, so keys never expire early and at most one tick late.
+    """
+
+    def __init__(self, now=0, resolution=1, slot_bits=8, levels=4):
+        """
+        :param now: the current timestamp
+        :param resolution: the length of a tick, in time source units
+        :param slot_bits: log2 of the number of slots per level
+        :param levels: the number of levels. Deadlines further away than
+            2 ** (slot_bits * levels) ticks are parked on the top level until they come in range.
+        """
+        self._resolution = resolution
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._levels = [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._max_delta = (1 << (slot_bits * levels)) - 1
+        self._tick = int(now // resolution)
+        self._overdue = {}
+        self._slot_by_key = {}
+        # a tick at or before the next expiry, kept so that next_deadline() only scans level 0
+        # again once the wheel moved past it
+        self._horizon = self._tick
+
+    def __len__(self):
+        return len(self._slot_by_key)
+
+    def __contains__(self, key):
+        return key in self._slot_by_key
+
+    def schedule(self, key, deadline):
+        """
+        Schedules a key to expire at a deadline, replacing any earlier schedule of the same key.
+        :param key: any hashable key, typically a request ID
+        :param deadline: the timestamp after which the key expires
+        """
+        if key in self._slot_by_key:
+            self.cancel(key)
+        tick = int(-(-deadline // self._resolution))
+        if tick <= self._tick:
+            self._overdue[key] = tick
+            self._slot_by_key[key] = self._overdue
+        else:
+            self._place(key, tick)
+            if tick < self._horizon:
+                self._horizon = tick
+
+    def cancel(self, key):
+        """
+        :param key: a scheduled key
+        :return: True if the key was scheduled and is now cancelled
+        """
+        slot = self._slot_by_key.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def advance(self, now):
+        """
+        Moves the wheel forward in time.
+        :param now: the current timestamp
+        :return: a list of the keys whose deadline passed, in no particular order
+        """
+        slot_by_key = self._slot_by_key
+        expired = list(self._overdue)
+        if expired:
+            for key in expired:
+                del slot_by_key[key]
+            self._overdue = {}
+        target = int(now // self._resolution)
+        mask = self._mask
+        level0 = self._levels[0]
+        while self._tick < target:
+            if not slot_by_key:
+                self._tick = target  # nothing pending: jump straight to the target
+                break
+            tick = self._tick = self._tick + 1
+            if not tick & mask:
+                self._cascade(tick)
+            slot = level0[tick & mask]
+            if slot:
+                level0[tick & mask] = {}
+                expired.extend(slot)
+                for key in slot:
+                    del slot_by_key[key]
+        return expired
+
+    def next_deadline(self):
+        """
+        A cheap lower bound for the next expiry, meant for computing poll timeouts. Looks at most
+        one level 0 rotation ahead, and only when the wheel moved past the previous answer.
+        :return: a timestamp at or before the next expiry, or None if nothing is scheduled
+        """
+        if self._overdue:
+            return self._tick * self._resolution
+        if not self._slot_by_key:
+            return None
+        if self._horizon <= self._tick:
+            level0 = self._levels[0]
+            mask = self._mask
+            tick = self._tick + 1
+            while not level0[tick & mask] and tick & mask:
+                tick += 1
+            self._horizon = tick
+        return self._horizon * self._resolution
+
+    def _place(self, key, tick):
+        delta = min(tick - self._tick, self._max_delta)
+        level = 0
+        shift = 0
+        while delta >> (shift + self._bits):
+            level += 1
+            shift += self._bits
+        slot = self._levels[level][((self._tick + delta) >> shift) & self._mask]
+        slot[key] = tick
+        self._slot_by_key[key] = slot
+
+    def _cascade(self, tick):
+        """
+        Redistributes the higher level slots that the wheel reached at this tick. Called whenever
+        a level 0 rotation completes.
+        """
+        bits = self._bits
+        mask = self._mask
+        for level in range(1, len(self._levels)):
+            shift = bits * level
+            if tick & ((1 << shift) - 1):
+                break
+            slots = self._levels[level]
+            index = (tick >> shift) & mask
+            slot = slots[index]
+            if slot:
+                slots[index] = {}
+                for key, deadline_tick in slot.items():
+                    # a deadline at this very tick lands in the level 0 slot expired next
+                    self._place(key, deadline_tick)
+
+
+def millisecond_resolution(time_source):
+    """
+    :return: a timing wheel tick of one millisecond, in the units of the time source
+    """
+    return time_source.units.from_millis(1)
+
+
+class TimeoutManager:
+    """
+    Tracks the timeouts of in-flight requests on a TimingWheel driven by a time source, and turns
+    the expired ones into TimeoutResponse objects in batches, once per control loop tick.
+    """
+
+    def __init__(self, time_source=None, resolution=None):
+        """
+        :param time_source: the time source used for deadlines. Defaults to a MonotonicTimeSource.
+        :param resolution: the timing wheel tick length, in time source units. Defaults to one
+            millisecond, so that advancing costs the same whatever the time source units.
+        """
+        self._time_source = time_source or MonotonicTimeSource()
+        if resolution is None:
+            resolution = millisecond_resolution(self._time_source)
+        self._wheel = TimingWheel(self._time_source.timestamp(), resolution)
+        self._tracked = {}
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def __contains__(self, request_id):
+        return request_id in self._tracked
+
+    @property
+    def time_source(self):
+        return self._time_source
+
+    def track(self, request_id, timeout, start=None):
+        """
+        Starts tracking the timeout of a request.
+        :param request_id: the request ID
+        :param timeout: a TimeoutSpecification
+        :param start: the interaction start timestamp. Defaults to now.
+        """
+        if start is None:
+            start = self._time_source.timestamp()
+        self._tracked[request_id] = (timeout, start)
+        self._wheel.schedule(request_id, timeout.deadline(start, self._time_source.units))
+
+    def cancel(self, request_id):
+        """
+        Stops tracking a request, typically because its response arrived.
+        :param request_id: the request ID
+        :return: True if the request was tracked
+        """
+        if self._tracked.pop(request_id, None) is None:
+            return False
+        self._wheel.cancel(request_id)
+        return True
+
+    def expire_request(self, request_id, now=None):
+        """
+        Times a request out right away, regardless of its deadline. Used for cancellation.
+        :param request_id: the request ID
+        :param now: the current timestamp. Defaults to reading the time source.
+        :return: a TimeoutResponse, or None if the request is not tracked
+        """
+        tracked = self._tracked.pop(request_id, None)
+        if tracked is None:
+            return None
+        self._wheel.cancel(request_id)
+        if now is None:
+            now = self._time_source.timestamp()
+        timeout, start = tracked
+        return TimeoutResponse(timeout, request_id, start, now)
+
+    def expire(self, now=None):
+        """
+        Collects the requests whose timeout elapsed. They are no longer tracked afterwards.
+        :param now: the current timestamp. Defaults to reading the time source.
+        :return: a list of TimeoutResponse, one per expired request
+        """
+        if now is None:
+            now = self._time_source.timestamp()
+        tracked = self._tracked
+        responses = []
+        for request_id in self._wheel.advance(now):
+            timeout, start = tracked.pop(request_id)
+            responses.append(TimeoutResponse(timeout, request_id, start, now))
+        return responses
+
+    def next_deadline(self):
+        """
+        :return: a timestamp at or before the next timeout, or None if nothing is tracked
+        """
+        return self._wheel.next_deadline()
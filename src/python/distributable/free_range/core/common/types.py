@@ -1,18 +1,40 @@
 """
 Core types used throughout the framework
 """
+from enum import IntEnum
+
 from free_range.core.common.exceptions import (
-    FreeRangeError, FreeRangeFrameworkBug, RemoteError, ResponseTimeout,
+    CircuitOpen, FreeRangeError, FreeRangeFrameworkBug, RemoteError, RequestRejected,
+    ResponseTimeout,
 )
 
 
+class ResponseState(IntEnum):
+    """
+    The state tag of a MaybeResponse. Computed once per response and cached, so that hot loops
+    can branch on it (see MaybeResponse.try_response()) without walking the response properties
+    or constructing exceptions.
+    """
+    INVALID = 0
+    INCOMPLETE = 1
+    OK = 2
+    REMOTE_ERROR = 3
+    FRAMEWORK_ERROR = 4
+    TIMEOUT = 5
+    REJECTED = 6
+
+
 class MaybeResponse:
     """
     This is the base class of all remote response types.
     RPC pattern interactions always produce a MaybeResponse.
     Other interaction patterns may produce a MaybeResponse depending on the specific interaction
     contract.
+    Timestamps are in the units of the time source that produced them (millis by default) and
+    may be int or float. Response times are simply the difference, in the same units.
     """
+    __slots__ = ('_request_id', '_interaction_start_timestamp', '_received_timestamp', '_state')
+    _valid_state = ResponseState.INCOMPLETE  # the state of a response that passes is_valid()
 
     def __init__(self, request_id=None, interaction_start_timestamp=None, received_timestamp=None):
         """
@@ -24,6 +46,7 @@ class MaybeResponse:
         self._request_id = str(request_id) if request_id else None
         self._interaction_start_timestamp = interaction_start_timestamp
         self._received_timestamp = received_timestamp
+        self._state = None
 
     def __str__(self):
         return str({'type': type(self),
@@ -47,15 +70,47 @@ class MaybeResponse:
                              'A response can only be obtained from a NormalResponse.',
                              caused_by=None, request_id=self._request_id, response=self)
 
+    @property
+    def state(self):
+        """
+        :return: the ResponseState of this response. Computed on first access and cached.
+        """
+        state = self._state
+        if state is None:
+            state = self._state = (self._valid_state if self.is_valid()
+                                   else ResponseState.INVALID)
+        return state
+
+    def try_response(self):
+        """
+        A non-raising alternative to the response property, intended for hot loops that want to
+        branch on the outcome without constructing exceptions.
+        :return: a (state, value) tuple. The value is the response for ResponseState.OK, the
+            error, framework error, timeout or rejection object for the corresponding failure
+            states, and None for ResponseState.INCOMPLETE and ResponseState.INVALID.
+        """
+        state = self.state
+        return state, (self._state_value() if state is not ResponseState.INVALID else None)
+
+    def _state_value(self):
+        """
+        :return: the value that try_response() pairs with the state of a valid response
+        """
+        return None
+
     def _error_check(self):
-        if not self.is_valid():
+        state = self.state
+        if state is ResponseState.INVALID:
             raise FreeRangeFrameworkBug('Invalid MaybeResponse state', request_id=self.request_id,
                                         caused_by=None, response=self)
-        if self.timeout:
+        if state is ResponseState.TIMEOUT:
             raise ResponseTimeout(caused_by=self.timeout, request_id=self.request_id, response=self)
-        if self.error:
+        if state is ResponseState.REMOTE_ERROR:
             raise RemoteError(caused_by=self.error, request_id=self.request_id, response=self)
-        if not self.is_completed:
+        if state is ResponseState.REJECTED:
+            raise self._rejection_type(caused_by=self.rejection, request_id=self.request_id,
+                                       response=self)
+        if state is ResponseState.INCOMPLETE or state is ResponseState.FRAMEWORK_ERROR:
             raise FreeRangeError('Request is not complete yet', caused_by=None,
                                  request_id=self._request_id, response=self)
 
@@ -80,13 +135,20 @@ class MaybeResponse:
         """
         return None
 
+    @property
+    def rejection(self):
+        """
+        :return: the reason the request was rejected without being sent, if it was. None otherwise
+        """
+        return None
+
     @property
     def is_completed(self):
         """
         :return: True if the interaction completed. False means that no response was received yet,
             but also not timeout or remote error occurred.
         """
-        return self.has_response or self.timeout or self.error
+        return False
 
     @property
     def response_time_millis(self):
@@ -107,22 +169,27 @@ class MaybeResponse:
     def request_id(self):
         return self._request_id
 
+    @property
+    def interaction_start_timestamp(self):
+        return self._interaction_start_timestamp
+
+    @property
+    def received_timestamp(self):
+        return self._received_timestamp
+
     def is_valid(self):
         """
         Validates that the MaybeResponse has a valid state that ay be returned to the
         application code.
+        The base class carries no response, error or timeout, so only the timing data needs
+        checking. Subclasses that carry an outcome override this.
         :return: True if valid else False
         """
-        exclusive_conditions = [self.has_response, self.error, self.framework_error,
-                                self.timeout]
-        true_conditions_count = sum(map(lambda c: 1 if c else 0, exclusive_conditions))
-        if true_conditions_count > 1:
-            return False  # conditions must be mutually exclusive
-        if (self._interaction_start_timestamp is None
-                or self._received_timestamp and
-                self._received_timestamp - self._interaction_start_timestamp < 0):
-            return False  # A completed response must have valid response time data
-        return True
+        start = self._interaction_start_timestamp
+        if start is None:
+            return False
+        received = self._received_timestamp
+        return received is None or received >= start  # completed must have valid timing data
 
     def _timing_error_check(self):
         if not self._is_required_timing_valid():
@@ -133,12 +200,9 @@ class MaybeResponse:
         Checks validity of response time data when required. Does not raise exceptions.
         :return: True if response time data is present and valid
         """
-        try:
-            return (self._interaction_start_timestamp is not None
-                    and self._received_timestamp is not None
-                    and self._received_timestamp >= self._interaction_start_timestamp)
-        except AttributeError:
-            return False
+        start = self._interaction_start_timestamp
+        received = self._received_timestamp
+        return start is not None and received is not None and received >= start
 
     def _response_time_millis_or_none(self):
         """
@@ -156,17 +220,23 @@ class NormalResponse(MaybeResponse):
     """
     Represents a normal response from a remote interaction. Constructed by the framework.
     """
+    __slots__ = ('_response', '_cached')
+    _valid_state = ResponseState.OK
+
     def __init__(self, response_object,
-                 interaction_start_timestamp, received_timestamp, request_id=None):
+                 interaction_start_timestamp, received_timestamp, request_id=None, cached=False):
         """
         :param response_object: the actual response returned from the remote party
         :param interaction_start_timestamp: the start time of the interaction in millis
         :param received_timestamp: the timestamp that the response was received by the control
             plane, which can be quite before it was actually returned to the application code.
         :param request_id: the ID or the interaction ID that expected this response
+        :param cached: True if the response was served from a client-side cache rather than by a
+            remote call
       """
         super().__init__(request_id, interaction_start_timestamp, received_timestamp)
         self._response = response_object
+        self._cached = cached
 
     def __str__(self):
         return str({'type': type(self),
@@ -175,18 +245,27 @@ class NormalResponse(MaybeResponse):
 
     @property
     def response(self):
-        # this line
+        if self.state is ResponseState.OK:
+            return self._response
         self._error_check()
-        return self._response
 
     @property
     def has_response(self):
         return True
 
+    @property
+    def cached(self):
+        """
+        :return: True if the response came from a client-side cache, in which case the response
+            time is the time of the cache lookup
+        """
+        return self._cached
+
     def is_valid(self):
-        return (super().is_valid()
-                and not self._response_is_none()
-                and self._is_required_timing_valid())
+        return self._response is not None and self._is_required_timing_valid()
+
+    def _state_value(self):
+        return self._response
 
     @property
     def is_completed(self):
@@ -208,6 +287,9 @@ class RemoteErrorResponse(MaybeResponse):
     Represents an error response with an error object as defined in the interaction contract.
     Constructed by the framework.
     """
+    __slots__ = ('_error',)
+    _valid_state = ResponseState.REMOTE_ERROR
+
     def __init__(self, error_object, request_id=None,
                  interaction_start_timestamp=None, received_timestamp=None):
         super().__init__(request_id=request_id,
@@ -225,6 +307,10 @@ class RemoteErrorResponse(MaybeResponse):
     def error(self):
         return self._error
 
+    @property
+    def is_completed(self):
+        return bool(self._error)
+
     @property
     def response_time_millis(self):
         """
@@ -242,7 +328,10 @@ class RemoteErrorResponse(MaybeResponse):
             return self._received_timestamp - self._interaction_start_timestamp
 
     def is_valid(self):
-        return self._error and self._is_required_timing_valid() and self.request_id
+        return bool(self._error) and self._is_required_timing_valid() and bool(self._request_id)
+
+    def _state_value(self):
+        return self._error
 
 
 class FrameworkErrorResponse(MaybeResponse):
@@ -251,6 +340,9 @@ class FrameworkErrorResponse(MaybeResponse):
     This may or may not have happened after a response was received from the remote service.
     Constructed by the framework.
     """
+    __slots__ = ('_framework_error',)
+    _valid_state = ResponseState.FRAMEWORK_ERROR
+
     def __init__(self, error_object, request_id=None,
                  interaction_start_timestamp=None, received_timestamp=None):
         """
@@ -275,9 +367,12 @@ class FrameworkErrorResponse(MaybeResponse):
         return self._framework_error
 
     def is_valid(self):
-        return (issubclass(type(self._framework_error), Exception)
-                and self.request_id is not None
-                and (self._timing_data_is_valid()))
+        return (isinstance(self._framework_error, Exception)
+                and self._request_id is not None
+                and self._timing_data_is_valid())
+
+    def _state_value(self):
+        return self._framework_error
 
     def _timing_data_is_valid(self):
         return self._interaction_start_timestamp is None or self._received_timestamp is None or \
@@ -308,6 +403,9 @@ class TimeoutResponse(MaybeResponse):
     If a response of any kind is received after the interaction timed out, then the
     response time is recorded but the return value is discarded.
     """
+    __slots__ = ('_timeout',)
+    _valid_state = ResponseState.TIMEOUT
+
     def __init__(self, timeout_object, request_id=None,
                  interaction_start_timestamp=None, received_timestamp=None):
         super().__init__(request_id, interaction_start_timestamp, received_timestamp)
@@ -318,12 +416,75 @@ class TimeoutResponse(MaybeResponse):
     def timeout(self):
         return self._timeout
 
+    @property
+    def is_completed(self):
+        return bool(self._timeout)
+
+    def is_valid(self):
+        return bool(self._timeout) and super().is_valid()
+
+    def _state_value(self):
+        return self._timeout
+
+
+class RejectedResponse(MaybeResponse):
+    """
+    Represents a request that was refused on the client side and never sent, for lack of
+    capacity. Completes right away, so that a caller under back-pressure learns about it without
+    waiting out a timeout. Constructed by the framework.
+    """
+    __slots__ = ('_rejection',)
+    _valid_state = ResponseState.REJECTED
+    _rejection_type = RequestRejected  # raised on access to the response
+
+    def __init__(self, rejection, request_id=None,
+                 interaction_start_timestamp=None, received_timestamp=None):
+        """
+        :param rejection: the reason for the rejection, typically a RequestRejected exception
+        :param request_id: the ID of the rejected request
+        :param interaction_start_timestamp: the timestamp when the interaction started
+        :param received_timestamp: the timestamp of the rejection
+        """
+        super().__init__(request_id, interaction_start_timestamp, received_timestamp)
+        self._rejection = rejection
+
+    def __str__(self):
+        return str({'type': type(self),
+                    'state': {'request_id': self.request_id,
+                              'rejection': str(self._rejection)}})
+
+    @property
+    def rejection(self):
+        return self._rejection
+
+    @property
+    def is_completed(self):
+        return True
+
+    def is_valid(self):
+        return (self._rejection is not None and self._request_id is not None
+                and super().is_valid())
+
+    def _state_value(self):
+        return self._rejection
+
+
+class CircuitOpenResponse(RejectedResponse):
+    """
+    Represents a request that was refused on the client side and never sent, because the circuit
+    breaker of its destination was open. Constructed by the framework.
+    """
+    __slots__ = ()
+    _rejection_type = CircuitOpen
+
 
 class IncompleteResponse(MaybeResponse):
     """
     A typed incomplete interaction response. Constructed by the framework when checking for a
     response that was not received nor timed out.
     """
+    __slots__ = ()
+
     def __init__(self, request_id=None,
                  interaction_start_timestamp=None):
         super().__init__(request_id, interaction_start_timestamp, None)
@@ -0,0 +1,219 @@
+"""
+The single threaded control loop of a container or client process.
+One thread polls every registered socket, dispatches the readable ones to their handlers and runs
+the timers that are due. The poll timeout is set by the earliest timer, so the loop neither spins
+while idle nor sleeps past a deadline.
+"""
+from heapq import heappop, heappush
+from itertools import count
+from math import ceil
+
+import zmq
+
+from free_range.core.common.time import CachedTimeSource
+
+DEFAULT_BUDGET = 64
+DEFAULT_MAX_WAIT_MILLIS = 1000
+
+
+class Timer:
+    """
+    A callback scheduled on a ControlLoop.
+    """
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ControlLoop:
+    """
+    Dispatches readable sockets to handlers and runs timers, on the calling thread.
+    A handler handles one message per call. A readable socket is handed to its handler again
+    while it has messages, up to `budget` messages per iteration, so that a flood on one socket
+    cannot starve the other sockets or the timers.
+    The loop time source is a CachedTimeSource refreshed after each poll and again before the
+    timers run: handlers and timers get their timestamps for the cost of an attribute read.
+    Loop lag, the delay between the deadline of a timer and the moment it actually runs, is
+    measured for every timer.
+    """
+
+    def __init__(self, time_source=None, budget=DEFAULT_BUDGET):
+        """
+        :param time_source: the time source of the loop, cached unless it is a CachedTimeSource
+            already. Defaults to a MonotonicTimeSource.
+        :param budget: the maximum number of messages handled per socket per iteration
+        """
+        if not isinstance(time_source, CachedTimeSource):
+            time_source = CachedTimeSource(time_source)
+        self._time_source = time_source
+        self._units = self._time_source.units
+        self._budget = budget
+        self._poller = zmq.Poller()
+        self._handlers = {}
+        self._timers = []  # heap of (deadline, sequence, Timer)
+        self._sequence = count()
+        self._running = False
+        self._iterations = 0
+        self._budget_exhaustions = 0
+        self._timers_run = 0
+        self._timer_lag_total = 0
+        self._timer_lag_max = 0
+
+    @property
+    def time_source(self):
+        return self._time_source
+
+    @property
+    def iterations(self):
+        return self._iterations
+
+    @property
+    def budget_exhaustions(self):
+        """
+        :return: the number of times a socket still had messages when its budget ran out
+        """
+        return self._budget_exhaustions
+
+    @property
+    def timers_run(self):
+        return self._timers_run
+
+    @property
+    def timer_lag_max(self):
+        """
+        :return: the largest loop lag observed, in time source units
+        """
+        return self._timer_lag_max
+
+    @property
+    def timer_lag_mean(self):
+        """
+        :return: the mean loop lag, in time source units
+        """
+        return self._timer_lag_total / self._timers_run if self._timers_run else 0
+
+    @property
+    def pending_timers(self):
+        return sum(1 for _, _, timer in self._timers if not timer.cancelled)
+
+    def reset_statistics(self):
+        self._iterations = 0
+        self._budget_exhaustions = 0
+        self._timers_run = 0
+        self._timer_lag_total = 0
+        self._timer_lag_max = 0
+
+    def register(self, socket, handler):
+        """
+        :param socket: a ZMQ socket, or anything zmq.Poller accepts such as a file descriptor
+        :param handler: a callable taking the socket, handling one message
+        """
+        self._handlers[socket] = handler
+        self._poller.register(socket, zmq.POLLIN)
+
+    def unregister(self, socket):
+        if self._handlers.pop(socket, None) is not None:
+            self._poller.unregister(socket)
+
+    def call_at(self, deadline, callback, *args):
+        """
+        :param deadline: the time source timestamp at or after which to run the callback
+        :param callback: the callable to run
+        :return: a Timer, which can be cancelled
+        """
+        timer = Timer(deadline, callback, args)
+        heappush(self._timers, (deadline, next(self._sequence), timer))
+        return timer
+
+    def call_later(self, delay_millis, callback, *args):
+        """
+        :param delay_millis: the delay before running the callback, in milliseconds
+        :param callback: the callable to run
+        :return: a Timer, which can be cancelled
+        """
+        return self.call_at(self._time_source.timestamp() + self._units.from_millis(delay_millis),
+                            callback, *args)
+
+    def run(self):
+        """
+        Runs iterations until stop() is called, typically by a handler or a timer.
+        """
+        self._running = True
+        while self._running:
+            self.run_once()
+
+    def stop(self):
+        self._running = False
+
+    def run_once(self, max_wait_millis=DEFAULT_MAX_WAIT_MILLIS):
+        """
+        Runs one iteration: waits for readable sockets until the next timer is due, dispatches
+        the readable sockets within budget, then runs the timers that are due.
+        :param max_wait_millis: the maximum time to wait when no timer is due sooner
+        :return: the number of messages handled
+        """
+        handled = 0
+        events = self._poller.poll(self._poll_timeout(max_wait_millis))
+        if events:
+            self._time_source.refresh()
+            for socket, _ in events:
+                handled += self._dispatch(socket)
+        self._run_timers(self._time_source.refresh())
+        self._iterations += 1
+        return handled
+
+    def _poll_timeout(self, max_wait_millis):
+        """
+        :return: the poll timeout in whole milliseconds, rounded up so that a poll never returns
+            before the next deadline
+        """
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heappop(timers)
+        if not timers:
+            return max_wait_millis
+        remaining = timers[0][0] - self._time_source.refresh()
+        if remaining <= 0:
+            return 0
+        return min(max_wait_millis, ceil(self._units.to_millis(remaining)))
+
+    def _dispatch(self, socket):
+        handler = self._handlers.get(socket)
+        if handler is None:
+            return 0  # unregistered by an earlier handler of this iteration
+        if not isinstance(socket, zmq.Socket):
+            handler(socket)
+            return 1
+        budget = self._budget
+        handled = 0
+        while True:
+            handler(socket)
+            handled += 1
+            if not socket.get(zmq.EVENTS) & zmq.POLLIN:
+                return handled
+            if handled >= budget:
+                self._budget_exhaustions += 1
+                return handled
+
+    def _run_timers(self, now):
+        timers = self._timers
+        # timers scheduled while running timers wait for the next iteration, so that a timer
+        # rescheduling itself without delay cannot keep the loop here
+        last = next(self._sequence)
+        while timers and timers[0][0] <= now and timers[0][1] < last:
+            deadline, _, timer = heappop(timers)
+            if timer.cancelled:
+                continue
+            lag = now - deadline
+            self._timers_run += 1
+            self._timer_lag_total += lag
+            if lag > self._timer_lag_max:
+                self._timer_lag_max = lag
+            timer.callback(*timer.args)
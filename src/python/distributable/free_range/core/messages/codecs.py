@@ -0,0 +1,278 @@
+"""
+Message codecs, selected by message type ID.
+A message may be serialized to several formats, or never serialized at all, so the format is a
+property of the message type: every type ID maps to a codec. Decoded messages are LazyMessage
+proxies which parse their body on first attribute access, so a component that only forwards or
+routes a message never pays for deserializing it, and re-encoding an unparsed message hands back
+the bytes it was received as.
+"""
+import json
+import pickle
+import struct
+
+from google.protobuf import descriptor_pool, message_factory
+
+from free_range.core.common.exceptions import MalformedMessage
+
+# the type ID of messages of unregistered types, which are pickled
+DEFAULT_TYPE_ID = 0
+
+_TYPE_ID = struct.Struct('!H')
+
+
+class Codec:
+    """
+    Serializes messages of one type to bytes and back.
+    """
+
+    def encode(self, message):
+        """
+        :return: the message serialized to a bytes-like object
+        """
+        raise NotImplementedError()
+
+    def decode(self, body):
+        """
+        :param body: a bytes-like object, possibly a memoryview
+        :return: the message
+        """
+        raise NotImplementedError()
+
+    def canonical(self, message):
+        """
+        Serializes a message so that equal messages give equal bytes, e.g. for use as a cache
+        key. Slower than encode() for formats where the order of map entries can vary.
+        :return: the canonical serialization of the message, as a bytes-like object
+        """
+        return self.encode(message)
+
+
+class ProtobufCodec(Codec):
+    def __init__(self, message_class):
+        """
+        :param message_class: a protobuf message class, e.g. addressbook_pb2.Person
+        """
+        self._message_class = message_class
+
+    @property
+    def message_class(self):
+        return self._message_class
+
+    def encode(self, message):
+        return message.SerializeToString()
+
+    def canonical(self, message):
+        return message.SerializeToString(deterministic=True)
+
+    def decode(self, body):
+        return self._message_class.FromString(body)
+
+
+class PickleCodec(Codec):
+    def encode(self, message):
+        return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, body):
+        return pickle.loads(body)
+
+
+class JsonCodec(Codec):
+    def encode(self, message):
+        return json.dumps(message, separators=(',', ':')).encode('UTF-8')
+
+    def canonical(self, message):
+        return json.dumps(message, separators=(',', ':'), sort_keys=True).encode('UTF-8')
+
+    def decode(self, body):
+        return json.loads(bytes(body))
+
+
+class RawCodec(Codec):
+    """
+    For bodies that are bytes already.
+    """
+
+    def encode(self, message):
+        return message
+
+    def decode(self, body):
+        return body
+
+
+class LazyMessage:
+    """
+    A received message that is parsed on first attribute access, then behaves like the parsed
+    message for attribute access. Messages are immutable, so the received bytes remain a valid
+    serialization of the message and are reused whenever it is encoded again.
+    Only attribute access is forwarded: use the message property for anything else.
+    """
+    __slots__ = ('_type_id', '_codec', '_encoded', '_message', '_decoded')
+
+    def __init__(self, type_id, codec, encoded):
+        """
+        :param type_id: the message type ID
+        :param codec: the Codec of the type
+        :param encoded: the message as encoded by CodecRegistry.dumps(), type ID prefix included
+        """
+        self._type_id = type_id
+        self._codec = codec
+        self._encoded = encoded
+        self._message = None
+        self._decoded = False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            # private names, including unset slots, are never forwarded, so that lookups made on
+            # a bare instance (by copy or pickle) cannot recurse through the message property
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+    def __reduce__(self):
+        return LazyMessage, (self._type_id, self._codec, bytes(self._encoded))
+
+    def __eq__(self, other):
+        if isinstance(other, LazyMessage):
+            other = other.message
+        return self.message == other
+
+    def __hash__(self):
+        return hash(self.message)
+
+    def __repr__(self):
+        state = repr(self._message) if self._decoded else f'{len(self._encoded)} bytes, not parsed'
+        return f'LazyMessage(type_id={self._type_id}, {state})'
+
+    @property
+    def type_id(self):
+        return self._type_id
+
+    @property
+    def is_decoded(self):
+        return self._decoded
+
+    @property
+    def encoded(self):
+        """
+        :return: the message as it was received, type ID prefix included
+        """
+        return self._encoded
+
+    @property
+    def body(self):
+        """
+        :return: the serialized message, without the type ID prefix
+        """
+        return memoryview(self._encoded)[_TYPE_ID.size:]
+
+    @property
+    def message(self):
+        """
+        :return: the parsed message, parsing it if not done yet
+        :raises: MalformedMessage if the body cannot be parsed
+        """
+        if not self._decoded:
+            try:
+                self._message = self._codec.decode(self.body)
+            except Exception as ex:
+                raise MalformedMessage(f'Cannot decode a message of type {self._type_id}',
+                                       caused_by=ex) from ex
+            self._decoded = True
+        return self._message
+
+
+class CodecRegistry:
+    """
+    Maps message type IDs to codecs, and message classes to type IDs.
+    dumps() and loads() frame a message body with its type ID, and can be used as the encode and
+    decode functions of a transport. Messages of unregistered classes are pickled under
+    DEFAULT_TYPE_ID, so that any message, including exceptions sent back as remote errors, can be
+    encoded.
+    """
+
+    def __init__(self, default_codec=None):
+        """
+        :param default_codec: the codec of messages of unregistered classes. Defaults to pickle.
+        """
+        self._codecs = {DEFAULT_TYPE_ID: default_codec or PickleCodec()}
+        self._type_ids = {}
+        self._prefixes = {DEFAULT_TYPE_ID: _TYPE_ID.pack(DEFAULT_TYPE_ID)}
+
+    def register(self, type_id, codec, message_class=None):
+        """
+        :param type_id: the message type ID, between 1 and 65535
+        :param codec: the Codec of messages of that type
+        :param message_class: the class of messages of that type, so that dumps() can find their
+            type ID. Optional for types that are only decoded.
+        """
+        if not 0 < type_id <= 0xffff:
+            raise ValueError(f'Invalid message type ID: {type_id}')
+        self._codecs[type_id] = codec
+        self._prefixes[type_id] = _TYPE_ID.pack(type_id)
+        if message_class is not None:
+            self._type_ids[message_class] = type_id
+
+    def register_protobuf(self, type_id, message_class):
+        """
+        :param type_id: the message type ID
+        :param message_class: a protobuf message class, or the full name of a message type in the
+            default descriptor pool, whose class is then looked up once and cached
+        :return: the message class
+        """
+        if isinstance(message_class, str):
+            descriptor = descriptor_pool.Default().FindMessageTypeByName(message_class)
+            if hasattr(message_factory, 'GetMessageClass'):
+                message_class = message_factory.GetMessageClass(descriptor)
+            else:  # protobuf before 4.21
+                message_class = message_factory.MessageFactory().GetPrototype(descriptor)
+        self.register(type_id, ProtobufCodec(message_class), message_class)
+        return message_class
+
+    def codec(self, type_id):
+        """
+        :raises: KeyError if the type ID is not registered
+        """
+        return self._codecs[type_id]
+
+    def type_id_of(self, message):
+        """
+        :return: the type ID of a message, DEFAULT_TYPE_ID for unregistered classes
+        """
+        if isinstance(message, LazyMessage):
+            return message.type_id
+        return self._type_ids.get(type(message), DEFAULT_TYPE_ID)
+
+    def dumps(self, message):
+        """
+        :param message: a message, possibly a LazyMessage
+        :return: the type ID prefix followed by the serialized message. A LazyMessage is returned
+            as it was received, without being serialized again.
+        """
+        if isinstance(message, LazyMessage):
+            return message.encoded
+        type_id = self._type_ids.get(type(message), DEFAULT_TYPE_ID)
+        return self._prefixes[type_id] + self._codecs[type_id].encode(message)
+
+    def canonical_dumps(self, message):
+        """
+        Like dumps(), with the canonical serialization of the codec (see Codec.canonical()).
+        :param message: a message, possibly a LazyMessage
+        :return: the type ID prefix followed by the canonical serialization of the message
+        """
+        if isinstance(message, LazyMessage):
+            type_id = message.type_id
+            message = message.message
+        else:
+            type_id = self._type_ids.get(type(message), DEFAULT_TYPE_ID)
+        return self._prefixes[type_id] + self._codecs[type_id].canonical(message)
+
+    def loads(self, encoded):
+        """
+        :param encoded: a bytes-like object produced by dumps()
+        :return: a LazyMessage, not parsed yet
+        :raises: MalformedMessage if the type ID is missing or unknown
+        """
+        try:
+            type_id = _TYPE_ID.unpack_from(encoded)[0]
+            return LazyMessage(type_id, self._codecs[type_id], encoded)
+        except (struct.error, KeyError) as ex:
+            raise MalformedMessage('Missing or unknown message type ID', caused_by=ex) from None
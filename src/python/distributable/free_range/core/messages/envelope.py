@@ -0,0 +1,270 @@
+"""
+The control plane envelope that every message carries, next to its application body.
+The envelope starts with a fixed-layout header holding everything routing needs: the format
+version, the message mode, the reply state, the message type and the numeric IDs of the
+destination and source components. A router reads the header alone, with peek_header(), and
+never parses the rest of the envelope or the application body.
+The header is followed by the request ID as a varint, then by the optional sections present in
+the header flags, in flag order, each as a varint length followed by opaque bytes: meta,
+pass-through state, control headers and tracing data.
+The value or error of a message is the application body, which travels separately (e.g. as the
+next ZMQ frame) and is left to a codec.
+The transports do not carry envelopes yet: the DEALER/ROUTER framing still sends the request ID
+and reply state as frames of their own.
+"""
+import struct
+from enum import IntEnum, IntFlag
+
+from free_range.core.common.exceptions import MalformedMessage
+
+VERSION = 1
+
+# version, mode, flags, state, type ID, to ID, from ID
+HEADER = struct.Struct('!BBBBHII')
+
+
+class MessageMode(IntEnum):
+    REQUEST = 1
+    REPLY = 2
+    ONE_WAY = 3
+    CONTROL = 4  # for the control plane: routed to a controller, not to a component
+
+
+class EnvelopeFlags(IntFlag):
+    """
+    The optional sections present in an envelope.
+    """
+    META = 1
+    PASS_THROUGH = 2
+    CONTROL_HEADERS = 4
+    TRACING = 8
+
+
+# plain ints: IntFlag arithmetic is far too slow for the hot path
+_SECTION_FLAGS = tuple(int(flag) for flag in EnvelopeFlags)
+_UNKNOWN_FLAGS = ~sum(_SECTION_FLAGS)
+_MODES = {int(mode): mode for mode in MessageMode}
+
+
+def encode_varint(value, out):
+    """
+    Appends an unsigned LEB128 varint, as used by protobuf.
+    :param value: a non-negative int
+    :param out: a bytearray
+    """
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, offset):
+    """
+    :param buffer: a bytes-like object
+    :param offset: the offset of the varint
+    :return: a (value, offset after the varint) tuple
+    :raises: MalformedMessage if the buffer ends inside the varint
+    """
+    value = 0
+    shift = 0
+    try:
+        while True:
+            byte = buffer[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, offset
+            shift += 7
+    except IndexError:
+        raise MalformedMessage('Truncated varint') from None
+
+
+def peek_header(buffer):
+    """
+    Reads the fixed header of an encoded envelope, and nothing else.
+    :param buffer: a bytes-like object starting with an encoded envelope
+    :return: a (version, mode, flags, state, type_id, to_id, from_id) tuple of ints
+    :raises: MalformedMessage if the buffer is too short or of an unknown version
+    """
+    try:
+        header = HEADER.unpack_from(buffer)
+    except struct.error as ex:
+        raise MalformedMessage('Truncated envelope header', caused_by=ex) from None
+    if header[0] != VERSION:
+        raise MalformedMessage(f'Unsupported envelope version {header[0]}')
+    return header
+
+
+class Envelope:
+    """
+    The decoded form of an envelope. Component IDs are small integers, interned by the control
+    plane, so that the header has a fixed layout. Sections are opaque bytes, or None if absent.
+    A decoded envelope reads its header and request ID at once, and its sections on first
+    access: a message that is only routed or correlated never pays for them.
+    """
+    __slots__ = ('mode', 'to_id', 'from_id', 'request_id', 'type_id', 'state', '_sections',
+                 '_flags', '_buffer', '_offset')
+
+    def __init__(self, mode, to_id, from_id=0, request_id=0, type_id=0, state=0, meta=None,
+                 pass_through=None, control_headers=None, tracing=None):
+        """
+        :param mode: a MessageMode
+        :param to_id: the ID of the destination component
+        :param from_id: the ID of the source component
+        :param request_id: the non-negative request ID that a reply correlates with
+        :param type_id: the ID of the application body type, used to pick its codec
+        :param state: the ResponseState of a reply, 0 otherwise
+        """
+        self.mode = mode
+        self.to_id = to_id
+        self.from_id = from_id
+        self.request_id = request_id
+        self.type_id = type_id
+        self.state = state
+        self._set_sections((meta, pass_through, control_headers, tracing))
+
+    def __eq__(self, other):
+        if not isinstance(other, Envelope):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in _FIELDS)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in _FIELDS)
+        return f'Envelope({fields})'
+
+    @property
+    def sections(self):
+        """
+        :return: the sections, in flag order
+        :raises: MalformedMessage if the sections of a decoded envelope are truncated
+        """
+        sections = self._sections
+        if sections is None:
+            sections = self._decode_sections()
+        return sections
+
+    @property
+    def flags(self):
+        """
+        :return: the EnvelopeFlags of the sections present
+        """
+        return EnvelopeFlags(self._flags)
+
+    def encode(self):
+        """
+        :return: the encoded envelope, as bytes
+        """
+        parts = [HEADER.pack(VERSION, self.mode, self._flags, self.state, self.type_id,
+                             self.to_id, self.from_id),
+                 _varint_bytes(self.request_id)]
+        if self._flags:
+            for section in self.sections:
+                if section is not None:
+                    parts.append(_varint_bytes(len(section)))
+                    parts.append(section)
+        return b''.join(parts)
+
+    @classmethod
+    def decode(cls, buffer):
+        """
+        Decodes the header and the request ID of an envelope. The sections are decoded on first
+        access, so the buffer must not change until then.
+        :param buffer: a bytes-like object holding an encoded envelope
+        :return: the Envelope
+        :raises: MalformedMessage if the header or the request ID are not valid
+        """
+        _, mode, flags, state, type_id, to_id, from_id = peek_header(buffer)
+        if flags & _UNKNOWN_FLAGS:
+            # an unknown section could not be skipped, so the sections after it would be wrong
+            raise MalformedMessage(f'Unknown envelope flags {flags & _UNKNOWN_FLAGS:#x}')
+        message_mode = _MODES.get(mode)
+        if message_mode is None:
+            raise MalformedMessage(f'Unknown message mode {mode}')
+        offset = HEADER.size
+        try:
+            request_id = buffer[offset]
+        except IndexError:
+            raise MalformedMessage('Truncated varint') from None
+        if request_id < 0x80:
+            offset += 1
+        else:
+            request_id, offset = decode_varint(buffer, offset)
+        envelope = cls.__new__(cls)
+        envelope.mode = message_mode
+        envelope.to_id = to_id
+        envelope.from_id = from_id
+        envelope.request_id = request_id
+        envelope.type_id = type_id
+        envelope.state = state
+        envelope._flags = flags
+        if flags:
+            envelope._sections = None
+            envelope._buffer = buffer
+            envelope._offset = offset
+        else:
+            envelope._sections = _NO_SECTIONS
+            envelope._buffer = None
+        return envelope
+
+    def _set_sections(self, sections):
+        meta, pass_through, control_headers, tracing = sections
+        self._sections = sections
+        self._flags = ((meta is not None) | (pass_through is not None) << 1
+                       | (control_headers is not None) << 2 | (tracing is not None) << 3)
+        self._buffer = None
+
+    def _decode_sections(self):
+        buffer = self._buffer
+        offset = self._offset
+        flags = self._flags
+        sections = []
+        for flag in _SECTION_FLAGS:
+            if flags & flag:
+                length, offset = decode_varint(buffer, offset)
+                if offset + length > len(buffer):
+                    raise MalformedMessage('Truncated envelope section')
+                sections.append(bytes(buffer[offset:offset + length]))
+                offset += length
+            else:
+                sections.append(None)
+        self._sections = sections = tuple(sections)
+        self._buffer = None
+        return sections
+
+
+def _section(index, name):
+    def get(self):
+        sections = self._sections
+        if sections is None:
+            sections = self._decode_sections()
+        return sections[index]
+
+    def set(self, value):
+        sections = list(self.sections)
+        sections[index] = value
+        self._set_sections(tuple(sections))
+
+    return property(get, set, doc=f'the {name} section, as bytes, or None if absent')
+
+
+Envelope.meta = _section(0, 'meta')
+Envelope.pass_through = _section(1, 'pass-through state')
+Envelope.control_headers = _section(2, 'control headers')
+Envelope.tracing = _section(3, 'tracing data')
+
+_FIELDS = ('mode', 'to_id', 'from_id', 'request_id', 'type_id', 'state', 'meta',
+           'pass_through', 'control_headers', 'tracing')
+_NO_SECTIONS = (None, None, None, None)
+
+
+_ONE_BYTE_VARINTS = tuple(bytes((value,)) for value in range(0x80))
+
+
+def _varint_bytes(value):
+    if value < 0x80:
+        return _ONE_BYTE_VARINTS[value]
+    if value < 0x4000:
+        return bytes(((value & 0x7f) | 0x80, value >> 7))
+    out = bytearray()
+    encode_varint(value, out)
+    return out
@@ -0,0 +1,133 @@
+import copy
+import pickle
+import unittest
+
+from google.protobuf import descriptor_pb2
+
+from free_range.core.common.exceptions import MalformedMessage
+from free_range.core.messages.codecs import (
+    DEFAULT_TYPE_ID, CodecRegistry, JsonCodec, LazyMessage, RawCodec,
+)
+
+PERSON_TYPE_ID = 1
+
+
+class CountingDecodes:
+    def __init__(self, codec):
+        self.codec = codec
+        self.decodes = 0
+
+    def encode(self, message):
+        return self.codec.encode(message)
+
+    def decode(self, body):
+        self.decodes += 1
+        return self.codec.decode(body)
+
+
+class CodecRegistryMixIn(unittest.TestCase):
+    def setUp(self):
+        self.registry = CodecRegistry()
+        # any protobuf message type does, this one ships with protobuf
+        self.message_class = self.registry.register_protobuf(PERSON_TYPE_ID,
+                                                             descriptor_pb2.DescriptorProto)
+        self.message = descriptor_pb2.DescriptorProto(name='Person')
+
+
+class TestCodecRegistry(CodecRegistryMixIn):
+    def test_protobuf_round_trip(self):
+        decoded = self.registry.loads(self.registry.dumps(self.message))
+        self.assertEqual(decoded.type_id, PERSON_TYPE_ID)
+        self.assertEqual(decoded.name, 'Person')
+        self.assertIsInstance(decoded.message, self.message_class)
+
+    def test_protobuf_class_by_name_is_cached(self):
+        registry = CodecRegistry()
+        message_class = registry.register_protobuf(2, 'google.protobuf.DescriptorProto')
+        self.assertIs(registry.codec(2).message_class, message_class)
+        self.assertEqual(registry.type_id_of(message_class()), 2)
+
+    def test_unregistered_types_are_pickled(self):
+        error = ValueError('failed')
+        decoded = self.registry.loads(self.registry.dumps(error))
+        self.assertEqual(decoded.type_id, DEFAULT_TYPE_ID)
+        self.assertEqual(decoded.args, ('failed',))
+
+    def test_json_and_raw_codecs(self):
+        self.registry.register(2, JsonCodec(), dict)
+        self.registry.register(3, RawCodec(), bytes)
+        self.assertEqual(self.registry.loads(self.registry.dumps({'a': 1})), {'a': 1})
+        self.assertEqual(bytes(self.registry.loads(self.registry.dumps(b'raw')).message), b'raw')
+
+    def test_decodes_from_memoryview(self):
+        encoded = memoryview(self.registry.dumps(self.message))
+        self.assertEqual(self.registry.loads(encoded).name, 'Person')
+
+    def test_invalid_type_id(self):
+        with self.assertRaises(ValueError):
+            self.registry.register(0, RawCodec())
+
+    def test_unknown_type_id(self):
+        with self.assertRaises(MalformedMessage):
+            self.registry.loads(b'\x00\x63body')
+
+    def test_missing_type_id(self):
+        with self.assertRaises(MalformedMessage):
+            self.registry.loads(b'\x00')
+
+
+class TestLazyMessage(CodecRegistryMixIn):
+    def setUp(self):
+        super().setUp()
+        self.codec = CountingDecodes(self.registry.codec(PERSON_TYPE_ID))
+        self.registry.register(PERSON_TYPE_ID, self.codec, self.message_class)
+        self.encoded = self.registry.dumps(self.message)
+        self.decoded = self.registry.loads(self.encoded)
+
+    def test_parsed_on_first_attribute_access_only(self):
+        self.assertFalse(self.decoded.is_decoded)
+        self.assertEqual(self.codec.decodes, 0)
+        self.assertEqual(self.decoded.name, 'Person')
+        self.assertEqual(self.decoded.name, 'Person')
+        self.assertTrue(self.decoded.is_decoded)
+        self.assertEqual(self.codec.decodes, 1)
+
+    def test_forwarding_reuses_the_received_bytes(self):
+        self.assertIs(self.registry.dumps(self.decoded), self.encoded)
+        self.decoded.name
+        self.assertIs(self.registry.dumps(self.decoded), self.encoded)
+        self.assertEqual(self.codec.decodes, 1)
+
+    def test_equality(self):
+        self.assertEqual(self.decoded, self.message)
+        self.assertEqual(self.decoded, self.registry.loads(self.encoded))
+
+    def test_malformed_body(self):
+        decoded = LazyMessage(PERSON_TYPE_ID, self.codec, b'\x00\x01\xff')
+        with self.assertRaises(MalformedMessage):
+            decoded.name
+
+    def test_pickle_and_copy(self):
+        decoded = self.registry.loads(self.registry.dumps(ValueError('failed')))
+        for clone in (pickle.loads(pickle.dumps(decoded)), copy.copy(decoded),
+                      copy.deepcopy(decoded)):
+            self.assertFalse(clone.is_decoded)
+            self.assertEqual(clone.args, ('failed',))
+            self.assertEqual(bytes(clone.encoded), bytes(decoded.encoded))
+
+    def test_private_names_are_not_forwarded(self):
+        with self.assertRaises(AttributeError):
+            self.decoded._fields
+        self.assertFalse(self.decoded.is_decoded)
+
+
+class TestCanonicalDumps(CodecRegistryMixIn):
+    def test_json_keys_are_sorted(self):
+        self.registry.register(2, JsonCodec(), dict)
+        self.assertEqual(self.registry.canonical_dumps({'b': 1, 'a': 2}),
+                         self.registry.canonical_dumps({'a': 2, 'b': 1}))
+
+    def test_lazy_message_is_serialized_like_its_message(self):
+        decoded = self.registry.loads(self.registry.dumps(self.message))
+        self.assertEqual(self.registry.canonical_dumps(decoded),
+                         self.registry.canonical_dumps(self.message))
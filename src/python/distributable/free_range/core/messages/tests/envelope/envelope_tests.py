@@ -0,0 +1,116 @@
+import unittest
+
+from free_range.core.common.exceptions import MalformedMessage
+from free_range.core.common.types import ResponseState
+from free_range.core.messages.envelope import (
+    HEADER, Envelope, EnvelopeFlags, MessageMode, decode_varint, encode_varint, peek_header,
+)
+
+
+class EnvelopeMixIn(unittest.TestCase):
+    def setUp(self):
+        self.envelope = Envelope(MessageMode.REPLY, to_id=7, from_id=70000, request_id=300,
+                                 type_id=12, state=ResponseState.OK, meta=b'meta',
+                                 tracing=b'\x00' * 200)
+
+
+class TestVarint(unittest.TestCase):
+    def test_round_trip(self):
+        for value in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 - 1):
+            out = bytearray(b'x')
+            encode_varint(value, out)
+            self.assertEqual(decode_varint(out, 1), (value, len(out)))
+
+    def test_protobuf_compatible(self):
+        out = bytearray()
+        encode_varint(300, out)
+        self.assertEqual(bytes(out), b'\xac\x02')
+
+    def test_truncated(self):
+        with self.assertRaises(MalformedMessage):
+            decode_varint(b'\xac', 0)
+
+
+class TestEnvelope(EnvelopeMixIn):
+    def test_round_trip(self):
+        self.assertEqual(Envelope.decode(self.envelope.encode()), self.envelope)
+
+    def test_minimal_envelope(self):
+        envelope = Envelope(MessageMode.REQUEST, to_id=1)
+        encoded = envelope.encode()
+        self.assertEqual(len(encoded), HEADER.size + 1)
+        self.assertEqual(Envelope.decode(encoded), envelope)
+
+    def test_decoded_mode_is_a_message_mode(self):
+        self.assertIs(Envelope.decode(self.envelope.encode()).mode, MessageMode.REPLY)
+
+    def test_decode_from_memoryview(self):
+        encoded = memoryview(self.envelope.encode())
+        self.assertEqual(Envelope.decode(encoded), self.envelope)
+
+    def test_flags(self):
+        self.assertEqual(self.envelope.flags, EnvelopeFlags.META | EnvelopeFlags.TRACING)
+
+    def test_truncated_section(self):
+        envelope = Envelope.decode(self.envelope.encode()[:-1])
+        self.assertEqual(envelope.request_id, 300)
+        with self.assertRaises(MalformedMessage):
+            envelope.tracing
+
+    def test_sections_are_decoded_on_first_access(self):
+        encoded = bytearray(self.envelope.encode())
+        envelope = Envelope.decode(encoded)
+        encoded[-1] = 1
+        self.assertEqual(envelope.tracing, b'\x00' * 199 + b'\x01')
+        encoded[-1] = 2
+        self.assertEqual(envelope.tracing, b'\x00' * 199 + b'\x01')
+
+    def test_set_section(self):
+        envelope = Envelope.decode(self.envelope.encode())
+        envelope.meta = None
+        envelope.pass_through = b'state'
+        self.assertEqual(envelope.flags, EnvelopeFlags.PASS_THROUGH | EnvelopeFlags.TRACING)
+        decoded = Envelope.decode(envelope.encode())
+        self.assertEqual(decoded, envelope)
+        self.assertEqual(decoded.sections, (None, b'state', None, b'\x00' * 200))
+
+    def test_large_section(self):
+        self.envelope.control_headers = b'h' * 20000
+        self.assertEqual(Envelope.decode(self.envelope.encode()), self.envelope)
+
+    def test_unknown_flags(self):
+        encoded = bytearray(self.envelope.encode())
+        encoded[2] |= 0x10
+        with self.assertRaises(MalformedMessage):
+            Envelope.decode(encoded)
+
+    def test_unknown_mode(self):
+        encoded = bytearray(self.envelope.encode())
+        encoded[1] = 99
+        with self.assertRaises(MalformedMessage):
+            Envelope.decode(encoded)
+
+
+class TestPeekHeader(EnvelopeMixIn):
+    def test_reads_the_fixed_header(self):
+        version, mode, flags, state, type_id, to_id, from_id = peek_header(
+            self.envelope.encode())
+        self.assertEqual(version, 1)
+        self.assertEqual(mode, MessageMode.REPLY)
+        self.assertEqual(flags, EnvelopeFlags.META | EnvelopeFlags.TRACING)
+        self.assertEqual(state, ResponseState.OK)
+        self.assertEqual(type_id, 12)
+        self.assertEqual(to_id, 7)
+        self.assertEqual(from_id, 70000)
+
+    def test_ignores_what_follows_the_header(self):
+        encoded = self.envelope.encode()
+        self.assertEqual(peek_header(encoded[:HEADER.size])[5], 7)
+
+    def test_truncated_header(self):
+        with self.assertRaises(MalformedMessage):
+            peek_header(b'\x01\x01')
+
+    def test_unsupported_version(self):
+        with self.assertRaises(MalformedMessage):
+            peek_header(b'\x02' + self.envelope.encode()[1:])
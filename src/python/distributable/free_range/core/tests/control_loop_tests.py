@@ -0,0 +1,117 @@
+import time
+import unittest
+
+import zmq
+
+from free_range.core.client.tests.fakes import ManualTimeSource
+from free_range.core.control_loop import ControlLoop
+
+
+class ControlLoopMixIn(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.clock = ManualTimeSource(1000)
+        self.loop = ControlLoop(self.clock, budget=3)
+        self.received = []
+        self.senders = []
+
+    def tearDown(self):
+        for socket in self.senders:
+            socket.close(linger=0)
+        for socket in list(self.loop._handlers):
+            socket.close(linger=0)
+        self.context.term()
+
+    def pair(self, name):
+        receiver = self.context.socket(zmq.PAIR)
+        receiver.bind(f'inproc://control-loop-{name}')
+        sender = self.context.socket(zmq.PAIR)
+        sender.connect(f'inproc://control-loop-{name}')
+        self.senders.append(sender)
+        self.loop.register(receiver, lambda socket: self.received.append((name, socket.recv())))
+        return sender
+
+
+class TestDispatch(ControlLoopMixIn):
+    def test_dispatches_readable_sockets(self):
+        self.pair('a').send(b'1')
+        self.pair('b').send(b'2')
+        self.assertEqual(self.loop.run_once(100), 2)
+        self.assertEqual(sorted(self.received), [('a', b'1'), ('b', b'2')])
+
+    def test_budget_bounds_messages_per_socket_per_iteration(self):
+        flood = self.pair('flood')
+        quiet = self.pair('quiet')
+        for i in range(7):
+            flood.send(b'%d' % i)
+        quiet.send(b'q')
+        self.loop.run_once(100)
+        self.assertEqual(len(self.received), 4)
+        self.assertIn(('quiet', b'q'), self.received)
+        self.assertEqual(self.loop.budget_exhaustions, 1)
+        self.loop.run_once(100)
+        self.loop.run_once(100)
+        self.assertEqual(len(self.received), 8)
+
+    def test_unregister(self):
+        sender = self.pair('a')
+        socket = next(iter(self.loop._handlers))
+        self.loop.unregister(socket)
+        self.senders.append(socket)
+        sender.send(b'1')
+        self.assertEqual(self.loop.run_once(0), 0)
+
+
+class TestTimers(ControlLoopMixIn):
+    def test_timer_sets_poll_timeout(self):
+        self.loop.call_later(30, self.received.append, 'timer')
+        self.assertEqual(self.loop._poll_timeout(1000), 30)
+        self.clock.now = 1010
+        self.assertEqual(self.loop._poll_timeout(1000), 20)
+        self.assertEqual(self.loop._poll_timeout(5), 5)
+
+    def test_due_timer_runs_without_waiting(self):
+        self.loop.call_later(30, self.received.append, 'timer')
+        self.clock.now = 1030
+        started = time.monotonic()
+        self.loop.run_once(1000)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.received, ['timer'])
+
+    def test_timers_run_in_deadline_order(self):
+        self.loop.call_later(20, self.received.append, 'second')
+        self.loop.call_later(10, self.received.append, 'first')
+        self.loop.call_later(50, self.received.append, 'not yet')
+        self.clock.now = 1020
+        self.loop.run_once(0)
+        self.assertEqual(self.received, ['first', 'second'])
+        self.assertEqual(self.loop.pending_timers, 1)
+
+    def test_cancelled_timer_does_not_run(self):
+        self.loop.call_later(10, self.received.append, 'cancelled').cancel()
+        self.clock.now = 1010
+        self.loop.run_once(0)
+        self.assertEqual(self.received, [])
+
+    def test_immediate_reschedule_waits_for_next_iteration(self):
+        def reschedule():
+            self.received.append('tick')
+            self.loop.call_later(0, reschedule)
+        self.loop.call_later(0, reschedule)
+        self.loop.run_once(0)
+        self.loop.run_once(0)
+        self.assertEqual(self.received, ['tick', 'tick'])
+
+    def test_loop_lag(self):
+        self.loop.call_later(10, lambda: None)
+        self.loop.call_later(20, lambda: None)
+        self.clock.now = 1025
+        self.loop.run_once(0)
+        self.assertEqual(self.loop.timers_run, 2)
+        self.assertEqual(self.loop.timer_lag_max, 15)
+        self.assertEqual(self.loop.timer_lag_mean, 10)
+
+    def test_run_until_stopped(self):
+        self.loop.call_later(0, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(self.loop.iterations, 1)
@@ -0,0 +1,72 @@
+"""
+The child side of a supervisor: a component container process.
+A container is single threaded. It builds its handler, binds a RouterServer on the endpoint the
+supervisor gave it, and serves requests until it is terminated. Between requests, it answers the
+heartbeat pings of the supervisor on the control plane with its load (see heartbeat).
+"""
+import signal
+import struct
+from time import perf_counter
+
+import zmq
+
+from free_range.transport.zmq.dealer import RouterServer
+
+POLL_MILLIS = 100
+
+PING = b'ping'
+PONG = b'pong'
+# a pong is [PONG, the sequence frame of the ping, load]
+LOAD = struct.Struct('!d')
+
+
+def run_container(endpoint, handler_factory, control_endpoint=None, identity=None):
+    """
+    The main function of a container process.
+    :param endpoint: the endpoint to bind
+    :param handler_factory: a no-argument callable returning the request handler. It is called
+        in the container, so that no component state is shared with the supervisor.
+    :param control_endpoint: the control plane endpoint of the supervisor, or None for no
+        heartbeat
+    :param identity: the socket identity of the container on the control plane, as bytes
+    """
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is for the supervisor
+    # the context of the supervisor was forked with the process, and must not be used here
+    context = zmq.Context()
+    server = RouterServer(context, endpoint, handler_factory())
+    poller = zmq.Poller()
+    poller.register(server.socket, zmq.POLLIN)
+    control = None
+    if control_endpoint is not None:
+        control = context.socket(zmq.DEALER)
+        control.setsockopt(zmq.LINGER, 0)
+        control.setsockopt(zmq.IDENTITY, identity)
+        control.connect(control_endpoint)
+        poller.register(control, zmq.POLLIN)
+    busy = 0.0
+    since = perf_counter()
+    try:
+        while not stopped:
+            events = dict(poller.poll(POLL_MILLIS))
+            if control in events:
+                # answer every ping waiting, with the load since the previous pong
+                now = perf_counter()
+                load = LOAD.pack(min(1.0, busy / (now - since)) if now > since else 0.0)
+                busy = 0.0
+                since = now
+                while control.poll(0):
+                    kind, sequence = control.recv_multipart()
+                    if kind == PING:
+                        control.send_multipart([PONG, sequence, load])
+            if server.socket in events:
+                # one request message at a time, so that a ping waits for one request at most
+                started = perf_counter()
+                server.process(0, max_messages=1)
+                busy += perf_counter() - started
+    finally:
+        if control is not None:
+            control.close()
+        server.close()
+        context.term()
@@ -0,0 +1,208 @@
+"""
+Zombie detection by heartbeat, for up to thousands of children per supervisor.
+A zombie is a child process that is still running but no longer serves: stuck in a loop,
+deadlocked, or stopped. The monitor pings every child on the control plane and declares a child
+a zombie when its pong does not come back in time (see notes/supervisor.md). A child that has not
+answered any ping yet is still starting, and gets startup_millis for its first pong instead.
+All the ping and pong deadlines of all children are on one TimingWheel, and the pings that fall
+due together are handed out as one batch, so the cost of the monitor is a few dictionary
+operations per ping and does not depend on the number of children. A child that reports no load
+is pinged less and less often, down to one ping per max_interval_millis, so that idle children
+cost almost nothing. A busy child is pinged every min_interval_millis.
+Pongs carry the load and queue depth of the child, which the supervisor also uses for scaling.
+"""
+from free_range.core.common.time import MonotonicTimeSource
+from free_range.core.common.timeouts import TimingWheel
+
+DEFAULT_MIN_INTERVAL_MILLIS = 1000
+DEFAULT_MAX_INTERVAL_MILLIS = 30000
+DEFAULT_TIMEOUT_MILLIS = 5000
+DEFAULT_STARTUP_MILLIS = 30000
+DEFAULT_RESOLUTION_MILLIS = 10
+DEFAULT_BUSY_LOAD = 0.01
+
+
+class ChildHealth:
+    """
+    What the monitor knows about a child.
+    """
+    __slots__ = ('child', 'interval', 'sequence', 'awaiting_pong', 'ping_sent', 'last_pong',
+                 'round_trip', 'load', 'queue_depth')
+
+    def __init__(self, child, interval):
+        self.child = child
+        self.interval = interval
+        self.sequence = 0
+        self.awaiting_pong = False
+        self.ping_sent = None
+        self.last_pong = None
+        self.round_trip = None
+        self.load = None
+        self.queue_depth = None
+
+
+class HeartbeatMonitor:
+    """
+    Ping schedules and pong deadlines of children, driven by tick() from a control loop.
+    The monitor does not do any I/O: tick() returns the pings to send, and the owner reports the
+    pongs it receives with pong().
+    """
+
+    def __init__(self, time_source=None, min_interval_millis=DEFAULT_MIN_INTERVAL_MILLIS,
+                 max_interval_millis=DEFAULT_MAX_INTERVAL_MILLIS,
+                 timeout_millis=DEFAULT_TIMEOUT_MILLIS, resolution_millis=DEFAULT_RESOLUTION_MILLIS,
+                 busy_load=DEFAULT_BUSY_LOAD, startup_millis=DEFAULT_STARTUP_MILLIS):
+        """
+        :param time_source: the time source of the timestamps. Defaults to a MonotonicTimeSource.
+        :param min_interval_millis: the ping interval of busy children
+        :param max_interval_millis: the longest ping interval of idle children. The interval
+            doubles with each idle pong, from min_interval_millis up to this.
+        :param timeout_millis: the time a child has to answer a ping. A single threaded child
+            answers between requests, so this must be longer than the slowest request.
+        :param resolution_millis: the tick of the timing wheel. Deadlines falling in the same
+            tick are handled in the same batch.
+        :param busy_load: the load from which a child counts as busy
+        :param startup_millis: the time a child has to answer its first ping, which covers the
+            start of the child process. At least timeout_millis.
+        """
+        if not 0 < min_interval_millis <= max_interval_millis:
+            raise ValueError(f'Invalid ping intervals: min {min_interval_millis}, '
+                             f'max {max_interval_millis}')
+        self._time_source = time_source or MonotonicTimeSource()
+        units = self._time_source.units
+        self._min_interval = units.from_millis(min_interval_millis)
+        self._max_interval = units.from_millis(max_interval_millis)
+        self._timeout = units.from_millis(timeout_millis)
+        self._startup_timeout = units.from_millis(max(timeout_millis, startup_millis))
+        self._busy_load = busy_load
+        self._wheel = TimingWheel(self._time_source.timestamp(),
+                                  units.from_millis(resolution_millis))
+        self._children = {}
+        self._pings = 0
+        self._pongs = 0
+        self._batches = 0
+        self._zombies = 0
+
+    def __len__(self):
+        return len(self._children)
+
+    def __contains__(self, child):
+        return child in self._children
+
+    @property
+    def time_source(self):
+        return self._time_source
+
+    @property
+    def pings(self):
+        return self._pings
+
+    @property
+    def pongs(self):
+        """
+        :return: the number of pongs received in time
+        """
+        return self._pongs
+
+    @property
+    def batches(self):
+        """
+        :return: the number of non-empty ping batches returned by tick()
+        """
+        return self._batches
+
+    @property
+    def zombies(self):
+        return self._zombies
+
+    def add(self, child, now=None):
+        """
+        Starts monitoring a child. Its first ping is due after min_interval_millis, which gives
+        it time to start.
+        :param child: a hashable child key
+        :param now: the current timestamp. Defaults to the time source timestamp.
+        """
+        now = self._time_source.timestamp() if now is None else now
+        self._children[child] = ChildHealth(child, self._min_interval)
+        self._wheel.schedule(child, now + self._min_interval)
+
+    def remove(self, child):
+        """
+        Stops monitoring a child.
+        :return: the ChildHealth of the child, or None if it was not monitored
+        """
+        self._wheel.cancel(child)
+        return self._children.pop(child, None)
+
+    def health(self, child):
+        """
+        :return: the ChildHealth of a child, or None if it is not monitored
+        """
+        return self._children.get(child)
+
+    def next_deadline(self):
+        """
+        :return: a timestamp at or before the next ping or pong deadline, or None if there are
+            no children
+        """
+        return self._wheel.next_deadline()
+
+    def tick(self, now=None):
+        """
+        Sends the pings that are due and expires the pongs that are overdue.
+        :param now: the current timestamp. Defaults to the time source timestamp.
+        :return: a (pings, zombies) tuple. pings is a list of (child, sequence number) pairs, to
+            be sent by the caller, with each pong reporting its sequence number. zombies is a
+            list of the children whose pong is overdue, which are no longer monitored.
+        """
+        now = self._time_source.timestamp() if now is None else now
+        pings = []
+        zombies = []
+        children = self._children
+        wheel = self._wheel
+        timeout = self._timeout
+        startup_timeout = self._startup_timeout
+        for child in wheel.advance(now):
+            health = children[child]
+            if health.awaiting_pong:
+                del children[child]
+                zombies.append(child)
+                continue
+            health.sequence += 1
+            health.awaiting_pong = True
+            health.ping_sent = now
+            wheel.schedule(child, now + (timeout if health.last_pong is not None
+                                         else startup_timeout))
+            pings.append((child, health.sequence))
+        if pings:
+            self._pings += len(pings)
+            self._batches += 1
+        self._zombies += len(zombies)
+        return pings, zombies
+
+    def pong(self, child, sequence, load=0.0, queue_depth=0, now=None):
+        """
+        Records the pong of a child and schedules its next ping.
+        :param child: the child key
+        :param sequence: the sequence number of the ping
+        :param load: the fraction of the time the child was busy since its previous pong
+        :param queue_depth: the number of requests waiting for the child
+        :param now: the current timestamp. Defaults to the time source timestamp.
+        :return: True if the pong was expected, False if it is stale or from an unknown child
+        """
+        health = self._children.get(child)
+        if health is None or not health.awaiting_pong or sequence != health.sequence:
+            return False
+        now = self._time_source.timestamp() if now is None else now
+        health.awaiting_pong = False
+        health.last_pong = now
+        health.round_trip = now - health.ping_sent
+        health.load = load
+        health.queue_depth = queue_depth
+        if load >= self._busy_load or queue_depth:
+            health.interval = self._min_interval
+        else:
+            health.interval = min(health.interval * 2, self._max_interval)
+        self._wheel.schedule(child, now + health.interval)
+        self._pongs += 1
+        return True
@@ -0,0 +1,446 @@
+"""
+A supervisor runs a component in several single threaded container processes on this host,
+behind a load balancer, so that a CPU bound component can use every core without any
+concurrency code of its own.
+The supervisor binds a ROUTER frontend, which DEALER clients (see transport.zmq.dealer) connect to
+as if it were the component itself. Each request message goes to the container with the fewest
+outstanding requests, over a DEALER socket per container, and the replies are routed back to the
+client that sent it. The supervisor is a single threaded control loop too.
+A container is sent at most max_outstanding request messages at a time. The others wait in the
+supervisor queue rather than in a container, so that a container started under load takes its
+share of the waiting requests. The number of containers follows the queue depth: from
+scale_up_depth waiting requests per container another container is started, up to
+max_containers (by default twice the processor count, see notes/supervisor.md), and a container
+idle for idle_millis while nothing waits is retired, down to min_containers. A container that
+exits is replaced. Its outstanding requests are lost, and time out on their clients.
+Containers are also pinged on a control plane socket by a HeartbeatMonitor. A container that
+stops answering is a zombie: it is handed to the on_zombie strategy, killed by default, and
+replaced like any container that exits. The load reported by the pongs also drives scaling:
+while requests wait and the containers are busy beyond scale_up_load, another is started even
+below scale_up_depth.
+"""
+import multiprocessing
+import os
+import shutil
+import socket as _socket
+import tempfile
+from collections import deque
+from itertools import count
+from operator import attrgetter
+
+import zmq
+
+from free_range.core.control_loop import ControlLoop
+from free_range.supervisor.container import LOAD, PING, PONG, run_container
+from free_range.supervisor.heartbeat import HeartbeatMonitor
+from free_range.transport.zmq import addressing
+
+DEFAULT_MAX_OUTSTANDING = 2
+DEFAULT_SCALE_UP_DEPTH = 2
+DEFAULT_SCALE_UP_LOAD = 0.9
+DEFAULT_MAX_QUEUED = 10000
+DEFAULT_CHECK_INTERVAL_MILLIS = 100
+DEFAULT_IDLE_MILLIS = 10000
+DEFAULT_STOP_TIMEOUT = 5.0
+
+_OUTSTANDING = attrgetter('outstanding')
+
+
+def kill_zombie(container):
+    """
+    The default zombie strategy: kills the container, which is then replaced.
+    """
+    container.process.kill()
+
+
+def default_max_containers():
+    """
+    :return: the default container limit, twice the processor count
+    """
+    return 2 * (os.cpu_count() or 1)
+
+
+class Container:
+    """
+    A container process, as seen by its supervisor.
+    """
+    __slots__ = ('index', 'process', 'endpoint', 'socket', 'outstanding', 'idle_since')
+
+    def __init__(self, index, process, endpoint, socket, now):
+        self.index = index
+        self.process = process
+        self.endpoint = endpoint
+        self.socket = socket
+        self.outstanding = 0
+        self.idle_since = now
+
+
+class Supervisor:
+    """
+    Containers of one component, and the load balancer in front of them.
+    Call start(), then run() or run_once() repeatedly, then close().
+    """
+
+    def __init__(self, handler_factory, frontend, context=None, min_containers=1,
+                 max_containers=None, max_outstanding=DEFAULT_MAX_OUTSTANDING,
+                 scale_up_depth=DEFAULT_SCALE_UP_DEPTH, max_queued=DEFAULT_MAX_QUEUED,
+                 check_interval_millis=DEFAULT_CHECK_INTERVAL_MILLIS,
+                 idle_millis=DEFAULT_IDLE_MILLIS, loop=None, heartbeat=None,
+                 scale_up_load=DEFAULT_SCALE_UP_LOAD, on_zombie=kill_zombie):
+        """
+        :param handler_factory: a no-argument callable returning the request handler of a
+            container, called in each container. With the spawn start method, where fork is not
+            available, it must be picklable.
+        :param frontend: the endpoint or ServiceAddress clients connect to
+        :param context: a zmq.Context. Defaults to a context owned by the supervisor.
+        :param min_containers: the number of containers kept running, even when idle
+        :param max_containers: the container limit. Defaults to twice the processor count.
+        :param max_outstanding: the maximum number of request messages sent to a container and
+            not replied to yet. One keeps a single threaded container busy, two also hide the
+            latency of the hop from the supervisor.
+        :param scale_up_depth: the number of waiting requests per container from which another
+            container is started
+        :param max_queued: the maximum number of waiting request messages. Further requests are
+            dropped, and time out on their clients.
+        :param check_interval_millis: the interval of the exit, heartbeat and scaling checks
+        :param idle_millis: the time without outstanding requests after which a container in
+            excess of min_containers is retired
+        :param loop: the ControlLoop to run on. Defaults to a new one.
+        :param heartbeat: the HeartbeatMonitor of the containers, on the time source of the
+            loop. Defaults to a monitor with the default settings.
+        :param scale_up_load: the mean container load from which another container is started
+            while requests wait
+        :param on_zombie: a callable taking the Container found to be a zombie, after it was
+            taken out of the load balancing. It must make sure the process exits.
+        """
+        max_containers = max_containers or default_max_containers()
+        if not 1 <= min_containers <= max_containers:
+            raise ValueError(f'Invalid container limits: min {min_containers}, '
+                             f'max {max_containers}')
+        self._handler_factory = handler_factory
+        self._frontend_address = frontend
+        self._own_context = context is None
+        self._context = context or zmq.Context()
+        self._min = min_containers
+        self._max = max_containers
+        self._max_outstanding = max_outstanding
+        self._scale_up_depth = scale_up_depth
+        self._max_queued = max_queued
+        self._check_interval = check_interval_millis
+        self._loop = loop or ControlLoop()
+        self._time_source = self._loop.time_source
+        self._heartbeat = heartbeat if heartbeat is not None else HeartbeatMonitor(
+            self._time_source)
+        self._scale_up_load = scale_up_load
+        self._on_zombie = on_zombie
+        self._control = None
+        self._control_endpoint = None
+        self._by_identity = {}
+        self._idle = self._time_source.units.from_millis(idle_millis)
+        start_methods = multiprocessing.get_all_start_methods()
+        self._processes = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+        self._ipc_dir = None
+        self._frontend = None
+        self._check_timer = None
+        self._containers = []
+        self._by_socket = {}
+        self._retiring = []
+        self._queue = deque()  # of (request count, frames)
+        self._queued_requests = 0
+        self._indexes = count()
+        self._spawned = 0
+        self._retired = 0
+        self._exited = 0
+        self._zombies = 0
+        self._dispatched = 0
+        self._dropped = 0
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @property
+    def frontend(self):
+        return self._frontend
+
+    @property
+    def heartbeat(self):
+        return self._heartbeat
+
+    @property
+    def containers(self):
+        """
+        :return: a tuple of the running Container instances
+        """
+        return tuple(self._containers)
+
+    @property
+    def queue_depth(self):
+        """
+        :return: the number of requests waiting for a container
+        """
+        return self._queued_requests
+
+    @property
+    def outstanding(self):
+        """
+        :return: the number of request messages sent to containers and not replied to yet
+        """
+        return sum(container.outstanding for container in self._containers)
+
+    @property
+    def spawned(self):
+        return self._spawned
+
+    @property
+    def retired(self):
+        """
+        :return: the number of containers shut down for being idle
+        """
+        return self._retired
+
+    @property
+    def exited(self):
+        """
+        :return: the number of containers that exited without being asked to
+        """
+        return self._exited
+
+    @property
+    def zombies(self):
+        """
+        :return: the number of containers that stopped answering heartbeat pings
+        """
+        return self._zombies
+
+    @property
+    def load(self):
+        """
+        :return: the mean load reported by the containers, or None before the first pongs
+        """
+        loads = [health.load for health in map(self._heartbeat.health, self._by_identity)
+                 if health is not None and health.load is not None]
+        return sum(loads) / len(loads) if loads else None
+
+    @property
+    def dispatched(self):
+        """
+        :return: the number of requests sent to containers
+        """
+        return self._dispatched
+
+    @property
+    def dropped(self):
+        """
+        :return: the number of requests dropped because the queue was full
+        """
+        return self._dropped
+
+    def start(self):
+        """
+        Starts min_containers containers and binds the frontend.
+        """
+        self._control = self._context.socket(zmq.ROUTER)
+        self._control.setsockopt(zmq.LINGER, 0)
+        if addressing.ipc_supported():
+            self._ipc_dir = tempfile.mkdtemp(prefix='free-range-supervisor-')
+            self._control_endpoint = f'ipc://{os.path.join(self._ipc_dir, "control")}.ipc'
+            self._control.bind(self._control_endpoint)
+        else:
+            port = self._control.bind_to_random_port('tcp://127.0.0.1')
+            self._control_endpoint = f'tcp://127.0.0.1:{port}'
+        self._loop.register(self._control, self._on_control)
+        for _ in range(self._min):
+            self._spawn()
+        self._frontend = self._context.socket(zmq.ROUTER)
+        self._frontend.setsockopt(zmq.LINGER, 0)
+        addressing.bind(self._frontend, self._frontend_address)
+        self._loop.register(self._frontend, self._on_request)
+        self._check_timer = self._loop.call_later(self._check_interval, self._check)
+
+    def run(self):
+        """
+        Runs the control loop until stop() is called.
+        """
+        self._loop.run()
+
+    def run_once(self, max_wait_millis=0):
+        """
+        Runs one iteration of the control loop, see ControlLoop.run_once().
+        """
+        return self._loop.run_once(max_wait_millis)
+
+    def stop(self):
+        self._loop.stop()
+
+    def close(self, timeout=DEFAULT_STOP_TIMEOUT):
+        """
+        Stops every container and closes the sockets.
+        :param timeout: the time in seconds a container is given to exit before it is killed
+        """
+        if self._check_timer is not None:
+            self._check_timer.cancel()
+        for container in list(self._containers):
+            self._remove(container)
+            container.process.terminate()
+            self._retiring.append(container.process)
+        for process in self._retiring:
+            process.join(timeout)
+            if process.exitcode is None:
+                process.kill()
+                process.join()
+        self._retiring = []
+        if self._control is not None:
+            self._loop.unregister(self._control)
+            self._control.close()
+            self._control = None
+        if self._frontend is not None:
+            self._loop.unregister(self._frontend)
+            self._frontend.close()
+            self._frontend = None
+        if self._ipc_dir is not None:
+            shutil.rmtree(self._ipc_dir, ignore_errors=True)
+            self._ipc_dir = None
+        if self._own_context:
+            self._context.term()
+
+    def _container_endpoint(self, index):
+        if self._ipc_dir is not None:
+            return f'ipc://{os.path.join(self._ipc_dir, str(index))}.ipc'
+        with _socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            return f'tcp://127.0.0.1:{probe.getsockname()[1]}'
+
+    def _spawn(self):
+        index = next(self._indexes)
+        endpoint = self._container_endpoint(index)
+        process = self._processes.Process(target=run_container,
+                                          args=(endpoint, self._handler_factory,
+                                                self._control_endpoint, b'%d' % index),
+                                          name=f'free-range-container-{index}', daemon=True)
+        process.start()
+        socket = self._context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(endpoint)
+        container = Container(index, process, endpoint, socket, self._time_source.timestamp())
+        self._containers.append(container)
+        self._by_socket[socket] = container
+        self._by_identity[b'%d' % index] = container
+        self._heartbeat.add(b'%d' % index)
+        self._loop.register(socket, self._on_reply)
+        self._spawned += 1
+        self._dispatch_queued()
+        return container
+
+    def _remove(self, container):
+        """
+        Stops routing requests to a container and closes its socket.
+        """
+        self._containers.remove(container)
+        del self._by_socket[container.socket]
+        identity = b'%d' % container.index
+        del self._by_identity[identity]
+        self._heartbeat.remove(identity)
+        self._loop.unregister(container.socket)
+        container.socket.close()
+
+    def _on_request(self, frontend):
+        # [client identity, (request ID, body)...], forwarded behind an empty delimiter frame so
+        # that the RouterServer of the container routes the replies back through this identity
+        frames = frontend.recv_multipart(copy=False)
+        requests = (len(frames) - 1) // 2
+        if len(self._queue) >= self._max_queued:
+            self._dropped += requests
+            return
+        frames.insert(1, b'')
+        self._queue.append((requests, frames))
+        self._queued_requests += requests
+        self._dispatch_queued()
+
+    def _on_reply(self, socket):
+        # [client identity, empty delimiter, (request ID, state, body)...]
+        frames = socket.recv_multipart(copy=False)
+        container = self._by_socket[socket]
+        if container.outstanding > 0:
+            container.outstanding -= 1
+        if not container.outstanding:
+            container.idle_since = self._time_source.timestamp()
+        del frames[1]
+        self._frontend.send_multipart(frames, copy=False)
+        self._dispatch_queued()
+
+    def _on_control(self, control):
+        # [container identity, PONG, sequence, load]
+        frames = control.recv_multipart()
+        if len(frames) != 4:
+            return
+        identity, kind, sequence, load = frames
+        container = self._by_identity.get(identity)
+        if container is not None and kind == PONG:
+            self._heartbeat.pong(identity, int(sequence), LOAD.unpack(load)[0],
+                                 container.outstanding)
+
+    def _ping(self):
+        """
+        Sends the heartbeat pings that are due, and hands the zombies to the zombie strategy.
+        """
+        pings, zombies = self._heartbeat.tick(self._time_source.timestamp())
+        control = self._control
+        for identity, sequence in pings:
+            control.send_multipart([identity, PING, b'%d' % sequence])
+        for identity in zombies:
+            container = self._by_identity[identity]
+            self._remove(container)
+            self._zombies += 1
+            self._on_zombie(container)
+            self._retiring.append(container.process)
+
+    def _dispatch_queued(self):
+        """
+        Sends waiting requests to the least loaded containers, while they have room.
+        """
+        queue = self._queue
+        while queue and self._containers:
+            container = min(self._containers, key=_OUTSTANDING)
+            if container.outstanding >= self._max_outstanding:
+                return
+            requests, frames = queue.popleft()
+            self._queued_requests -= requests
+            container.outstanding += 1
+            container.idle_since = None
+            self._dispatched += requests
+            container.socket.send_multipart(frames, copy=False)
+
+    def _check(self):
+        """
+        Replaces the containers that exited, then scales on queue depth.
+        """
+        self._ping()
+        self._retiring = [process for process in self._retiring if process.exitcode is None]
+        for container in list(self._containers):
+            if container.process.exitcode is not None:
+                self._remove(container)
+                self._exited += 1
+        while len(self._containers) < self._min:
+            self._spawn()
+        containers = self._containers
+        if self._queued_requests:
+            load = self.load
+            if len(containers) < self._max and (
+                    self._queued_requests >= self._scale_up_depth * len(containers) or
+                    load is not None and load >= self._scale_up_load):
+                self._spawn()
+        elif len(containers) > self._min:
+            now = self._time_source.timestamp()
+            idle = [c for c in containers if c.idle_since is not None]
+            if idle:
+                oldest = min(idle, key=attrgetter('idle_since'))
+                if now - oldest.idle_since >= self._idle:
+                    self._retire(oldest)
+        self._check_timer = self._loop.call_later(self._check_interval, self._check)
+
+    def _retire(self, container):
+        self._remove(container)
+        container.process.terminate()
+        self._retiring.append(container.process)
+        self._retired += 1
@@ -0,0 +1,119 @@
+import unittest
+
+from free_range.core.client.tests.fakes import ManualTimeSource
+from free_range.supervisor.heartbeat import HeartbeatMonitor
+
+
+class HeartbeatMonitorMixIn(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualTimeSource(0)
+        self.monitor = HeartbeatMonitor(self.clock, min_interval_millis=100,
+                                        max_interval_millis=800, timeout_millis=50,
+                                        resolution_millis=1, startup_millis=50)
+
+    def advance(self, millis):
+        self.clock.now += millis
+        return self.monitor.tick()
+
+    def answer(self, pings, load=0.0, queue_depth=0):
+        for child, sequence in pings:
+            self.assertTrue(self.monitor.pong(child, sequence, load, queue_depth))
+
+
+class TestPings(HeartbeatMonitorMixIn):
+    def test_due_pings_come_in_one_batch(self):
+        for child in range(1000):
+            self.monitor.add(child)
+        self.assertEqual(self.advance(99), ([], []))
+        pings, zombies = self.advance(1)
+        self.assertEqual(sorted(pings), [(child, 1) for child in range(1000)])
+        self.assertEqual(zombies, [])
+        self.assertEqual((self.monitor.pings, self.monitor.batches), (1000, 1))
+
+    def test_idle_children_are_pinged_less_often(self):
+        self.monitor.add('a')
+        intervals = []
+        last = 0
+        while self.clock.now < 5000:
+            pings, _ = self.advance(1)
+            if pings:
+                intervals.append(self.clock.now - last)
+                last = self.clock.now
+                self.answer(pings)
+        self.assertEqual(intervals[:5], [100, 200, 400, 800, 800])
+
+    def test_busy_children_are_pinged_every_min_interval(self):
+        self.monitor.add('a')
+        pings, _ = self.advance(100)
+        self.answer(pings)
+        pings, _ = self.advance(200)
+        self.answer(pings, load=0.5)
+        self.assertEqual(self.advance(99)[0], [])
+        pings, _ = self.advance(1)
+        self.answer(pings, queue_depth=3)
+        self.assertEqual(self.monitor.health('a').interval, 100)
+        self.assertEqual(self.monitor.health('a').queue_depth, 3)
+
+    def test_pong_records_load_and_round_trip(self):
+        self.monitor.add('a')
+        pings, _ = self.advance(100)
+        self.clock.now += 7
+        self.answer(pings, load=0.25)
+        health = self.monitor.health('a')
+        self.assertEqual((health.round_trip, health.load, health.last_pong), (7, 0.25, 107))
+        self.assertEqual(self.monitor.pongs, 1)
+
+
+class TestZombies(HeartbeatMonitorMixIn):
+    def test_missing_pong_makes_a_zombie(self):
+        self.monitor.add('a')
+        self.monitor.add('b')
+        pings, _ = self.advance(100)
+        self.answer([ping for ping in pings if ping[0] == 'b'])
+        self.assertEqual(self.advance(49), ([], []))
+        self.assertEqual(self.advance(1), ([], ['a']))
+        self.assertNotIn('a', self.monitor)
+        self.assertIn('b', self.monitor)
+        self.assertEqual(self.monitor.zombies, 1)
+
+    def test_first_pong_gets_the_startup_time(self):
+        monitor = HeartbeatMonitor(self.clock, min_interval_millis=100, max_interval_millis=800,
+                                   timeout_millis=50, resolution_millis=1, startup_millis=1000)
+        monitor.add('a')
+        self.clock.now = 100
+        pings, _ = monitor.tick()
+        self.clock.now = 1099
+        self.assertEqual(monitor.tick(), ([], []))
+        for child, sequence in pings:
+            self.assertTrue(monitor.pong(child, sequence))
+        self.clock.now = 1299
+        pings, _ = monitor.tick()
+        self.clock.now = 1349
+        self.assertEqual(monitor.tick(), ([], ['a']))
+
+    def test_missing_first_pong_makes_a_zombie_after_the_startup_time(self):
+        monitor = HeartbeatMonitor(self.clock, min_interval_millis=100, timeout_millis=50,
+                                   resolution_millis=1, startup_millis=1000)
+        monitor.add('a')
+        self.clock.now = 100
+        monitor.tick()
+        self.clock.now = 1100
+        self.assertEqual(monitor.tick(), ([], ['a']))
+
+    def test_stale_and_unknown_pongs_are_ignored(self):
+        self.monitor.add('a')
+        pings, _ = self.advance(100)
+        self.assertFalse(self.monitor.pong('a', 0))
+        self.assertFalse(self.monitor.pong('x', 1))
+        self.answer(pings)
+        self.assertFalse(self.monitor.pong('a', 1))
+
+    def test_removed_child_is_not_pinged(self):
+        self.monitor.add('a')
+        self.assertIsNotNone(self.monitor.remove('a'))
+        self.assertEqual(self.advance(1000), ([], []))
+        self.assertIsNone(self.monitor.remove('a'))
+
+    def test_invalid_intervals(self):
+        with self.assertRaises(ValueError):
+            HeartbeatMonitor(self.clock, min_interval_millis=100, max_interval_millis=10)
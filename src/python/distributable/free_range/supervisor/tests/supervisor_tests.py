@@ -0,0 +1,138 @@
+import os
+import signal
+import time
+import unittest
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.types import ResponseState
+from free_range.core.control_loop import ControlLoop
+from free_range.supervisor.heartbeat import HeartbeatMonitor
+from free_range.supervisor.supervisor import Supervisor
+from free_range.transport.zmq.dealer import DealerTransport
+
+FRONTEND = 'inproc://supervisor-tests'
+
+
+def pid_after(delay):
+    time.sleep(delay)
+    return os.getpid()
+
+
+def handler_factory():
+    return pid_after
+
+
+class SupervisorMixIn(unittest.TestCase):
+    min_containers = 1
+    max_containers = 2
+    max_queued = 100
+
+    def setUp(self):
+        self.context = zmq.Context()
+        loop = ControlLoop()
+        heartbeat = HeartbeatMonitor(loop.time_source, min_interval_millis=20,
+                                     max_interval_millis=40, timeout_millis=500)
+        self.supervisor = Supervisor(handler_factory, FRONTEND, self.context, loop=loop,
+                                     heartbeat=heartbeat,
+                                     min_containers=self.min_containers,
+                                     max_containers=self.max_containers,
+                                     max_queued=self.max_queued,
+                                     check_interval_millis=10, idle_millis=200)
+        self.supervisor.start()
+        self.client = Client(DealerTransport(self.context, {'svc': FRONTEND}),
+                             default_timeout=TimeoutSpecification(10000))
+
+    def tearDown(self):
+        self.client.close()
+        self.supervisor.close()
+        self.context.term()
+
+    def run_until(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'timed out')
+            self.supervisor.run_once(1)
+            self.client.poll_responses()
+
+    def request_all(self, delays, timeout=None):
+        request_ids = [self.client.request_async('svc', delay, timeout) for delay in delays]
+        responses = {}
+
+        def done():
+            for request_id in request_ids:
+                if request_id not in responses:
+                    response = self.client.check_response(request_id, poll=False)
+                    if response.state != ResponseState.INCOMPLETE:
+                        responses[request_id] = response
+            return len(responses) == len(request_ids)
+
+        self.run_until(done)
+        return [responses[request_id].try_response() for request_id in request_ids]
+
+
+class TestLoadBalancing(SupervisorMixIn):
+    min_containers = 2
+
+    def test_requests_are_served_by_containers(self):
+        [(state, pid)] = self.request_all([0])
+        self.assertEqual(state, ResponseState.OK)
+        self.assertIn(pid, [c.process.pid for c in self.supervisor.containers])
+        self.assertEqual((self.supervisor.queue_depth, self.supervisor.outstanding), (0, 0))
+        self.assertEqual(self.supervisor.dispatched, 1)
+
+    def test_least_outstanding_container_is_chosen(self):
+        results = self.request_all([0.2, 0.2])
+        self.assertEqual({state for state, _ in results}, {ResponseState.OK})
+        self.assertEqual(len({pid for _, pid in results}), 2)
+
+    def test_exited_container_is_replaced(self):
+        self.supervisor.containers[0].process.kill()
+        self.run_until(lambda: self.supervisor.exited == 1 and
+                       len(self.supervisor.containers) == 2)
+        self.assertEqual(self.supervisor.spawned, 3)
+        self.assertEqual(self.request_all([0])[0][0], ResponseState.OK)
+
+    def test_containers_answer_pings(self):
+        self.run_until(lambda: self.supervisor.heartbeat.pongs >= 4)
+        self.assertEqual(self.supervisor.load, 0.0)
+        self.assertEqual(self.supervisor.zombies, 0)
+
+    def test_zombie_is_killed_and_replaced(self):
+        container = self.supervisor.containers[0]
+        health = self.supervisor.heartbeat.health(b'%d' % container.index)
+        # a container that never answered is still starting, and gets more time
+        self.run_until(lambda: health.last_pong is not None)
+        zombie = container.process
+        os.kill(zombie.pid, signal.SIGSTOP)
+        self.run_until(lambda: self.supervisor.zombies == 1 and
+                       len(self.supervisor.containers) == 2)
+        self.run_until(lambda: zombie.exitcode is not None)
+        self.assertEqual(zombie.exitcode, -signal.SIGKILL)
+        self.assertEqual(self.request_all([0])[0][0], ResponseState.OK)
+
+
+class TestQueueLimit(SupervisorMixIn):
+    max_queued = 0
+
+    def test_requests_beyond_the_queue_limit_are_dropped(self):
+        [(state, _)] = self.request_all([0], TimeoutSpecification(200))
+        self.assertEqual(state, ResponseState.TIMEOUT)
+        self.assertEqual((self.supervisor.dropped, self.supervisor.dispatched), (1, 0))
+
+
+class TestScaling(SupervisorMixIn):
+    def test_scales_up_on_queue_depth_then_retires_idle_containers(self):
+        self.assertEqual(len(self.supervisor.containers), 1)
+        results = self.request_all([0.3] * 6)
+        self.assertEqual({state for state, _ in results}, {ResponseState.OK})
+        self.assertEqual(self.supervisor.spawned, 2)
+        self.assertEqual(len({pid for _, pid in results}), 2)
+        self.run_until(lambda: len(self.supervisor.containers) == 1)
+        self.assertEqual(self.supervisor.retired, 1)
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            Supervisor(handler_factory, FRONTEND, min_containers=3, max_containers=2)
@@ -0,0 +1,68 @@
+"""
+The transport SPI: what the client side of the control plane needs from a transport.
+"""
+
+
+class Transport:
+    """
+    Base class of transports. A transport delivers request messages to destinations and hands
+    back the replies that arrived, but knows nothing about timeouts or response types.
+    Replies are reported as (request_id, state, payload) tuples, where state is one of
+    ResponseState.OK (the payload is the response), ResponseState.REMOTE_ERROR (the payload is the
+    error object) or ResponseState.FRAMEWORK_ERROR (the payload is an Exception).
+    """
+
+    def send_request(self, destination, request_id, message):
+        """
+        Sends a request. Must not block waiting for a reply.
+        :param destination: the name of the destination component
+        :param request_id: the request ID, an integer, to be returned with the reply
+        :param message: the request message
+        """
+        raise NotImplementedError()
+
+    def send_batch(self, destination, requests):
+        """
+        Sends several requests to the same destination, in one transfer if the transport can.
+        Each request is still replied to and reported independently, but a transport replying
+        to a batch in one transfer reports all the replies at once, so that their response times
+        are those of the whole batch.
+        :param destination: the name of the destination component
+        :param requests: a list of (request_id, message) tuples
+        """
+        for request_id, message in requests:
+            self.send_request(destination, request_id, message)
+
+    def cancel_request(self, request_id):
+        """
+        Called when the client gave up on a request (timeout or cancellation), so that the
+        transport can release what the request holds. A reply arriving later may still be
+        reported, and is discarded by the client.
+        :param request_id: the request ID
+        """
+        pass
+
+    def drain_replies(self):
+        """
+        Collects every reply that is ready, without blocking.
+        :return: a list of (request_id, state, payload) tuples
+        """
+        raise NotImplementedError()
+
+    def wait(self, timeout_millis):
+        """
+        Blocks until replies may be ready to drain, or until the timeout elapsed.
+        :param timeout_millis: the maximum time to block
+        """
+        raise NotImplementedError()
+
+    @property
+    def sockets(self):
+        """
+        :return: the ZMQ sockets that replies arrive on, for event loop integration. Transports
+            that are not based on ZMQ return an empty tuple.
+        """
+        return ()
+
+    def close(self):
+        pass
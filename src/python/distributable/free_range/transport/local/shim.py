@@ -0,0 +1,125 @@
+"""
+The in-process shim: request/response as plain function calls.
+Request messages are handed to component handlers as they are, with no encoding, and every
+delivery runs on a single deterministic run queue. Besides being the simplest transport to
+develop and debug against, it gives the lower bound of the framework overhead of a call.
+"""
+from collections import deque
+
+from free_range.core.common.types import ResponseState
+from free_range.transport.base import Transport
+
+
+class RunQueue:
+    """
+    A FIFO of calls, run one at a time on the calling thread. Given the same calls in the same
+    order, a run always happens the same way.
+    """
+
+    def __init__(self):
+        self._calls = deque()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def call_soon(self, function, *args):
+        """
+        Queues a call.
+        """
+        self._calls.append((function, args))
+
+    def run_one(self):
+        """
+        Runs the oldest queued call.
+        :return: True if a call was run, False if the queue was empty
+        """
+        if not self._calls:
+            return False
+        function, args = self._calls.popleft()
+        function(*args)
+        return True
+
+    def run(self, max_calls=None):
+        """
+        Runs queued calls, including the ones queued while running, until the queue is empty.
+        :param max_calls: the maximum number of calls to run. None for no limit.
+        :return: the number of calls run
+        """
+        calls = self._calls
+        ran = 0
+        while calls and (max_calls is None or ran < max_calls):
+            function, args = calls.popleft()
+            function(*args)
+            ran += 1
+        return ran
+
+
+class LocalNetwork:
+    """
+    The components reachable in-process, by destination name, and the run queue they share.
+    """
+
+    def __init__(self, run_queue=None):
+        """
+        :param run_queue: the RunQueue to deliver on. Defaults to a new one.
+        """
+        self._run_queue = run_queue or RunQueue()
+        self._handlers = {}
+
+    @property
+    def run_queue(self):
+        return self._run_queue
+
+    def register(self, destination, handler):
+        """
+        :param destination: the destination name of a component
+        :param handler: a callable taking a request message and returning a response message.
+            An exception it raises becomes the error object of a remote error.
+        """
+        self._handlers[destination] = handler
+
+    def unregister(self, destination):
+        self._handlers.pop(destination, None)
+
+    def handler(self, destination):
+        """
+        :return: the handler registered for the destination
+        :raises: KeyError if the destination is unknown
+        """
+        return self._handlers[destination]
+
+    def transport(self):
+        """
+        :return: a new LocalTransport on this network
+        """
+        return LocalTransport(self)
+
+
+class LocalTransport(Transport):
+    """
+    A Transport delivering requests to the handlers of a LocalNetwork through its run queue.
+    Deliveries run when replies are drained or waited for.
+    """
+
+    def __init__(self, network):
+        self._network = network
+        self._run_queue = network.run_queue
+        self._replies = []
+
+    def send_request(self, destination, request_id, message):
+        self._run_queue.call_soon(self._deliver, self._network.handler(destination), request_id,
+                                  message)
+
+    def drain_replies(self):
+        self._run_queue.run()
+        replies, self._replies = self._replies, []
+        return replies
+
+    def wait(self, timeout_millis):
+        self._run_queue.run()
+
+    def _deliver(self, handler, request_id, message):
+        try:
+            self._replies.append((request_id, ResponseState.OK, handler(message)))
+        except Exception as ex:
+            self._replies.append((request_id, ResponseState.REMOTE_ERROR, ex))
@@ -0,0 +1,66 @@
+import unittest
+
+from free_range.core.client.client import Client
+from free_range.core.common.types import ResponseState
+from free_range.transport.local.shim import LocalNetwork, RunQueue
+
+
+class TestRunQueue(unittest.TestCase):
+    def test_runs_in_order_including_calls_queued_while_running(self):
+        queue = RunQueue()
+        calls = []
+        queue.call_soon(calls.append, 1)
+        queue.call_soon(lambda: queue.call_soon(calls.append, 3))
+        queue.call_soon(calls.append, 2)
+        self.assertEqual(queue.run(), 4)
+        self.assertEqual(calls, [1, 2, 3])
+
+    def test_run_one(self):
+        queue = RunQueue()
+        queue.call_soon(lambda: None)
+        self.assertTrue(queue.run_one())
+        self.assertFalse(queue.run_one())
+
+    def test_max_calls(self):
+        queue = RunQueue()
+        for _ in range(3):
+            queue.call_soon(lambda: None)
+        self.assertEqual(queue.run(2), 2)
+        self.assertEqual(len(queue), 1)
+
+
+class LocalTransportMixIn(unittest.TestCase):
+    def setUp(self):
+        self.network = LocalNetwork()
+        self.received = []
+        self.network.register('svc', self.handle)
+        self.client = Client(self.network.transport())
+
+    def handle(self, message):
+        self.received.append(message)
+        if message == 'fail':
+            raise ValueError('failed on purpose')
+        return message
+
+
+class TestLocalTransport(LocalTransportMixIn):
+    def test_messages_are_passed_without_encoding(self):
+        message = object()
+        self.assertIs(self.client.request('svc', message).response, message)
+        self.assertIs(self.received[0], message)
+
+    def test_remote_error(self):
+        response = self.client.request('svc', 'fail')
+        self.assertIs(response.state, ResponseState.REMOTE_ERROR)
+        self.assertIsInstance(response.error, ValueError)
+
+    def test_delivery_is_deferred_to_the_run_queue(self):
+        request_ids = [self.client.request_async('svc', i) for i in range(3)]
+        self.assertEqual(self.received, [])
+        self.assertEqual(sorted(self.client.poll_responses()), request_ids)
+        self.assertEqual(self.received, [0, 1, 2])
+
+    def test_unknown_destination(self):
+        with self.assertRaises(KeyError):
+            self.client.request_async('nowhere', 'msg')
+        self.assertEqual(self.client.pending_count, 0)
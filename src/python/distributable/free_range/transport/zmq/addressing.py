@@ -0,0 +1,234 @@
+"""
+Locality-aware addressing: the cheapest ZMQ transport that reaches a peer.
+A server publishes a ServiceAddress rather than a single endpoint, and binds every transport it
+can offer: tcp always, ipc where the platform has Unix domain sockets, and inproc. A client
+compares the address with its own process and host, the machine boundary of
+notes/open_questions.md serving as the distance metric, and connects over inproc to a peer in
+the same process (and ZMQ context), over ipc to a peer on the same host, and over tcp otherwise.
+A transport that cannot be used falls back to the next one, so tcp is always the last resort.
+"""
+import os
+import socket as _socket
+import tempfile
+from enum import IntEnum
+
+import zmq
+
+# Unix domain socket paths are limited to the size of sockaddr_un.sun_path, 108 bytes on Linux
+# and 104 on the BSDs, including the terminating null byte
+_MAX_IPC_PATH = 103
+
+
+class Locality(IntEnum):
+    """
+    The distance to a peer, nearest first.
+    """
+    SAME_PROCESS = 0
+    SAME_HOST = 1
+    REMOTE = 2
+
+
+def ipc_supported():
+    """
+    :return: True if ZMQ can use ipc:// endpoints on this platform
+    """
+    return hasattr(_socket, 'AF_UNIX') and zmq.has('ipc')
+
+
+def host_id():
+    """
+    :return: the identity of this host, as published in ServiceAddress.host_id
+    """
+    return _socket.gethostname()
+
+
+def process_id(context):
+    """
+    :param context: a zmq.Context
+    :return: the identity of this process and ZMQ context, as published in
+        ServiceAddress.process_id. inproc endpoints are only reachable from the same context.
+    """
+    return f'{host_id()}:{os.getpid()}:{id(context):x}'
+
+
+class ServiceAddress:
+    """
+    The endpoints of a service on every transport, and where the service runs.
+    """
+    __slots__ = ('_name', '_host', '_port', '_host_id', '_process_id', '_ipc_path')
+
+    def __init__(self, name, host, port, host_id=None, process_id=None, ipc_path=None):
+        """
+        :param name: the service name, which names its inproc endpoint
+        :param host: the host name or IP address to connect to over tcp
+        :param port: the tcp port
+        :param host_id: the identity of the host the service runs on, see host_id(). None if
+            unknown, in which case the service is treated as remote.
+        :param process_id: the identity of the process and context the service runs in, see
+            process_id(). None if unknown.
+        :param ipc_path: the path of the ipc endpoint, or None if the service has none
+        """
+        self._name = name
+        self._host = host
+        self._port = port
+        self._host_id = host_id
+        self._process_id = process_id
+        self._ipc_path = ipc_path
+
+    @classmethod
+    def local(cls, context, name, port, host='127.0.0.1', ipc_dir=None):
+        """
+        The address of a service run by this process in a ZMQ context.
+        :param context: the zmq.Context the service sockets belong to
+        :param name: the service name
+        :param port: the tcp port
+        :param host: the host name or IP address remote peers connect to
+        :param ipc_dir: the directory of the ipc endpoint. Defaults to the temporary directory.
+        :return: a ServiceAddress, with an ipc path if the platform supports ipc and the path
+            is short enough for a Unix domain socket
+        """
+        ipc_path = None
+        if ipc_supported():
+            ipc_path = os.path.join(ipc_dir or tempfile.gettempdir(),
+                                    f'free-range-{name}-{port}.ipc')
+            if len(ipc_path.encode()) > _MAX_IPC_PATH:
+                ipc_path = None
+        return cls(name, host, port, host_id(), process_id(context), ipc_path)
+
+    def __repr__(self):
+        return (f'ServiceAddress({self._name!r}, {self._host!r}, {self._port}, '
+                f'{self._host_id!r}, {self._process_id!r}, {self._ipc_path!r})')
+
+    def __eq__(self, other):
+        return isinstance(other, ServiceAddress) and self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash((self._name, self._host, self._port))
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def host_id(self):
+        return self._host_id
+
+    @property
+    def process_id(self):
+        return self._process_id
+
+    @property
+    def ipc_path(self):
+        return self._ipc_path
+
+    @property
+    def tcp_endpoint(self):
+        return f'tcp://{self._host}:{self._port}'
+
+    @property
+    def ipc_endpoint(self):
+        return f'ipc://{self._ipc_path}' if self._ipc_path else None
+
+    @property
+    def inproc_endpoint(self):
+        return f'inproc://free-range-{self._name}-{self._port}'
+
+    def as_dict(self):
+        """
+        :return: a JSON serializable dict, e.g. for publishing through discovery
+        """
+        return {'name': self._name, 'host': self._host, 'port': self._port,
+                'host_id': self._host_id, 'process_id': self._process_id,
+                'ipc_path': self._ipc_path}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['name'], values['host'], values['port'], values.get('host_id'),
+                   values.get('process_id'), values.get('ipc_path'))
+
+
+def locality(address, context):
+    """
+    :param address: a ServiceAddress
+    :param context: the zmq.Context of the connecting socket
+    :return: the Locality of the service, seen from this process and context
+    """
+    if address.process_id is not None and address.process_id == process_id(context):
+        return Locality.SAME_PROCESS
+    if address.host_id is not None and address.host_id == host_id():
+        return Locality.SAME_HOST
+    return Locality.REMOTE
+
+
+def candidate_endpoints(address, context):
+    """
+    :param address: a ServiceAddress
+    :param context: the zmq.Context of the connecting socket
+    :return: the endpoints that may reach the service from this process, cheapest first. The
+        tcp endpoint is always last.
+    """
+    distance = locality(address, context)
+    endpoints = []
+    if distance == Locality.SAME_PROCESS:
+        endpoints.append(address.inproc_endpoint)
+    if distance <= Locality.SAME_HOST and address.ipc_path and ipc_supported() \
+            and os.path.exists(address.ipc_path):
+        endpoints.append(address.ipc_endpoint)
+    endpoints.append(address.tcp_endpoint)
+    return endpoints
+
+
+def connect(socket, address):
+    """
+    Connects a socket to a service over the cheapest transport that accepts the connection.
+    :param socket: a ZMQ socket
+    :param address: a ServiceAddress, or a plain endpoint string which is connected as is
+    :return: the endpoint connected to
+    :raises: zmq.ZMQError if no endpoint, not even tcp, accepts the connection
+    """
+    if isinstance(address, str):
+        socket.connect(address)
+        return address
+    endpoints = candidate_endpoints(address, socket.context)
+    for endpoint in endpoints[:-1]:
+        try:
+            socket.connect(endpoint)
+            return endpoint
+        except zmq.ZMQError:
+            pass
+    socket.connect(endpoints[-1])
+    return endpoints[-1]
+
+
+def bind(socket, address):
+    """
+    Binds a socket to every endpoint of a service that this platform supports.
+    The tcp endpoint is bound on the address host, which must then be an IP address or an
+    interface name. The ipc endpoint is optional: if it cannot be bound, peers on the same host
+    use tcp.
+    :param socket: a ZMQ socket
+    :param address: a ServiceAddress, or a plain endpoint string which is bound as is
+    :return: the list of endpoints bound
+    :raises: zmq.ZMQError if the tcp or inproc endpoint cannot be bound
+    """
+    if isinstance(address, str):
+        socket.bind(address)
+        return [address]
+    socket.bind(address.tcp_endpoint)
+    socket.bind(address.inproc_endpoint)
+    bound = [address.tcp_endpoint, address.inproc_endpoint]
+    if address.ipc_path and ipc_supported():
+        try:
+            socket.bind(address.ipc_endpoint)
+            bound.append(address.ipc_endpoint)
+        except zmq.ZMQError:
+            pass
+    return bound
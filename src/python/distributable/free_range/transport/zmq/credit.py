@@ -0,0 +1,159 @@
+"""
+Credit-based flow control for the DEALER/ROUTER transport.
+ZMQ queues messages up to the high-water mark and then blocks or drops, which a sender only
+notices once it is too late. With flow control, a receiver grants each sender a number of
+credits, its queue capacity for that sender, and a sender only sends a request while it holds a
+credit. The reply to a request gives its credit back. A request that finds no credit waits in a
+bounded local queue, and is rejected right away once that queue is full, so that back-pressure
+reaches the client as an immediate RejectedResponse instead of a silent drop or an unbounded
+buffer.
+Credits are requested and granted with the reserved request ID 0: the request has an empty body,
+and the reply carries the grant as its payload.
+A request the client gives up on (a timeout or a cancellation) also gives its credit back, as the
+receiver may have dropped it. A receiver may then briefly hold more requests than it granted,
+but a sender never runs out of credit for good because of lost requests.
+"""
+import struct
+from collections import OrderedDict
+
+from free_range.core.common.exceptions import RequestRejected
+
+CREDIT_REQUEST_ID = 0
+GRANT = struct.Struct('!I')
+UNLIMITED = GRANT.unpack(b'\xff' * GRANT.size)[0]
+DEFAULT_MAX_QUEUED = 1024
+
+
+class CreditWindow:
+    """
+    The send credit for one destination, the requests in flight against it and the requests
+    waiting for credit. Until the first grant arrives, every request waits.
+    """
+    __slots__ = ('_destination', '_credits', '_granted', '_in_flight', '_queued', '_max_queued',
+                 '_rejected')
+
+    def __init__(self, destination, max_queued=DEFAULT_MAX_QUEUED):
+        """
+        :param destination: the destination name, for error messages
+        :param max_queued: the maximum number of requests waiting for credit
+        """
+        self._destination = destination
+        self._credits = 0
+        self._granted = False
+        self._in_flight = set()
+        self._queued = OrderedDict()  # request ID -> encoded body, oldest first
+        self._max_queued = max_queued
+        self._rejected = 0
+
+    @property
+    def destination(self):
+        return self._destination
+
+    @property
+    def credits(self):
+        return self._credits
+
+    @property
+    def granted(self):
+        """
+        :return: True once the receiver granted credits
+        """
+        return self._granted
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    @property
+    def queued(self):
+        return len(self._queued)
+
+    @property
+    def rejected(self):
+        return self._rejected
+
+    def admit(self, request_id, body):
+        """
+        Takes a credit for a request, or queues the request if there is none.
+        :param request_id: the request ID
+        :param body: the encoded request
+        :return: True if the request may be sent now, False if it was queued
+        :raises: RequestRejected if there is no credit and the queue is full
+        """
+        if self._credits > 0 and not self._queued:
+            self._credits -= 1
+            self._in_flight.add(request_id)
+            return True
+        if len(self._queued) >= self._max_queued:
+            self._rejected += 1
+            raise RequestRejected(f'No flow control credit for {self._destination}, and '
+                                  f'{len(self._queued)} requests already waiting',
+                                  request_id=request_id)
+        self._queued[request_id] = body
+        return False
+
+    def admit_batch(self, bodies):
+        """
+        Takes credits for all the requests of a batch, or queues the batch if there are not
+        enough. A batch is sent whole or not at all.
+        :param bodies: a list of (request_id, encoded request) tuples
+        :return: True if the batch may be sent now, False if it was queued
+        :raises: RequestRejected if there are not enough credits and the queue has no room
+        """
+        if self._credits >= len(bodies) and not self._queued:
+            self._credits -= len(bodies)
+            self._in_flight.update(request_id for request_id, _ in bodies)
+            return True
+        if len(self._queued) + len(bodies) > self._max_queued:
+            self._rejected += len(bodies)
+            raise RequestRejected(f'No flow control credit for a batch of {len(bodies)} to '
+                                  f'{self._destination}, and {len(self._queued)} requests '
+                                  f'already waiting')
+        self._queued.update(bodies)
+        return False
+
+    def grant(self, credits):
+        """
+        Records a grant from the receiver, which replaces the credit still held.
+        :param credits: the number of requests the receiver accepts in flight from this sender,
+            or UNLIMITED
+        """
+        self._granted = True
+        # an unlimited grant is infinite credit, which taking and giving back leave unchanged
+        self._credits = credits - len(self._in_flight) if credits != UNLIMITED else float('inf')
+
+    def replied(self, request_id):
+        """
+        Gives back the credit of a request that got its reply. Late replies, for requests that
+        were given up on, do not give back anything.
+        """
+        if request_id in self._in_flight:
+            self._in_flight.discard(request_id)
+            self._credits += 1
+
+    def cancel(self, request_id):
+        """
+        Gives back the credit of a request that was given up on, or forgets it if it was still
+        waiting for credit.
+        :return: True if the request was known
+        """
+        if self._queued.pop(request_id, None) is not None:
+            return True
+        if request_id in self._in_flight:
+            self.replied(request_id)
+            return True
+        return False
+
+    def sendable(self):
+        """
+        Takes credits for the waiting requests, oldest first, as far as credits allow.
+        :return: a list of the (request_id, encoded request) tuples to send now
+        """
+        ready = []
+        queued = self._queued
+        while queued and self._credits > 0:
+            request_id, body = queued.popitem(last=False)
+            self._credits -= 1
+            self._in_flight.add(request_id)
+            ready.append((request_id, body))
+        return ready
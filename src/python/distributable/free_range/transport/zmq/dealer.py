@@ -0,0 +1,362 @@
+"""
+A DEALER/ROUTER request/response transport.
+A REQ socket must receive a reply before it can send again, which caps every connection at one
+outstanding request. Here the client side uses one DEALER socket per destination and tags every
+request with its request ID, so any number of requests can be pipelined over one connection and
+replies can come back in any order. The server side is a ROUTER socket that hands each request
+to a handler function and routes the reply back, so a component still sees plain request/reply.
+The request ID and state travel in their own small frames, separate from the application body.
+A multipart message may carry several requests to the same destination, as consecutive
+(request ID, body) frame pairs. The server dispatches them one after another and sends all the
+(request ID, state, body) reply triples back in one multipart message, so a batch of requests
+costs one transfer each way. The replies of a batch are then all received when its last request
+has been handled, and the client measures the round trip of the batch as the response time of
+each of them. The server latency recorder still times each request on its own.
+Bodies of at least zero_copy_threshold bytes are sent without copying them into a ZMQ message,
+and are received as a memoryview over the ZMQ message, so the decode function gets the body
+without an intermediate bytes object. Decode functions must then accept any bytes-like object.
+With flow control, the client side only sends requests while it holds credits granted by the
+server, see credit. The server always answers credit requests, with UNLIMITED credits if it was
+not given a capacity.
+"""
+import pickle
+import struct
+
+import zmq
+
+from free_range.core.common.time import MonotonicTimeSource
+from free_range.core.common.types import ResponseState
+from free_range.transport.base import Transport
+from free_range.transport.zmq import addressing
+from free_range.transport.zmq.credit import (
+    CREDIT_REQUEST_ID, DEFAULT_MAX_QUEUED, GRANT, UNLIMITED, CreditWindow,
+)
+
+_REQUEST_ID = struct.Struct('!Q')
+_STATE = struct.Struct('!B')
+_STATE_FRAMES = {state: _STATE.pack(state) for state in ResponseState}
+_CREDIT_REQUEST = _REQUEST_ID.pack(CREDIT_REQUEST_ID)
+
+DEFAULT_ZERO_COPY_THRESHOLD = 65536
+
+
+def _body(frame, zero_copy_threshold):
+    """
+    :param frame: a zmq.Frame received with copy=False
+    :return: a memoryview over a large frame, a bytes copy of a small one
+    """
+    return frame.buffer if len(frame) >= zero_copy_threshold else frame.bytes
+
+
+def send_request_frames(socket, request_id, body, flags=0):
+    """
+    Sends the (request ID, body) frames of one request.
+    :param socket: a DEALER socket, or a REQ socket
+    :param request_id: the integer request ID
+    :param body: the encoded request message
+    :param flags: zmq.SNDMORE if more requests follow in the same message
+    """
+    socket.send(_REQUEST_ID.pack(request_id), zmq.SNDMORE)
+    socket.send(body, flags, copy=False)  # copied anyway below the socket copy_threshold
+
+
+def receive_replies(socket, decode, zero_copy_threshold, replies):
+    """
+    Receives one reply message, of one or more (request ID, state, body) triples, without
+    blocking.
+    :param socket: a DEALER socket, or a REQ socket sending the same request frames
+    :param decode: deserializes reply payloads from bytes-like objects
+    :param zero_copy_threshold: the body size in bytes from which bodies are not copied
+    :param replies: the list the (request_id, state, payload) tuples are appended to
+    :return: False if no reply message was available
+    """
+    try:
+        request_id = socket.recv(zmq.NOBLOCK)
+    except zmq.Again:
+        return False
+    while True:
+        # the rest of a multipart message is always available with its first frame
+        state = _STATE.unpack(socket.recv())[0]
+        payload = _body(socket.recv(copy=False), zero_copy_threshold)
+        if request_id == _CREDIT_REQUEST:
+            payload = bytes(payload)  # a credit grant, for the transport itself
+        else:
+            try:
+                payload = decode(payload)
+            except Exception as ex:
+                state, payload = ResponseState.FRAMEWORK_ERROR, ex
+        replies.append((_REQUEST_ID.unpack(request_id)[0], state, payload))
+        if not socket.rcvmore:
+            return True
+        request_id = socket.recv()
+
+
+class DealerTransport(Transport):
+    """
+    The client side: a DEALER socket per destination.
+    With flow control, a request without credit waits in a queue of up to max_queued requests
+    per destination, and its response stays incomplete meanwhile. A request that finds the queue
+    full raises RequestRejected, which the client turns into a RejectedResponse.
+    """
+
+    def __init__(self, context, endpoints, encode=pickle.dumps, decode=pickle.loads,
+                 zero_copy_threshold=DEFAULT_ZERO_COPY_THRESHOLD, flow_control=False,
+                 max_queued=DEFAULT_MAX_QUEUED):
+        """
+        :param context: a zmq.Context
+        :param endpoints: a dict mapping destination names to ZMQ endpoints or ServiceAddress
+            instances. A ServiceAddress is connected over the nearest transport, see addressing.
+        :param encode: serializes request messages to bytes
+        :param decode: deserializes reply payloads from bytes-like objects
+        :param zero_copy_threshold: the body size in bytes from which bodies are not copied
+        :param flow_control: True to only send requests while holding credits from the server
+        :param max_queued: the maximum number of requests per destination waiting for credit
+        """
+        self._encode = encode
+        self._decode = decode
+        self._zero_copy_threshold = zero_copy_threshold
+        self._sockets = {}
+        self._windows = {} if flow_control else None
+        self._window_of = {}  # request ID -> CreditWindow, while in flight or waiting
+        self._poller = zmq.Poller()
+        for destination, endpoint in endpoints.items():
+            socket = context.socket(zmq.DEALER)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.copy_threshold = zero_copy_threshold
+            addressing.connect(socket, endpoint)
+            self._sockets[destination] = socket
+            self._poller.register(socket, zmq.POLLIN)
+            if flow_control:
+                self._windows[destination] = CreditWindow(destination, max_queued)
+                send_request_frames(socket, CREDIT_REQUEST_ID, b'')
+
+    @property
+    def sockets(self):
+        return tuple(self._sockets.values())
+
+    def credit_window(self, destination):
+        """
+        :return: the CreditWindow of a destination, or None without flow control
+        """
+        return self._windows[destination] if self._windows is not None else None
+
+    def send_request(self, destination, request_id, message):
+        socket = self._sockets[destination]
+        body = self._encode(message)
+        if self._windows is not None:
+            window = self._windows[destination]
+            admitted = window.admit(request_id, body)
+            self._window_of[request_id] = window
+            if not admitted:
+                return
+        send_request_frames(socket, request_id, body)
+
+    def send_batch(self, destination, requests):
+        if not requests:
+            return
+        socket = self._sockets[destination]
+        encode = self._encode
+        # encode everything first, so that a failure leaves no partial message behind
+        bodies = [(request_id, encode(message)) for request_id, message in requests]
+        if self._windows is not None:
+            window = self._windows[destination]
+            admitted = window.admit_batch(bodies)
+            for request_id, _ in bodies:
+                self._window_of[request_id] = window
+            if not admitted:
+                return
+        last = len(bodies) - 1
+        for i, (request_id, body) in enumerate(bodies):
+            send_request_frames(socket, request_id, body, 0 if i == last else zmq.SNDMORE)
+
+    def cancel_request(self, request_id):
+        window = self._window_of.pop(request_id, None)
+        if window is not None and window.cancel(request_id):
+            self._send_waiting(window)
+
+    def drain_replies(self):
+        replies = []
+        decode = self._decode
+        threshold = self._zero_copy_threshold
+        if self._windows is None:
+            for socket in self._sockets.values():
+                while receive_replies(socket, decode, threshold, replies):
+                    pass
+            return replies
+        for destination, socket in self._sockets.items():
+            start = len(replies)
+            while receive_replies(socket, decode, threshold, replies):
+                pass
+            if len(replies) > start:
+                self._return_credits(self._windows[destination], replies, start)
+        return replies
+
+    def _return_credits(self, window, replies, start):
+        """
+        Applies the credit grants and gives back the credits of the replies from one
+        destination, then sends the requests that were waiting for credit.
+        :param replies: the reply list, from which the grants are removed
+        :param start: the index of the first reply from the destination
+        """
+        window_of = self._window_of
+        kept = start
+        for index in range(start, len(replies)):
+            reply = replies[index]
+            request_id = reply[0]
+            if request_id == CREDIT_REQUEST_ID:
+                window.grant(GRANT.unpack(reply[2])[0])
+                continue
+            if window_of.pop(request_id, None) is not None:
+                window.replied(request_id)
+            replies[kept] = reply
+            kept += 1
+        del replies[kept:]
+        self._send_waiting(window)
+
+    def _send_waiting(self, window):
+        ready = window.sendable()
+        if ready:
+            socket = self._sockets[window.destination]
+            for request_id, body in ready:
+                send_request_frames(socket, request_id, body)
+
+    def wait(self, timeout_millis):
+        self._poller.poll(timeout_millis)
+
+    def close(self):
+        for socket in self._sockets.values():
+            socket.close()
+        self._sockets = {}
+
+
+class RouterServer:
+    """
+    The server side: a ROUTER socket dispatching requests to a handler, one at a time.
+    Both DEALER and REQ peers are served: the envelope of a REQ peer, which ends with an empty
+    delimiter frame, is recognized because a request ID frame is always 8 bytes long and the
+    envelope frames of a REQ peer never are.
+    The handler takes a request message and returns the response message. An exception raised by
+    the handler is sent back as the error object of a remote error. A request that cannot be
+    decoded is answered with a framework error.
+    With a LatencyRecorder, the time the handler takes is recorded by request message type, under
+    the endpoint of the server.
+    Credit requests of flow controlled clients are answered with the credits of the server, without
+    calling the handler.
+    """
+
+    def __init__(self, context, endpoint, handler, encode=pickle.dumps, decode=pickle.loads,
+                 zero_copy_threshold=DEFAULT_ZERO_COPY_THRESHOLD, latency=None, time_source=None,
+                 credits=None):
+        """
+        :param context: a zmq.Context
+        :param endpoint: the endpoint to bind, or a ServiceAddress to bind all its endpoints
+        :param handler: a callable taking a request message and returning a response message
+        :param encode: serializes reply payloads to bytes
+        :param decode: deserializes request messages from bytes-like objects
+        :param zero_copy_threshold: the body size in bytes from which bodies are not copied
+        :param latency: an optional LatencyRecorder for handler times, in the units of the time
+            source
+        :param time_source: the time source of handler times. Defaults to a MonotonicTimeSource,
+            in the units of the latency recorder if there is one.
+        :param credits: the number of requests each flow controlled client may have in flight, or
+            None for no limit
+        """
+        self._socket = context.socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.copy_threshold = zero_copy_threshold
+        addressing.bind(self._socket, endpoint)
+        self._handler = handler
+        self._encode = encode
+        self._decode = decode
+        self._zero_copy_threshold = zero_copy_threshold
+        self._endpoint = endpoint if isinstance(endpoint, str) else endpoint.name
+        self._latency = latency
+        if time_source is None:
+            time_source = (MonotonicTimeSource(latency.units) if latency is not None
+                           else MonotonicTimeSource())
+        elif latency is not None and latency.units != time_source.units:
+            raise ValueError(f'The latency recorder is in {latency.units.value}, but the time '
+                             f'source in {time_source.units.value}')
+        self._time_source = time_source
+        self._grant = GRANT.pack(UNLIMITED if credits is None else credits)
+
+    @property
+    def socket(self):
+        return self._socket
+
+    def process(self, timeout_millis=0, max_messages=None):
+        """
+        Handles the requests that are available.
+        :param timeout_millis: the maximum time to wait for a first request
+        :param max_messages: the maximum number of messages to handle, a batch of requests being
+            one message. None for no limit.
+        :return: the number of requests handled
+        """
+        handled = 0
+        socket = self._socket
+        if not socket.poll(timeout_millis):
+            return handled
+        threshold = self._zero_copy_threshold
+        messages = 0
+        while max_messages is None or messages < max_messages:
+            try:
+                envelope = [socket.recv(zmq.NOBLOCK)]
+            except zmq.Again:
+                break
+            request_id = socket.recv()
+            if len(request_id) != _REQUEST_ID.size:
+                # a REQ peer: an optional REQ_CORRELATE request ID, then the delimiter
+                while request_id:
+                    envelope.append(request_id)
+                    request_id = socket.recv()
+                envelope.append(request_id)
+                request_id = socket.recv()
+            replies = []
+            grants = 0
+            while True:
+                body = _body(socket.recv(copy=False), threshold)
+                if request_id == _CREDIT_REQUEST:
+                    replies.append((request_id, _STATE_FRAMES[ResponseState.OK], self._grant))
+                    grants += 1
+                else:
+                    state, payload = self._dispatch(body)
+                    replies.append((request_id, _STATE_FRAMES[state], payload))
+                if not socket.rcvmore:
+                    break
+                request_id = socket.recv()
+            for frame in envelope:
+                socket.send(frame, zmq.SNDMORE)
+            last = len(replies) - 1
+            for i, (request_id, state, payload) in enumerate(replies):
+                socket.send(request_id, zmq.SNDMORE)
+                socket.send(state, zmq.SNDMORE)
+                socket.send(payload, 0 if i == last else zmq.SNDMORE, copy=False)
+            handled += len(replies) - grants
+            messages += 1
+        return handled
+
+    def close(self):
+        self._socket.close()
+
+    def _dispatch(self, body):
+        """
+        :return: a (state, encoded payload) tuple for the reply
+        """
+        try:
+            message = self._decode(body)
+        except Exception as ex:
+            return ResponseState.FRAMEWORK_ERROR, self._encode(ex)
+        latency = self._latency
+        if latency is not None:
+            start = self._time_source.timestamp()
+        try:
+            response = self._handler(message)
+        except Exception as ex:
+            return ResponseState.REMOTE_ERROR, self._encode(ex)
+        if latency is not None:
+            latency.record(self._endpoint, latency.type_of(message),
+                           self._time_source.timestamp() - start)
+        try:
+            return ResponseState.OK, self._encode(response)
+        except Exception as ex:
+            return ResponseState.REMOTE_ERROR, self._encode(ex)
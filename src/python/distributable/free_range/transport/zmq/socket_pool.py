@@ -0,0 +1,269 @@
+"""
+Control plane socket management: pools of connected sockets, by endpoint.
+A REQ socket carries one request at a time, so the control plane needs a socket per request in
+flight to an endpoint (see find_REQ_socket() in the async call flow). Creating and connecting a
+socket per call is expensive, so sockets are pooled.
+REQ sockets are created with REQ_RELAXED and REQ_CORRELATE by default. Under the lazy pirate
+rules, a REQ socket whose reply never came can then send again and silently drops the stale reply
+if it arrives, so it goes back to the pool like any other. A strict REQ socket in that state can
+never send again: it is closed and replaced, on the next acquire, by a fresh socket.
+"""
+import pickle
+from collections import deque
+
+import zmq
+
+from free_range.core.common.exceptions import SocketPoolExhausted
+from free_range.core.common.time import MonotonicTimeSource
+from free_range.transport.base import Transport
+from free_range.transport.zmq.dealer import (
+    DEFAULT_ZERO_COPY_THRESHOLD, receive_replies, send_request_frames,
+)
+
+
+class SocketPool:
+    """
+    Connected sockets by endpoint. Sockets are created on demand, up to max_size per endpoint,
+    and the first use of an endpoint warms it up to min_size sockets. Released sockets are reused
+    most recently used first, and the ones idle for longer than idle_millis are closed by
+    evict_idle(), down to min_size.
+    """
+
+    def __init__(self, context, socket_type=zmq.REQ, min_size=0, max_size=16, idle_millis=60000,
+                 relaxed=True, time_source=None):
+        """
+        :param context: a zmq.Context
+        :param socket_type: the type of the pooled sockets
+        :param min_size: the number of sockets per endpoint kept open even when idle
+        :param max_size: the maximum number of sockets per endpoint
+        :param idle_millis: how long a socket may stay unused before evict_idle() closes it
+        :param relaxed: create REQ sockets with REQ_RELAXED and REQ_CORRELATE
+        :param time_source: the time source for idle times, in milliseconds. Defaults to a
+            MonotonicTimeSource.
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid socket pool sizes: min {min_size}, max {max_size}')
+        self._context = context
+        self._socket_type = socket_type
+        self._min_size = min_size
+        self._max_size = max_size
+        self._idle_millis = idle_millis
+        self._relaxed = relaxed and socket_type == zmq.REQ
+        self._time_source = time_source or MonotonicTimeSource()
+        self._idle = {}  # endpoint -> deque of (socket, released timestamp), oldest first
+        self._sizes = {}  # endpoint -> number of open sockets, idle or in use
+        self._hits = 0
+        self._misses = 0
+        self._created = 0
+        self._discarded = 0
+        self._evicted = 0
+
+    @property
+    def hits(self):
+        """
+        :return: the number of acquisitions served by an idle socket
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        :return: the number of acquisitions that had to create a socket
+        """
+        return self._misses
+
+    @property
+    def created(self):
+        return self._created
+
+    @property
+    def discarded(self):
+        """
+        :return: the number of sockets closed because they were in a bad state
+        """
+        return self._discarded
+
+    @property
+    def evicted(self):
+        """
+        :return: the number of sockets closed because they were idle
+        """
+        return self._evicted
+
+    def size(self, endpoint):
+        """
+        :return: the number of open sockets to an endpoint, idle or in use
+        """
+        return self._sizes.get(endpoint, 0)
+
+    def idle_count(self, endpoint):
+        idle = self._idle.get(endpoint)
+        return len(idle) if idle else 0
+
+    def warm(self, endpoint, count=None):
+        """
+        Opens idle sockets to an endpoint ahead of use.
+        :param endpoint: the endpoint
+        :param count: the number of sockets to have open. Defaults to min_size.
+        """
+        count = min(self._min_size if count is None else count, self._max_size)
+        idle = self._idle.setdefault(endpoint, deque())
+        now = self._time_source.timestamp()
+        while self._sizes.get(endpoint, 0) < count:
+            idle.append((self._create(endpoint), now))
+
+    def acquire(self, endpoint):
+        """
+        :param endpoint: the endpoint
+        :return: a socket connected to the endpoint, for the exclusive use of the caller until
+            released
+        :raises: SocketPoolExhausted if max_size sockets to the endpoint are in use
+        """
+        idle = self._idle.get(endpoint)
+        if idle:
+            self._hits += 1
+            return idle.pop()[0]
+        if idle is None:
+            self.warm(endpoint)
+            idle = self._idle[endpoint]
+            if idle:
+                self._misses += 1  # the first use of an endpoint is always a miss
+                return idle.pop()[0]
+        if self._sizes.get(endpoint, 0) >= self._max_size:
+            raise SocketPoolExhausted(f'All {self._max_size} sockets to {endpoint} are in use')
+        self._misses += 1
+        return self._create(endpoint)
+
+    def release(self, endpoint, socket, replied=True):
+        """
+        Returns a socket to the pool.
+        :param endpoint: the endpoint the socket was acquired for
+        :param socket: the socket
+        :param replied: False if the socket sent a request whose reply was not received. A
+            strict REQ socket is then in a state where it cannot send again, and is replaced.
+        """
+        if not replied and self._socket_type == zmq.REQ and not self._relaxed:
+            self.discard(endpoint, socket)
+            return
+        self._idle.setdefault(endpoint, deque()).append((socket, self._time_source.timestamp()))
+
+    def discard(self, endpoint, socket):
+        """
+        Closes an acquired socket instead of returning it to the pool.
+        """
+        socket.close(linger=0)
+        self._sizes[endpoint] -= 1
+        self._discarded += 1
+
+    def evict_idle(self, now=None):
+        """
+        Closes the sockets that stayed idle for longer than idle_millis, keeping at least
+        min_size sockets per endpoint. Only looks at sockets that are due, so it is cheap enough
+        to call on every control loop iteration.
+        :param now: the current timestamp. Defaults to reading the time source.
+        :return: the number of sockets closed
+        """
+        if now is None:
+            now = self._time_source.timestamp()
+        expired_before = now - self._idle_millis
+        evicted = 0
+        for endpoint, idle in self._idle.items():
+            while (idle and idle[0][1] < expired_before
+                   and self._sizes[endpoint] > self._min_size):
+                idle.popleft()[0].close(linger=0)
+                self._sizes[endpoint] -= 1
+                evicted += 1
+        self._evicted += evicted
+        return evicted
+
+    def close(self):
+        """
+        Closes the idle sockets. Sockets in use are closed by their users.
+        """
+        for endpoint, idle in self._idle.items():
+            for socket, _ in idle:
+                socket.close(linger=0)
+            self._sizes[endpoint] -= len(idle)
+        self._idle = {}
+
+    def _create(self, endpoint):
+        socket = self._context.socket(self._socket_type)
+        socket.setsockopt(zmq.LINGER, 0)
+        if self._relaxed:
+            socket.setsockopt(zmq.REQ_RELAXED, 1)
+            socket.setsockopt(zmq.REQ_CORRELATE, 1)
+        socket.connect(endpoint)
+        self._sizes[endpoint] = self._sizes.get(endpoint, 0) + 1
+        self._created += 1
+        return socket
+
+
+class ReqTransport(Transport):
+    """
+    A Transport over pooled REQ sockets, talking to a RouterServer with the same frames as the
+    DealerTransport. Every request in flight holds a socket of the pool until its reply arrives
+    or the client gives up on it, so the pool max_size bounds the requests in flight per
+    destination.
+    The sockets change from request to request, so none are exposed for event loop integration.
+    """
+
+    def __init__(self, pool, endpoints, encode=pickle.dumps, decode=pickle.loads,
+                 zero_copy_threshold=DEFAULT_ZERO_COPY_THRESHOLD):
+        """
+        :param pool: the SocketPool of REQ sockets to use
+        :param endpoints: a dict mapping destination names to ZMQ endpoints
+        :param encode: serializes request messages to bytes
+        :param decode: deserializes reply payloads from bytes-like objects
+        :param zero_copy_threshold: the body size in bytes from which bodies are not copied
+        """
+        self._pool = pool
+        self._endpoints = endpoints
+        self._encode = encode
+        self._decode = decode
+        self._zero_copy_threshold = zero_copy_threshold
+        self._in_flight = {}  # request ID -> (endpoint, socket)
+        self._poller = zmq.Poller()
+
+    @property
+    def pool(self):
+        return self._pool
+
+    def send_request(self, destination, request_id, message):
+        endpoint = self._endpoints[destination]
+        body = self._encode(message)
+        socket = self._pool.acquire(endpoint)
+        try:
+            send_request_frames(socket, request_id, body)
+        except zmq.ZMQError:
+            self._pool.discard(endpoint, socket)
+            raise
+        self._in_flight[request_id] = (endpoint, socket)
+        self._poller.register(socket, zmq.POLLIN)
+
+    def cancel_request(self, request_id):
+        in_flight = self._in_flight.pop(request_id, None)
+        if in_flight is not None:
+            self._poller.unregister(in_flight[1])
+            self._pool.release(*in_flight, replied=False)
+
+    def drain_replies(self):
+        replies = []
+        if self._in_flight:
+            for socket, _ in self._poller.poll(0):
+                if receive_replies(socket, self._decode, self._zero_copy_threshold, replies):
+                    endpoint, _ = self._in_flight.pop(replies[-1][0])
+                    self._poller.unregister(socket)
+                    self._pool.release(endpoint, socket)
+        self._pool.evict_idle()
+        return replies
+
+    def wait(self, timeout_millis):
+        if self._in_flight:
+            self._poller.poll(timeout_millis)
+
+    def close(self):
+        # the replies will never be read: the sockets are closed rather than pooled
+        for endpoint, socket in self._in_flight.values():
+            self._poller.unregister(socket)
+            self._pool.discard(endpoint, socket)
+        self._in_flight = {}
@@ -0,0 +1,119 @@
+import json
+import socket
+import threading
+import unittest
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.core.common.types import ResponseState
+from free_range.transport.zmq import addressing
+from free_range.transport.zmq.addressing import Locality, ServiceAddress
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, context, address):
+        super().__init__(daemon=True)
+        self.server = RouterServer(context, address, lambda message: message * 2)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.server.process(10)
+        self.server.close()
+
+
+class AddressingMixIn(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.other_context = zmq.Context()
+        self.address = ServiceAddress.local(self.context, 'addressing-tests', free_port())
+        self.server = ServerThread(self.context, self.address)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stopped.set()
+        self.server.join()
+        self.context.term()
+        self.other_context.term()
+
+    def round_trip(self, context, address):
+        transport = DealerTransport(context, {'svc': address})
+        client = Client(transport)
+        try:
+            self.assertEqual(client.request('svc', 21).try_response(), (ResponseState.OK, 42))
+        finally:
+            client.close()
+
+
+class TestLocality(AddressingMixIn):
+    def test_same_process_and_context(self):
+        self.assertEqual(addressing.locality(self.address, self.context), Locality.SAME_PROCESS)
+        self.assertEqual(addressing.candidate_endpoints(self.address, self.context)[0],
+                         self.address.inproc_endpoint)
+
+    @unittest.skipUnless(addressing.ipc_supported(), 'no ipc on this platform')
+    def test_other_context_is_same_host(self):
+        self.assertEqual(addressing.locality(self.address, self.other_context),
+                         Locality.SAME_HOST)
+        self.assertEqual(addressing.candidate_endpoints(self.address, self.other_context),
+                         [self.address.ipc_endpoint, self.address.tcp_endpoint])
+
+    def test_other_host_is_remote(self):
+        remote = ServiceAddress('svc', '127.0.0.1', self.address.port, 'elsewhere',
+                                'elsewhere:1:1', self.address.ipc_path)
+        self.assertEqual(addressing.locality(remote, self.context), Locality.REMOTE)
+        self.assertEqual(addressing.candidate_endpoints(remote, self.context),
+                         [remote.tcp_endpoint])
+
+    def test_unknown_location_is_remote(self):
+        unknown = ServiceAddress('svc', '127.0.0.1', self.address.port)
+        self.assertEqual(addressing.locality(unknown, self.context), Locality.REMOTE)
+
+    def test_dict_round_trip(self):
+        values = json.loads(json.dumps(self.address.as_dict()))
+        self.assertEqual(ServiceAddress.from_dict(values), self.address)
+
+    def test_long_ipc_path_is_dropped(self):
+        address = ServiceAddress.local(self.context, 'svc', 1, ipc_dir='/tmp/' + 'x' * 120)
+        self.assertIsNone(address.ipc_path)
+        self.assertIsNone(address.ipc_endpoint)
+
+
+class TestRoundTrips(AddressingMixIn):
+    def test_inproc(self):
+        self.round_trip(self.context, self.address)
+
+    def test_ipc(self):
+        self.round_trip(self.other_context, self.address)
+
+    def test_tcp(self):
+        remote = ServiceAddress('addressing-tests', '127.0.0.1', self.address.port, 'elsewhere')
+        self.round_trip(self.other_context, remote)
+
+    def test_plain_endpoint(self):
+        self.round_trip(self.other_context, self.address.tcp_endpoint)
+
+
+class TestFallback(unittest.TestCase):
+    def test_unbindable_ipc_falls_back_to_tcp(self):
+        context = zmq.Context()
+        address = ServiceAddress('svc', '127.0.0.1', free_port(), addressing.host_id(), None,
+                                 '/nonexistent-free-range-dir/svc.ipc')
+        server = context.socket(zmq.ROUTER)
+        client = context.socket(zmq.DEALER)
+        try:
+            bound = addressing.bind(server, address)
+            self.assertNotIn(address.ipc_endpoint, bound)
+            self.assertEqual(addressing.connect(client, address), address.tcp_endpoint)
+        finally:
+            client.close(linger=0)
+            server.close(linger=0)
+            context.term()
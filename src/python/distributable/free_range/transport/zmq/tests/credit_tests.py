@@ -0,0 +1,72 @@
+import unittest
+
+from free_range.core.common.exceptions import RequestRejected
+from free_range.transport.zmq.credit import UNLIMITED, CreditWindow
+
+
+class CreditWindowMixIn(unittest.TestCase):
+    def setUp(self):
+        self.window = CreditWindow('svc', max_queued=2)
+
+
+class TestAdmit(CreditWindowMixIn):
+    def test_requests_wait_for_the_first_grant(self):
+        self.assertFalse(self.window.granted)
+        self.assertFalse(self.window.admit(1, b'one'))
+        self.window.grant(5)
+        self.assertEqual(self.window.sendable(), [(1, b'one')])
+        self.assertTrue(self.window.admit(2, b'two'))
+        self.assertEqual((self.window.credits, self.window.in_flight), (3, 2))
+
+    def test_full_queue_rejects(self):
+        self.window.admit(1, b'one')
+        self.window.admit(2, b'two')
+        with self.assertRaises(RequestRejected) as raised:
+            self.window.admit(3, b'three')
+        self.assertEqual(raised.exception.request_id, 3)
+        self.assertEqual((self.window.queued, self.window.rejected), (2, 1))
+
+    def test_requests_do_not_overtake_waiting_ones(self):
+        self.window.admit(1, b'one')
+        self.window.grant(1)
+        self.assertFalse(self.window.admit(2, b'two'))
+        self.assertEqual(self.window.sendable(), [(1, b'one')])
+
+    def test_batch_is_admitted_whole(self):
+        self.window.grant(2)
+        self.assertTrue(self.window.admit_batch([(1, b'one'), (2, b'two')]))
+        self.assertEqual(self.window.in_flight, 2)
+        with self.assertRaises(RequestRejected):
+            self.window.admit_batch([(3, b'three'), (4, b'four'), (5, b'five')])
+        self.assertEqual(self.window.rejected, 3)
+
+
+class TestCredits(CreditWindowMixIn):
+    def test_reply_gives_the_credit_back(self):
+        self.window.grant(1)
+        self.window.admit(1, b'one')
+        self.window.admit(2, b'two')
+        self.window.replied(1)
+        self.assertEqual(self.window.sendable(), [(2, b'two')])
+        self.window.replied(1)  # a duplicate gives nothing back
+        self.assertEqual(self.window.credits, 0)
+
+    def test_cancel_gives_the_credit_back(self):
+        self.window.grant(1)
+        self.window.admit(1, b'one')
+        self.window.admit(2, b'two')
+        self.assertTrue(self.window.cancel(2))
+        self.assertTrue(self.window.cancel(1))
+        self.assertFalse(self.window.cancel(1))
+        self.assertEqual((self.window.credits, self.window.queued), (1, 0))
+
+    def test_grant_counts_requests_in_flight(self):
+        self.window.grant(2)
+        self.window.admit(1, b'one')
+        self.window.grant(2)
+        self.assertEqual(self.window.credits, 1)
+
+    def test_unlimited_grant(self):
+        self.window.grant(UNLIMITED)
+        for request_id in range(1, 100):
+            self.assertTrue(self.window.admit(request_id, b''))
@@ -0,0 +1,276 @@
+import asyncio
+import threading
+import unittest
+
+import zmq
+
+from free_range.core.client.async_client import AsyncClient
+from free_range.core.client.client import Client
+from free_range.core.common.histogram import LatencyRecorder
+from free_range.core.common.time import TimeoutSpecification, TimeUnit
+from free_range.core.common.types import ResponseState
+from free_range.core.messages.codecs import CodecRegistry, JsonCodec
+from free_range.transport.zmq.dealer import DealerTransport, RouterServer
+
+ENDPOINT = 'inproc://dealer-tests'
+
+
+def handler(message):
+    if message == 'fail':
+        raise ValueError('failed on purpose')
+    return message * 2
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, context):
+        super().__init__(daemon=True)
+        self.server = RouterServer(context, ENDPOINT, handler)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.server.process(10)
+        self.server.close()
+
+
+class DealerTransportMixIn(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.server = ServerThread(self.context)
+        self.server.start()
+        self.transport = DealerTransport(self.context, {'svc': ENDPOINT})
+        self.client = Client(self.transport)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stopped.set()
+        self.server.join()
+        self.context.term()
+
+
+class TestRequestReply(DealerTransportMixIn):
+    def test_request(self):
+        self.assertEqual(self.client.request('svc', 21).response, 42)
+
+    def test_remote_error(self):
+        response = self.client.request('svc', 'fail')
+        self.assertIs(response.state, ResponseState.REMOTE_ERROR)
+        self.assertIsInstance(response.error, ValueError)
+
+    def test_many_requests_in_flight_on_one_socket(self):
+        request_ids = [self.client.request_async('svc', i) for i in range(1000)]
+        self.assertEqual(len(self.transport.sockets), 1)
+        responses = [self.client.wait_for_response(i) for i in request_ids]
+        self.assertEqual([r.response for r in responses], [i * 2 for i in range(1000)])
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.server = RouterServer(self.context, ENDPOINT, handler)
+        self.client = Client(DealerTransport(self.context, {'svc': ENDPOINT}))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.context.term()
+
+    def test_batch_is_one_message_each_way(self):
+        request_ids = self.client.request_batch_async('svc', [1, 'fail', 3])
+        self.assertEqual(self.server.process(1000, max_messages=1), 3)
+        self.assertEqual(sorted(self.client.poll_responses(1000)), request_ids)
+        responses = [self.client.check_response(i, poll=False) for i in request_ids]
+        self.assertEqual([r.state for r in responses],
+                         [ResponseState.OK, ResponseState.REMOTE_ERROR, ResponseState.OK])
+        self.assertEqual(responses[2].response, 6)
+
+    def test_batches_and_single_requests_mix(self):
+        single = self.client.request_async('svc', 1)
+        batch = self.client.request_batch_async('svc', [2, 3])
+        self.assertEqual(self.server.process(1000), 3)
+        self.client.poll_responses(1000)
+        self.assertEqual([self.client.check_response(i, poll=False).response
+                          for i in [single] + batch], [2, 4, 6])
+
+
+class TestAsyncClient(DealerTransportMixIn):
+    def test_async_requests(self):
+        async def run():
+            return await AsyncClient(self.client).request_many('svc', range(100))
+        responses = asyncio.run(run())
+        self.assertEqual([r.response for r in responses], [i * 2 for i in range(100)])
+
+
+class TestZeroCopy(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.decoded = []
+        self.server = RouterServer(self.context, ENDPOINT, lambda message: message,
+                                   encode=bytes, decode=self.decode, zero_copy_threshold=1024)
+        self.client = Client(DealerTransport(self.context, {'svc': ENDPOINT}, encode=bytes,
+                                             decode=bytes, zero_copy_threshold=1024))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.context.term()
+
+    def decode(self, body):
+        self.decoded.append(type(body))
+        return body
+
+    def round_trip(self, body):
+        request_id = self.client.request_async('svc', body)
+        self.server.process(1000)
+        self.client.poll_responses(1000)
+        return self.client.check_response(request_id, poll=False).response
+
+    def test_small_body_is_copied(self):
+        self.assertEqual(self.round_trip(b'small'), b'small')
+        self.assertEqual(self.decoded, [bytes])
+
+    def test_large_body_is_decoded_from_the_message_buffer(self):
+        body = bytes(range(256)) * 64
+        self.assertEqual(self.round_trip(body), body)
+        self.assertEqual(self.decoded, [memoryview])
+
+
+class TestCodecRegistry(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.registry = CodecRegistry()
+        self.registry.register(1, JsonCodec(), dict)
+        self.handled = []
+        self.server = RouterServer(self.context, ENDPOINT, self.handle,
+                                   encode=self.registry.dumps, decode=self.registry.loads)
+        self.client = Client(DealerTransport(self.context, {'svc': ENDPOINT},
+                                             encode=self.registry.dumps,
+                                             decode=self.registry.loads))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.context.term()
+
+    def handle(self, message):
+        self.handled.append(message)
+        if message.get('fail'):
+            raise ValueError('failed on purpose')
+        return message
+
+    def round_trip(self, message):
+        request_id = self.client.request_async('svc', message)
+        self.server.process(1000)
+        self.client.poll_responses(1000)
+        return self.client.check_response(request_id, poll=False)
+
+    def test_reply_is_parsed_lazily(self):
+        response = self.round_trip({'name': 'John'})
+        self.assertEqual(response.response.type_id, 1)
+        self.assertFalse(response.response.is_decoded)
+        self.assertEqual(response.response.message, {'name': 'John'})
+
+    def test_remote_error_is_parsed(self):
+        response = self.round_trip({'fail': True})
+        self.assertIs(response.state, ResponseState.REMOTE_ERROR)
+        self.assertIsInstance(response.error, ValueError)
+
+
+class TestLatency(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        registry = CodecRegistry()
+        registry.register(1, JsonCodec(), dict)
+        self.server_latency = LatencyRecorder(TimeUnit.NANOS, registry)
+        self.server = RouterServer(self.context, ENDPOINT, lambda message: message.message,
+                                   encode=registry.dumps, decode=registry.loads,
+                                   latency=self.server_latency)
+        self.client_latency = LatencyRecorder(TimeUnit.NANOS, registry)
+        self.client = Client(DealerTransport(self.context, {'svc': ENDPOINT},
+                                             encode=registry.dumps, decode=registry.loads),
+                             latency=self.client_latency)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.context.term()
+
+    def test_response_times_are_recorded_on_both_sides(self):
+        for _ in range(3):
+            request_id = self.client.request_async('svc', {'name': 'John'})
+            self.server.process(1000)
+            self.client.poll_responses(1000)
+            self.client.check_response(request_id, poll=False)
+        self.assertEqual(self.client_latency.keys(), [('svc', 1)])
+        self.assertEqual(self.server_latency.keys(), [(ENDPOINT, 1)])
+        self.assertEqual(self.client_latency.histogram('svc', 1).count, 3)
+        self.assertEqual(self.server_latency.histogram(ENDPOINT, 1).count, 3)
+        self.assertGreaterEqual(self.client_latency.histogram('svc', 1).max,
+                                self.server_latency.histogram(ENDPOINT, 1).min)
+
+
+class TestFlowControl(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.server = RouterServer(self.context, ENDPOINT, handler, credits=2)
+        self.transport = DealerTransport(self.context, {'svc': ENDPOINT}, flow_control=True,
+                                         max_queued=1)
+        self.client = Client(self.transport)
+        self.window = self.transport.credit_window('svc')
+        # the credit request is answered without calling the handler
+        self.assertEqual(self.server.process(1000), 0)
+        self.assertEqual(self.client.poll_responses(1000), [])
+        self.assertEqual(self.window.credits, 2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.context.term()
+
+    def test_requests_beyond_the_credit_wait_then_get_rejected(self):
+        request_ids = [self.client.request_async('svc', i) for i in range(4)]
+        self.assertEqual((self.window.in_flight, self.window.queued), (2, 1))
+        self.assertIs(self.client.check_response(request_ids[3], poll=False).state,
+                      ResponseState.REJECTED)
+        self.assertEqual(self.server.process(1000), 2)
+        self.assertEqual(sorted(self.client.poll_responses(1000)), request_ids[:2])
+        # the replies gave their credits back, and the waiting request went out
+        self.assertEqual((self.window.in_flight, self.window.queued), (1, 0))
+        self.assertEqual(self.server.process(1000), 1)
+        self.assertEqual(self.client.wait_for_response(request_ids[2]).response, 4)
+        self.assertEqual(self.window.credits, 2)
+
+    def test_batch_is_admitted_whole(self):
+        single = self.client.request_async('svc', 1)
+        rejected = self.client.request_batch_async('svc', [2, 3])
+        self.assertEqual([self.client.check_response(i, poll=False).state for i in rejected],
+                         [ResponseState.REJECTED] * 2)
+        self.assertEqual(self.server.process(1000), 1)
+        self.assertEqual(self.client.wait_for_response(single).response, 2)
+        request_ids = self.client.request_batch_async('svc', [4, 5])
+        self.assertEqual(self.window.in_flight, 2)
+        self.assertEqual(self.server.process(1000), 2)
+        self.assertEqual([self.client.wait_for_response(i).response for i in request_ids],
+                         [8, 10])
+
+    def test_timed_out_requests_give_their_credit_back(self):
+        request_ids = [self.client.request_async('svc', i, TimeoutSpecification(20))
+                       for i in range(3)]
+        responses = [self.client.wait_for_response(i) for i in request_ids]
+        self.assertEqual([r.state for r in responses], [ResponseState.TIMEOUT] * 3)
+        self.assertEqual((self.window.credits, self.window.in_flight, self.window.queued),
+                         (2, 0, 0))
+
+    def test_server_without_capacity_grants_unlimited_credit(self):
+        server = RouterServer(self.context, 'inproc://dealer-tests-unlimited', handler)
+        transport = DealerTransport(self.context, {'svc': 'inproc://dealer-tests-unlimited'},
+                                    flow_control=True, max_queued=0)
+        server.process(1000)
+        client = Client(transport)
+        client.poll_responses(1000)
+        request_ids = [client.request_async('svc', i) for i in range(10)]
+        self.assertEqual(server.process(1000), 10)
+        self.assertEqual([client.wait_for_response(i).response for i in request_ids],
+                         [i * 2 for i in range(10)])
+        client.close()
+        server.close()
@@ -0,0 +1,139 @@
+import unittest
+
+import zmq
+
+from free_range.core.client.client import Client
+from free_range.core.client.tests.fakes import ManualTimeSource
+from free_range.core.common.exceptions import SocketPoolExhausted
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.types import ResponseState
+from free_range.transport.zmq.dealer import RouterServer
+from free_range.transport.zmq.socket_pool import ReqTransport, SocketPool
+
+ENDPOINT = 'inproc://socket-pool-tests'
+
+
+class SocketPoolMixIn(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.time_source = ManualTimeSource(0)
+        self.pool = SocketPool(self.context, min_size=1, max_size=3, idle_millis=100,
+                               time_source=self.time_source)
+
+    def tearDown(self):
+        self.pool.close()
+        self.context.term()
+
+
+class TestSocketPool(SocketPoolMixIn):
+    def test_first_use_warms_to_min_size(self):
+        self.pool.acquire(ENDPOINT).close()
+        self.assertEqual((self.pool.created, self.pool.misses, self.pool.hits), (1, 1, 0))
+
+    def test_released_socket_is_reused(self):
+        socket = self.pool.acquire(ENDPOINT)
+        self.pool.release(ENDPOINT, socket)
+        self.assertIs(self.pool.acquire(ENDPOINT), socket)
+        self.assertEqual((self.pool.created, self.pool.hits), (1, 1))
+        self.pool.release(ENDPOINT, socket)
+
+    def test_max_size(self):
+        sockets = [self.pool.acquire(ENDPOINT) for _ in range(3)]
+        with self.assertRaises(SocketPoolExhausted):
+            self.pool.acquire(ENDPOINT)
+        for socket in sockets:
+            self.pool.release(ENDPOINT, socket)
+        self.assertEqual(self.pool.idle_count(ENDPOINT), 3)
+
+    def test_idle_eviction_keeps_min_size(self):
+        sockets = [self.pool.acquire(ENDPOINT) for _ in range(3)]
+        for socket in sockets:
+            self.pool.release(ENDPOINT, socket)
+        self.time_source.now = 50
+        self.assertEqual(self.pool.evict_idle(), 0)
+        self.time_source.now = 101
+        self.assertEqual(self.pool.evict_idle(), 2)
+        self.assertEqual(self.pool.size(ENDPOINT), 1)
+        self.assertEqual(self.pool.evicted, 2)
+
+    def test_release_after_close(self):
+        socket = self.pool.acquire(ENDPOINT)
+        self.pool.close()
+        self.pool.release(ENDPOINT, socket)
+        self.assertEqual(self.pool.idle_count(ENDPOINT), 1)
+
+    def test_relaxed_socket_without_reply_is_reused(self):
+        socket = self.pool.acquire(ENDPOINT)
+        socket.send(b'lost')
+        self.pool.release(ENDPOINT, socket, replied=False)
+        self.assertIs(self.pool.acquire(ENDPOINT), socket)
+        socket.send(b'can send again')
+        self.pool.release(ENDPOINT, socket, replied=False)
+
+    def test_strict_socket_without_reply_is_replaced(self):
+        pool = SocketPool(self.context, relaxed=False)
+        socket = pool.acquire(ENDPOINT)
+        socket.send(b'lost')
+        with self.assertRaises(zmq.ZMQError):
+            socket.send(b'cannot send again')
+        pool.release(ENDPOINT, socket, replied=False)
+        self.assertEqual((pool.discarded, pool.size(ENDPOINT)), (1, 0))
+        replacement = pool.acquire(ENDPOINT)
+        self.assertIsNot(replacement, socket)
+        replacement.send(b'fresh socket')
+        pool.release(ENDPOINT, replacement, replied=False)
+        pool.close()
+
+
+class TestReqTransport(SocketPoolMixIn):
+    def setUp(self):
+        super().setUp()
+        self.server = RouterServer(self.context, ENDPOINT, lambda message: message * 2)
+        self.transport = ReqTransport(self.pool, {'svc': ENDPOINT})
+        self.client = Client(self.transport, self.time_source, TimeoutSpecification(10))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        super().tearDown()
+
+    def complete(self, request_ids):
+        self.server.process(1000)
+        self.client.poll_responses(1000)
+        return [self.client.check_response(i, poll=False) for i in request_ids]
+
+    def test_one_socket_per_request_in_flight(self):
+        request_ids = [self.client.request_async('svc', i) for i in range(3)]
+        self.assertEqual(self.pool.size(ENDPOINT), 3)
+        self.assertEqual([r.response for r in self.complete(request_ids)], [0, 2, 4])
+        self.assertEqual(self.pool.idle_count(ENDPOINT), 3)
+
+    def test_sockets_are_reused_across_requests(self):
+        for i in range(5):
+            self.assertEqual(self.complete([self.client.request_async('svc', i)])[0].response,
+                             i * 2)
+        self.assertEqual((self.pool.created, self.pool.hits), (1, 4))
+
+    def test_exhausted_pool_fails_the_request(self):
+        for i in range(3):
+            self.client.request_async('svc', i)
+        with self.assertRaises(SocketPoolExhausted):
+            self.client.request_async('svc', 3)
+        self.assertEqual(self.client.pending_count, 3)
+
+    def test_timed_out_request_releases_its_socket(self):
+        request_id = self.client.request_async('svc', 1)
+        self.time_source.now = 10
+        self.client.poll_responses()
+        self.assertIs(self.client.check_response(request_id, poll=False).state,
+                      ResponseState.TIMEOUT)
+        self.assertEqual(self.pool.idle_count(ENDPOINT), 1)
+        # the stale reply is dropped by the reused socket, which gets the new reply
+        self.assertEqual(self.complete([self.client.request_async('svc', 2)])[0].response, 4)
+
+    def test_close_discards_the_sockets_in_flight(self):
+        for i in range(2):
+            self.client.request_async('svc', i)
+        self.transport.close()
+        self.assertEqual((self.pool.discarded, self.pool.size(ENDPOINT)), (2, 0))
+        self.assertEqual(self.pool.idle_count(ENDPOINT), 0)
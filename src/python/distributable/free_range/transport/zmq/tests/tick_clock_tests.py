@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+
+import zmq
+
+from free_range.core.common.exceptions import ResponseTimeout
+from free_range.core.common.time import TimeoutSpecification
+from free_range.core.common.timeouts import TimeoutManager
+from free_range.transport.zmq.tick_clock import TickClockDriver, TickClockFollower
+
+PUBLISH = 'inproc://tick-clock-tests-publish'
+ACKS = 'inproc://tick-clock-tests-acks'
+
+
+class Participant(threading.Thread):
+    """A follower with its own timeouts, running its own loop like a component container"""
+
+    def __init__(self, context, node_id, skew=0):
+        super().__init__(daemon=True)
+        self.follower = TickClockFollower(context, PUBLISH, ACKS, node_id, skew)
+        self.timeouts = TimeoutManager(self.follower.time_source)
+        self.timed_out = []
+        self.follower.add_tick_listener(lambda tick: self.timed_out.extend(self.timeouts.expire()))
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.follower.process(10)
+        self.follower.close()
+
+
+class TickClockMixIn(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.driver = TickClockDriver(self.context, PUBLISH, ACKS)
+        self.participants = [Participant(self.context, 'node-a'),
+                             Participant(self.context, 'node-b', skew=-500)]
+        for participant in self.participants:
+            participant.timeouts.track(1, TimeoutSpecification(3000), start=0)
+            participant.start()
+        self.driver.join(len(self.participants))
+
+    def tearDown(self):
+        for participant in self.participants:
+            participant.stopped.set()
+            participant.join()
+        self.driver.close()
+        self.context.term()
+
+
+class TestJoin(TickClockMixIn):
+    def test_all_participants_joined(self):
+        self.assertEqual(self.driver.participants, {'node-a', 'node-b'})
+
+    def test_join_timeout(self):
+        with self.assertRaises(ResponseTimeout):
+            self.driver.join(3, timeout_millis=50)
+
+
+class TestAdvance(TickClockMixIn):
+    def test_participants_follow_the_clock(self):
+        self.driver.advance(5)
+        self.assertEqual([p.follower.time_source.tick for p in self.participants], [5, 5])
+
+    def test_skew(self):
+        self.driver.advance(1000)
+        self.assertEqual([p.follower.time_source.timestamp() for p in self.participants],
+                         [1000, 500])
+
+    def test_multi_second_timeouts_run_fast(self):
+        started = time.monotonic()
+        self.driver.step_to(3000, step=100)
+        self.assertEqual([len(p.timed_out) for p in self.participants], [1, 0])
+        self.driver.step_to(3500, step=100)
+        self.assertEqual([len(p.timed_out) for p in self.participants], [1, 1])
+        self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_cannot_go_backwards(self):
+        self.driver.advance(5)
+        with self.assertRaises(ValueError):
+            self.driver.publish(4)
@@ -0,0 +1,211 @@
+"""
+A network coordinated tick clock for distributed tests.
+A driver publishes ticks over a PUB socket and waits until every participant acknowledges each
+tick over a PUSH/PULL channel before moving on. Each participant keeps a TickTimeSource that its
+timeouts are driven by, so virtual time moves as fast as the participants can keep up, and
+multi-second timeout scenarios complete in milliseconds of wall time.
+"""
+import struct
+
+import zmq
+
+from free_range.core.common.exceptions import ResponseTimeout
+from free_range.core.common.time import MonotonicTimeSource, TickTimeSource
+
+SYNC = b'sync'
+TICK = b'tick'
+
+_TICK_FORMAT = struct.Struct('!q')
+
+
+class TickClockDriver:
+    """
+    The test side of the coordinated clock. Owns the current tick.
+    """
+
+    def __init__(self, context, publish_endpoint, ack_endpoint, tick=0):
+        """
+        :param context: a zmq.Context
+        :param publish_endpoint: the endpoint ticks are published on
+        :param ack_endpoint: the endpoint acknowledgements are received on
+        :param tick: the initial tick
+        """
+        self._publisher = context.socket(zmq.PUB)
+        self._publisher.bind(publish_endpoint)
+        self._acks = context.socket(zmq.PULL)
+        self._acks.bind(ack_endpoint)
+        self._tick = tick
+        self._participants = set()
+        self._wall_clock = MonotonicTimeSource()
+
+    @property
+    def tick(self):
+        return self._tick
+
+    @property
+    def participants(self):
+        """
+        :return: the set of node IDs that joined
+        """
+        return frozenset(self._participants)
+
+    def join(self, count, timeout_millis=5000, resend_millis=10):
+        """
+        Waits for participants to join. Subscriptions take a moment to propagate, so the current
+        tick is re-published until enough participants acknowledged it.
+        :param count: the number of participants to wait for
+        :param timeout_millis: the maximum wall time to wait
+        :param resend_millis: the interval between re-publications
+        :raises: ResponseTimeout if fewer participants joined in time
+        """
+        deadline = self._wall_clock.timestamp() + timeout_millis
+        while len(self._participants) < count:
+            if self._wall_clock.timestamp() >= deadline:
+                raise ResponseTimeout(f'Only {len(self._participants)} of {count} tick clock '
+                                      f'participants joined')
+            self._publisher.send_multipart([SYNC, _TICK_FORMAT.pack(self._tick)])
+            for node_id, kind, _ in self._receive_acks(resend_millis):
+                self._participants.add(node_id)
+
+    def advance(self, ticks=1, timeout_millis=5000):
+        """
+        Moves the coordinated clock forward and waits until every participant acknowledged.
+        Jumping many ticks at once is a single round trip.
+        :param ticks: the number of ticks to move forward
+        :param timeout_millis: the maximum wall time to wait for acknowledgements
+        :return: the new tick
+        :raises: ResponseTimeout if some participant did not acknowledge in time
+        """
+        self.publish(self._tick + ticks)
+        self.wait_for_acks(timeout_millis)
+        return self._tick
+
+    def step_to(self, tick, step=1, timeout_millis=5000):
+        """
+        Moves the coordinated clock forward one step at a time, waiting for every participant at
+        each step. Use this when participants must observe intermediate ticks.
+        :param tick: the tick to stop at
+        :param step: the number of ticks per step
+        :param timeout_millis: the maximum wall time to wait for each step
+        :return: the new tick
+        """
+        while self._tick < tick:
+            self.advance(min(step, tick - self._tick), timeout_millis)
+        return self._tick
+
+    def publish(self, tick):
+        """
+        Publishes a new tick without waiting. Follow with wait_for_acks().
+        :param tick: the new tick. Must not be before the current tick.
+        """
+        if tick < self._tick:
+            raise ValueError(f'Tick time cannot go backwards: {tick} < {self._tick}')
+        self._tick = tick
+        self._publisher.send_multipart([TICK, _TICK_FORMAT.pack(tick)])
+
+    def wait_for_acks(self, timeout_millis=5000):
+        """
+        Waits until every participant acknowledged the current tick.
+        :param timeout_millis: the maximum wall time to wait
+        :raises: ResponseTimeout if some participant did not acknowledge in time
+        """
+        waiting = set(self._participants)
+        deadline = self._wall_clock.timestamp() + timeout_millis
+        while waiting:
+            remaining = deadline - self._wall_clock.timestamp()
+            if remaining <= 0:
+                raise ResponseTimeout(f'Tick {self._tick} not acknowledged by {sorted(waiting)}')
+            for node_id, kind, tick in self._receive_acks(remaining):
+                if kind == TICK and tick == self._tick:
+                    waiting.discard(node_id)
+
+    def close(self):
+        self._publisher.close(linger=0)
+        self._acks.close(linger=0)
+
+    def _receive_acks(self, timeout_millis):
+        """
+        Waits up to timeout_millis for acknowledgements, then drains all that are available.
+        :return: a list of (node_id, kind, tick) tuples
+        """
+        acks = []
+        if self._acks.poll(timeout_millis):
+            while True:
+                try:
+                    node_id, kind, tick = self._acks.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                acks.append((node_id.decode('UTF-8'), kind, _TICK_FORMAT.unpack(tick)[0]))
+        return acks
+
+
+class TickClockFollower:
+    """
+    A participant in the coordinated clock. Its time_source follows the published ticks.
+    process() must be called regularly, typically once per control loop iteration. Tick listeners
+    run before a tick is acknowledged, so the driver only moves on once every participant handled
+    the consequences of a tick, such as expiring timeouts.
+    """
+
+    def __init__(self, context, subscribe_endpoint, ack_endpoint, node_id, skew=0):
+        """
+        :param context: a zmq.Context
+        :param subscribe_endpoint: the endpoint the driver publishes ticks on
+        :param ack_endpoint: the endpoint the driver receives acknowledgements on
+        :param node_id: a name for this participant, unique among participants
+        :param skew: a simulated clock skew for this participant, in ticks
+        """
+        self._subscriber = context.socket(zmq.SUB)
+        self._subscriber.setsockopt(zmq.SUBSCRIBE, b'')
+        self._subscriber.connect(subscribe_endpoint)
+        self._acks = context.socket(zmq.PUSH)
+        self._acks.connect(ack_endpoint)
+        self._node_id = node_id.encode('UTF-8')
+        self._time_source = TickTimeSource(skew=skew)
+        self._listeners = []
+
+    @property
+    def time_source(self):
+        """
+        :return: the TickTimeSource following the coordinated clock
+        """
+        return self._time_source
+
+    @property
+    def socket(self):
+        """
+        :return: the subscriber socket, for registration with a poller
+        """
+        return self._subscriber
+
+    def add_tick_listener(self, listener):
+        """
+        :param listener: a callable taking the new tick, called before each tick is acknowledged
+        """
+        self._listeners.append(listener)
+
+    def process(self, timeout_millis=0):
+        """
+        Handles all the clock messages that are available.
+        :param timeout_millis: the maximum wall time to wait for a first message
+        :return: the number of clock messages handled
+        """
+        handled = 0
+        if not self._subscriber.poll(timeout_millis):
+            return handled
+        while True:
+            try:
+                kind, payload = self._subscriber.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return handled
+            tick = _TICK_FORMAT.unpack(payload)[0]
+            if tick > self._time_source.tick:
+                self._time_source.set_tick(tick)
+                for listener in self._listeners:
+                    listener(tick)
+            self._acks.send_multipart([self._node_id, kind, payload])
+            handled += 1
+
+    def close(self):
+        self._subscriber.close(linger=0)
+        self._acks.close(linger=0)